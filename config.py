@@ -21,6 +21,33 @@ if not ADMIN_PASSWORD:
 SECRET_KEY = "super_secret_algo_key_v3"
 PORT = int(os.environ.get("PORT", 5000))
 
+# Telegram Bot API (override to point at mock_telegram.py for local tests)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+
+# Broker Order Updates via KiteTicker (postbacks + reconciliation work without it)
+ORDER_UPDATE_STREAM = os.getenv("ORDER_UPDATE_STREAM", "1") == "1"
+
+# Daily instrument list refresh (IST, before market open: new expiries / strikes)
+INSTRUMENT_REFRESH_TIME = os.getenv("INSTRUMENT_REFRESH_TIME", "08:30")
+
+# History Archival: closed trades older than HISTORY_HOT_DAYS move to monthly compressed files
+# (0 disables). Runs daily at HISTORY_ARCHIVE_TIME (IST).
+HISTORY_HOT_DAYS = int(os.getenv("HISTORY_HOT_DAYS", 90))
+HISTORY_ARCHIVE_DIR = os.getenv("HISTORY_ARCHIVE_DIR", os.path.join(basedir, "archive"))
+HISTORY_ARCHIVE_TIME = os.getenv("HISTORY_ARCHIVE_TIME", "03:00")
+
+# Multi-worker runtime files (leader / trade lock files, journal head, instrument cache).
+# Must be local to the host and shared by all gunicorn workers.
+RUN_DIR = os.getenv("RUN_DIR", os.path.join(basedir, "run"))
+
+# Risk engine placement. "embedded": the leader web worker runs it. "external": run_engine.py runs it
+# in its own process; web workers never campaign and talk to it over ENGINE_SOCKET.
+ENGINE_MODE = os.getenv("ENGINE_MODE", "embedded").lower()
+ENGINE_SOCKET = os.getenv("ENGINE_SOCKET", os.path.join(RUN_DIR, "engine.sock"))
+
+# Index / watchlist quotes are polled once per interval by the leader and served from a snapshot
+INDEX_REFRESH_SECONDS = float(os.getenv("INDEX_REFRESH_SECONDS", 1.0))
+
 # Trade Defaults
 DEFAULT_SL_POINTS = 20
 
@@ -36,4 +63,28 @@ connect_args = {}
 if "postgresql" in uri:
     connect_args = {'options': '-c timezone=Asia/Kolkata'}
 
+# --- Storage Profile ---
+# SQLite: WAL lets the API threads read while the risk loop / Telegram worker write; NORMAL sync is
+# durable across app crashes (only an OS crash can lose the last commits). Applied on every
+# new connection (see database.py). Set SQLITE_TUNING=0 for the stock rollback journal.
+SQLITE_PROFILE = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_MB", 256)) * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+SQLITE_PRAGMAS = SQLITE_PROFILE if os.getenv("SQLITE_TUNING", "1") == "1" else {}
+
 SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': connect_args}
+
+# Postgres: one pool per process, sized for the gunicorn threads + background workers.
+# pre_ping drops connections the server closed (idle timeouts); recycle stays below them.
+if "postgresql" in uri:
+    SQLALCHEMY_ENGINE_OPTIONS.update({
+        'pool_size': int(os.getenv("DB_POOL_SIZE", 10)),
+        'max_overflow': int(os.getenv("DB_MAX_OVERFLOW", 5)),
+        'pool_timeout': int(os.getenv("DB_POOL_TIMEOUT", 10)),
+        'pool_recycle': int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        'pool_pre_ping': True,
+    })
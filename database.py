@@ -1,7 +1,23 @@
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+import config
 
 db = SQLAlchemy()
 
+@event.listens_for(Engine, "connect")
+def _apply_sqlite_profile(dbapi_connection, connection_record):
+    # Per-connection SQLite tuning (config.SQLITE_PRAGMAS); other backends are left alone
+    if not isinstance(dbapi_connection, sqlite3.Connection) or not config.SQLITE_PRAGMAS:
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in config.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
 class AppSetting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     data = db.Column(db.Text, nullable=False) 
@@ -12,8 +28,26 @@ class ActiveTrade(db.Model):
     symbol = db.Column(db.String(50), index=True)
     mode = db.Column(db.String(20))
     status = db.Column(db.String(20))
+    # Hot fields (mirrors of the document, written with every snapshot)
+    sl = db.Column(db.Float)
+    quantity = db.Column(db.Integer)
     data = db.Column(db.Text, nullable=False)
 
+class TradeEvent(db.Model):
+    # Append-only journal of active trade mutations (replayed on top of the ActiveTrade snapshot)
+    id = db.Column(db.Integer, primary_key=True)
+    trade_id = db.Column(db.BigInteger, index=True, nullable=False)
+    event = db.Column(db.String(20), nullable=False) # created / activated / sl_moved / target_hit / qty_changed / promoted / updated / closed
+    data = db.Column(db.Text) # {"set": {...}, "unset": [...]} (full record for 'created')
+    created_at = db.Column(db.String(30))
+
+class TradeSnapshot(db.Model):
+    # Checkpoint: the ActiveTrade rows include every TradeEvent up to last_event_id
+    id = db.Column(db.String(10), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    trades = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.String(30))
+
 class TradeHistory(db.Model):
     id = db.Column(db.BigInteger, primary_key=True)
     # [FIX] Added Columns for Reporting efficiency
@@ -21,6 +55,13 @@ class TradeHistory(db.Model):
     mode = db.Column(db.String(20))
     pnl = db.Column(db.Float)
     exit_time = db.Column(db.String(30), index=True) # YYYY-MM-DD HH:MM:SS
+    # Hot fields: the missed-opportunity tracker updates these columns only (no document rewrite).
+    # They take precedence over the same keys in 'data' (see persistence.history_record)
+    entry_price = db.Column(db.Float)
+    sl = db.Column(db.Float)
+    current_ltp = db.Column(db.Float)
+    made_high = db.Column(db.Float)
+    virtual_sl_hit = db.Column(db.Boolean)
     data = db.Column(db.Text, nullable=False)
 
 class RiskState(db.Model):
@@ -32,3 +73,81 @@ class TelegramMessage(db.Model):
     trade_id = db.Column(db.String(50), nullable=False, index=True)
     message_id = db.Column(db.Integer, nullable=False)
     chat_id = db.Column(db.String(50), nullable=False)
+
+class TelegramOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Dedupe: the same alert is never queued twice
+    idempotency_key = db.Column(db.String(64), unique=True, nullable=False)
+    trade_id = db.Column(db.String(50), index=True)
+    channel_key = db.Column(db.String(20))
+    chat_id = db.Column(db.String(50), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    reply_to = db.Column(db.Integer)
+    resolve_reply = db.Column(db.Boolean, default=False)
+    status = db.Column(db.String(10), default='PENDING', index=True) # PENDING / SENDING (claimed by the leader) / SENT / FAILED
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.Float, default=0) # epoch seconds
+    message_id = db.Column(db.Integer)
+    last_error = db.Column(db.String(200))
+    created_at = db.Column(db.Float)
+
+class TradeCounter(db.Model):
+    # Trades started per IST entry day and mode (1st-trade check without scanning history)
+    day = db.Column(db.String(10), primary_key=True) # YYYY-MM-DD
+    mode = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class SharedState(db.Model):
+    # Cross-worker state (session flags, leader commands) for multi-worker gunicorn
+    key = db.Column(db.String(50), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.Float)
+
+class BrokerSession(db.Model):
+    # Today's Kite access token, reused on restart instead of a Selenium login
+    id = db.Column(db.String(10), primary_key=True)
+    access_token = db.Column(db.String(100), nullable=False)
+    user_id = db.Column(db.String(20))
+    token_day = db.Column(db.String(10), nullable=False) # YYYY-MM-DD (IST, rolls at 06:00)
+    created_at = db.Column(db.String(30))
+
+# --- Schema Migration ---
+# JSON keys mirrored into real columns. db.create_all() never alters existing tables, so columns
+# added to these models later are created here and backfilled from the document.
+HOT_FIELDS = {
+    'active_trade': ['sl', 'quantity'],
+    'trade_history': ['entry_price', 'sl', 'current_ltp', 'made_high', 'virtual_sl_hit'],
+}
+
+def _json_field_sql(dialect, key, col_type):
+    if dialect == 'postgresql':
+        value = f"(CAST(data AS jsonb) ->> '{key}')"
+        if col_type.startswith('INTEGER'): value = f"CAST({value} AS NUMERIC)"
+        return f"CAST({value} AS {col_type})"
+    # SQLite JSON1 (true / false come back as 1 / 0)
+    return f"json_extract(data, '$.{key}')"
+
+def migrate_schema():
+    """Adds missing model columns to existing tables and backfills hot fields. Call after create_all()."""
+    engine = db.engine
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        missing = [c for c in table.columns if c.name not in existing]
+        added = []
+        for col in missing:
+            col_type = col.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}'))
+                    if col.name in HOT_FIELDS.get(table.name, []):
+                        conn.execute(text(f"UPDATE {table.name} SET {col.name} = {_json_field_sql(engine.dialect.name, col.name, col_type)}"))
+                added.append(col.name)
+            except Exception:
+                # Another process added it first (its ALTER + backfill committed together)
+                if col.name not in {c['name'] for c in inspect(engine).get_columns(table.name)}:
+                    raise
+        if added:
+            print(f"🗄️ Schema: added {', '.join(added)} to {table.name}")
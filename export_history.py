@@ -0,0 +1,48 @@
+# export_history.py
+"""
+Exports closed trades (hot table + archive) to CSV or Parquet without starting the trading app.
+Usage: python export_history.py out.csv [--start 2025-01-01] [--end 2025-03-31] [--mode LIVE] [--symbol NIFTY]
+       python export_history.py out.parquet ...   (needs pyarrow)
+       python export_history.py - --format csv    (stdout)
+"""
+import sys
+import argparse
+import contextlib
+from flask import Flask
+with contextlib.redirect_stdout(sys.stderr):   # config warnings must not end up in a CSV on stdout
+    import config
+from database import db
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export RD Algo trade history")
+    parser.add_argument("output", help="Output file ('-' for stdout)")
+    parser.add_argument("--format", choices=["csv", "parquet"], help="Defaults to the output file's extension")
+    parser.add_argument("--start", help="First exit date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Last exit date (YYYY-MM-DD)")
+    parser.add_argument("--mode", help="LIVE / PAPER")
+    parser.add_argument("--symbol", help="Symbol prefix (e.g. NIFTY)")
+    args = parser.parse_args()
+
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    if fmt == "parquet" and args.output == "-":
+        parser.error("Parquet cannot be written to stdout")
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+
+    from managers import history_export
+    if not history_export.available(fmt):
+        sys.exit("❌ Parquet export needs pyarrow (pip install pyarrow)")
+    stream, _ = history_export.FORMATS[fmt]
+
+    with app.app_context():
+        chunks = stream(start=args.start, end=args.end, mode=args.mode, symbol=args.symbol)
+        if args.output == "-":
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+        else:
+            with open(args.output, "w" if fmt == "csv" else "wb", **({"newline": ""} if fmt == "csv" else {})) as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            print(f"✅ Exported {fmt.upper()} to {args.output}", file=sys.stderr)
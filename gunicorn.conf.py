@@ -0,0 +1,12 @@
+# gunicorn.conf.py
+"""
+Multi-worker web tier. One worker (the flock leader, see managers/shared_state.py) runs the
+background services; the others only serve requests and take over if the leader dies.
+"""
+import os
+import multiprocessing
+
+bind = os.getenv("BIND", "0.0.0.0:8080")
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count(), 4)))
+threads = int(os.getenv("WEB_THREADS", 4))
+timeout = 120
@@ -3,41 +3,207 @@ import json
 import threading
 import time
 import gc 
+import hashlib
+import queue
 import requests
-from flask import Flask, render_template, request, redirect, flash, jsonify, url_for
+from flask import Flask, render_template, request, redirect, flash, jsonify, url_for, Response, stream_with_context
 from kiteconnect import KiteConnect
 import config
 from datetime import datetime, timedelta
 import pytz
 
 # --- REFACTORED IMPORTS ---
-from managers import persistence, trade_manager, risk_engine, replay_engine, common, broker_ops
+from managers import persistence, trade_manager, risk_engine, replay_engine, common, broker_ops, history_export, analytics
 from managers.telegram_manager import bot as telegram_bot
+from managers.session_health import health as session_health, is_auth_error
+from managers.order_updates import consumer as order_consumer
+from managers.scheduler import scheduler
+from managers.shared_state import leader, shared, ProcessLock
+from managers.engine_ipc import loop_stats, client as engine_client
+from managers.index_feed import feed as index_feed
 # --------------------------
 import smart_trader
 import settings
-from database import db, AppSetting
+from database import db, AppSetting, migrate_schema
 import auto_login 
 
 app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
 app.config.from_object(config)
 
-# Initialize Database
+# Initialize Database (once at a time: every gunicorn worker imports this module)
 db.init_app(app)
-with app.app_context():
+with app.app_context(), ProcessLock("schema.lock"):
     db.create_all()
+    migrate_schema()
+    persistence.seed_trade_counters()
 
 kite = KiteConnect(api_key=config.API_KEY)
+LOGIN_URL = kite.login_url()   # depends only on the API key
 
 # --- GLOBAL STATE MANAGEMENT ---
 bot_active = False
 login_state = "IDLE" 
 login_error_msg = None 
 
+# --- MULTI-WORKER STATE ---
+# Under gunicorn -w N only the leader (see shared_state.leader) runs the monitor, login, scheduler,
+# Telegram dispatcher and order updates. It publishes the session flags to the shared store; the other
+# workers adopt them before each request and hand state changes to the leader as commands.
+# With ENGINE_MODE=external the leader is the run_engine.py process, reached over the IPC socket.
+LEADER_COMMANDS = ("reset", "login", "reschedule")
+EXTERNAL_ENGINE = config.ENGINE_MODE == "external"
+_published_session = None
+_worker_token_ref = None
+_handled_commands = {}
+_command_queue = queue.Queue()   # commands received over IPC (external engine)
+
+def session_state():
+    # The token itself stays in BrokerSession: workers get a fingerprint and reload it from there
+    token = getattr(kite, "access_token", None)
+    token_ref = hashlib.sha256(token.encode()).hexdigest()[:16] if token else None
+    return {"active": bot_active, "state": login_state, "error": login_error_msg, "token_ref": token_ref}
+
+def publish_session():
+    """Leader: writes the session flags / token for the other workers (only when they changed)."""
+    global _published_session
+    state = session_state()
+    if state != _published_session and shared.set("session", state):
+        _published_session = state
+
+def engine_snapshot():
+    """Engine state for the web tier (IPC 'snapshot')."""
+    return {"pid": os.getpid(), "session": session_state(), "loop": loop_stats.snapshot(),
+            "health": session_health.status(), "order_updates": order_consumer.stats, "schedule": scheduler.status()}
+
+def engine_status():
+    """/api/status 'engine' block: the risk loop's latency, wherever it runs."""
+    if not EXTERNAL_ENGINE:
+        return {"mode": "embedded", "loop": loop_stats.snapshot() if leader.is_leader else None}
+    snap = engine_client.snapshot()
+    if snap is None:
+        return {"mode": "external", "connected": False}
+    return dict({k: v for k, v in snap.items() if k != "session"}, mode="external", connected=True)
+
+def queue_leader_command(action, **data):
+    """IPC 'command' handler: applied by the monitor loop on its next pass."""
+    if action not in LEADER_COMMANDS:
+        raise ValueError(f"Unknown command '{action}'")
+    _command_queue.put((action, data))
+    return True
+
+def request_leader(action, **data):
+    """Non-leader: asks the leader to apply a state change (picked up by its monitor loop)."""
+    if EXTERNAL_ENGINE and engine_client.call("command", action=action, **data):
+        return
+    shared.set(f"cmd:{action}", dict(data, at=time.time()))
+
+def handle_leader_commands():
+    """Leader: applies the commands other workers queued since the last pass."""
+    pending = []
+    while not _command_queue.empty():
+        pending.append(_command_queue.get_nowait())
+    for action in LEADER_COMMANDS:
+        cmd = shared.get(f"cmd:{action}")
+        if not cmd or cmd.get("at", 0) <= _handled_commands.get(action, 0):
+            continue
+        _handled_commands[action] = cmd["at"]
+        pending.append((action, cmd))
+    for action, cmd in pending:
+        apply_leader_command(action, cmd)
+
+def apply_leader_command(action, cmd):
+    global bot_active, login_state, login_error_msg
+    if action == "reset":
+        bot_active = False
+        login_state = "IDLE"
+    elif action == "login":
+        saved = persistence.load_broker_session()   # stored by the worker that handled the callback
+        if not saved:
+            return
+        kite.set_access_token(saved["access_token"])
+        session_health.reset()
+        smart_trader.fetch_instruments(kite)
+        bot_active = True
+        login_state = "IDLE"
+        login_error_msg = None
+    elif action == "reschedule":
+        risk_engine.schedule_time_rules(kite, lambda: bot_active)
+
+@app.before_request
+def sync_worker_state():
+    """Non-leader workers serve requests with the leader's session flags, token and instrument list."""
+    global bot_active, login_state, login_error_msg, _worker_token_ref
+    if leader.is_leader:
+        return
+    snap = engine_client.snapshot() if EXTERNAL_ENGINE else None
+    state = snap["session"] if snap else shared.get("session")
+    if not state:
+        return
+    bot_active, login_state, login_error_msg = state["active"], state["state"], state["error"]
+    token_ref = state.get("token_ref")
+    if token_ref and token_ref != _worker_token_ref:
+        saved = persistence.load_broker_session()
+        if saved:
+            kite.set_access_token(saved["access_token"])
+            _worker_token_ref = token_ref
+    if bot_active:
+        smart_trader.load_cached_instruments()
+
+RESTORE_ATTEMPTS = 3   # profile() checks of a saved token before giving up for this round (2s, 4s backoff)
+
+def restore_saved_session():
+    """
+    Reuses today's stored access token so a restart skips the Selenium login.
+    Returns "restored", "transient" (broker unreachable / 5xx: the token is kept and checked again
+    on the next round) or None (no token, or the broker rejected it and it was discarded).
+    """
+    saved = persistence.load_broker_session()
+    if not saved:
+        return None
+
+    kite.set_access_token(saved["access_token"])
+    for attempt in range(RESTORE_ATTEMPTS):
+        try:
+            kite.profile()
+            break
+        except Exception as e:
+            if is_auth_error(e):
+                print(f"⚠️ Saved Session Rejected: {e}")
+                persistence.clear_broker_session()
+                return None
+            print(f"⚠️ Saved Session Check Failed ({attempt + 1}/{RESTORE_ATTEMPTS}, token kept): {e}")
+            if attempt + 1 == RESTORE_ATTEMPTS:
+                return "transient"
+            time.sleep(2 ** (attempt + 1))
+
+    session_health.reset()
+    smart_trader.fetch_instruments(kite)
+    print(f"✅ Restored Saved Session (Created {saved.get('created_at')}). Selenium Skipped.")
+    return "restored"
+
 def run_auto_login_process():
     global bot_active, login_state, login_error_msg
     
+    # 1. Same-day restart: reuse the stored token if the broker still accepts it.
+    # Selenium only runs without a token or once the broker has rejected it
+    try:
+        restored = restore_saved_session()
+    except Exception as e:
+        print(f"⚠️ Session Restore Failed: {e}")
+        restored = None if is_auth_error(e) else "transient"
+    if restored == "restored":
+        bot_active = True
+        login_state = "IDLE"
+        login_error_msg = None
+        telegram_bot.notify_system_event("LOGIN_SUCCESS", "Saved Session Restored (No Browser Login).")
+        return
+    if restored == "transient":
+        # The monitor retries after its FAILED pause (the saved token is checked again first)
+        login_state = "FAILED"
+        login_error_msg = "Broker unreachable, saved session kept"
+        return
+
     if not config.ZERODHA_USER_ID or not config.TOTP_SECRET:
         login_state = "FAILED"
         login_error_msg = "Missing Credentials in Config"
@@ -55,6 +221,8 @@ def run_auto_login_process():
             try:
                 data = kite.generate_session(token, api_secret=config.API_SECRET)
                 kite.set_access_token(data["access_token"])
+                session_health.reset()
+                persistence.save_broker_session(data["access_token"], data.get("user_id"))
                 
                 # Fetch instruments immediately after login
                 smart_trader.fetch_instruments(kite)
@@ -114,24 +282,31 @@ def background_monitor():
     while True:
         with app.app_context():
             try:
+                # 0. State changes requested by the other workers
+                handle_leader_commands()
+
                 # 1. Active Bot Check
                 if bot_active:
+                    loop_start = time.perf_counter()
                     try:
                         # [FIX] Skip Token Check if using Mock Broker
                         if not hasattr(kite, "mock_instruments"):
                             if not kite.access_token: 
                                 raise Exception("No Access Token Found")
 
-                        # Force a simple API call to validate the token 
-                        try:
-                            # Mock Broker might not have profile(), so we skip this check for Mock
-                            if not hasattr(kite, "mock_instruments"):
-                                kite.profile() 
-                        except Exception as e:
-                            raise e 
+                        # Session Health: quotes/orders count as liveness, profile() is only
+                        # probed in the background after silence or auth errors (never waited on)
+                        if not hasattr(kite, "mock_instruments"):
+                            lost_reason = session_health.check(kite)
+                            if lost_reason:
+                                raise Exception(lost_reason)
+                        
+                        # Broker order updates (fills) are consumed in the background
+                        order_consumer.ensure_running(kite, app)
                         
                         # Run Strategy Logic (Risk Engine)
                         risk_engine.update_risk_engine(kite)
+                        loop_stats.record(time.perf_counter() - loop_start)
                         
                     except Exception as e:
                         err = str(e)
@@ -141,6 +316,10 @@ def background_monitor():
                             if bot_active:
                                 telegram_bot.notify_system_event("OFFLINE", f"Connection Lost: {err}")
                             
+                            # A rejected token must not be restored on the next login attempt
+                            if is_auth_error(err):
+                                persistence.clear_broker_session()
+                            
                             bot_active = False 
                         else:
                             print(f"⚠️ Risk Loop Warning: {err}")
@@ -165,6 +344,7 @@ def background_monitor():
             except Exception as e:
                 print(f"❌ Monitor Loop Critical Error: {e}")
             finally:
+                publish_session()
                 db.session.remove()
         
         time.sleep(0.5) 
@@ -173,26 +353,36 @@ def background_monitor():
 def home():
     global bot_active, login_state
     if bot_active:
-        trades = persistence.load_trades()
+        # Copies: the cached trades (and the risk engine's symbol index) keep the raw symbol
+        trades = [dict(t) for t in persistence.load_trades()]
         for t in trades: 
             t['symbol'] = smart_trader.get_display_name(t['symbol'])
         active = [t for t in trades if t['status'] in ['OPEN', 'PROMOTED_LIVE', 'PENDING', 'MONITORING']]
         return render_template('dashboard.html', is_active=True, trades=active)
     
-    return render_template('dashboard.html', is_active=False, state=login_state, error=login_error_msg, login_url=kite.login_url())
+    return render_template('dashboard.html', is_active=False, state=login_state, error=login_error_msg, login_url=LOGIN_URL)
 
 @app.route('/secure', methods=['GET', 'POST'])
 def secure_login_page():
     if request.method == 'POST':
         if request.form.get('password') == config.ADMIN_PASSWORD:
-            return redirect(kite.login_url())
+            return redirect(LOGIN_URL)
         else:
             return render_template('secure_login.html', error="Invalid Password! Access Denied.")
     return render_template('secure_login.html')
 
 @app.route('/api/status')
 def api_status():
-    return jsonify({"active": bot_active, "state": login_state, "login_url": kite.login_url()})
+    return jsonify({"active": bot_active, "state": login_state, "login_url": LOGIN_URL, "session": session_health.status(), "order_updates": order_consumer.stats, "schedule": scheduler.status(), "worker": leader.status(), "engine": engine_status()})
+
+@app.route('/api/postback', methods=['POST'])
+def api_postback():
+    """Kite order postback (set as the app's Postback URL). Queued, applied in the background."""
+    data = request.get_json(silent=True) or {}
+    if not order_consumer.verify_postback(data):
+        return jsonify({"status": "error", "message": "Invalid checksum"}), 403
+    order_consumer.handle_postback(data)
+    return jsonify({"status": "success"})
 
 @app.route('/reset_connection')
 def reset_connection():
@@ -203,6 +393,8 @@ def reset_connection():
     
     bot_active = False
     login_state = "IDLE"
+    if not leader.is_leader:
+        request_leader("reset")
     flash("🔄 Connection Reset. Login Monitor will retry.")
     return redirect('/')
 
@@ -214,7 +406,11 @@ def callback():
         try:
             data = kite.generate_session(t, api_secret=config.API_SECRET)
             kite.set_access_token(data["access_token"])
+            session_health.reset()
+            persistence.save_broker_session(data["access_token"], data.get("user_id"))
             bot_active = True
+            if not leader.is_leader:
+                request_leader("login")
             smart_trader.fetch_instruments(kite)
             gc.collect()
             
@@ -231,32 +427,10 @@ def api_settings_load():
     # Load base settings
     s = settings.load_settings()
     
-    # --- FIXED: 1st Trade Logic using IST Timezone ---
+    # 1st Trade Logic: today's (IST) trade counters, maintained at trade creation
     try:
-        from managers.common import IST
-        from datetime import datetime
-        
-        # Fetch current date in IST instead of server local time
-        today_str = datetime.now(IST).strftime("%Y-%m-%d")
-        
-        # Load Trades & History to count today's trades
-        trades = persistence.load_trades()
-        history = persistence.load_history()
-        
-        count = 0
-        # Check Active Trades
-        if trades:
-            for t in trades:
-                if t.get('entry_time', '').startswith(today_str): 
-                    count += 1
-        
-        # Check History
-        if history:
-            for t in history:
-                if t.get('entry_time', '').startswith(today_str): 
-                    count += 1
-            
-        s['is_first_trade'] = (count == 0)
+        s['trade_counts'] = persistence.get_trade_counts()
+        s['is_first_trade'] = sum(s['trade_counts'].values()) == 0
     except Exception as e:
         print(f"Error checking first trade: {e}")
         # Default to False on error to prevent unwanted mode switching
@@ -266,13 +440,20 @@ def api_settings_load():
 
 @app.route('/api/settings/save', methods=['POST'])
 def api_settings_save():
-    if settings.save_settings_file(request.json):
+    # Counters are computed per load, not settings
+    data = {k: v for k, v in request.json.items() if k not in ("is_first_trade", "trade_counts")}
+    if settings.save_settings_file(data):
+        # Square-off times may have changed (the scheduler runs in the leader)
+        if leader.is_leader:
+            risk_engine.schedule_time_rules(kite, lambda: bot_active)
+        else:
+            request_leader("reschedule")
         return jsonify({"status": "success"})
     return jsonify({"status": "error"})
 
 @app.route('/api/positions')
 def api_positions():
-    trades = persistence.load_trades()
+    trades = [dict(t) for t in persistence.load_trades()]
     for t in trades:
         t['lot_size'] = smart_trader.get_lot_size(t['symbol'])
         t['symbol'] = smart_trader.get_display_name(t['symbol'])
@@ -280,11 +461,43 @@ def api_positions():
 
 @app.route('/api/closed_trades')
 def api_closed_trades():
-    trades = persistence.load_history()
+    # Optional ?date=YYYY-MM-DD: the History tab only shows one day (hot table or archive)
+    day = request.args.get('date')
+    trades = [dict(t) for t in persistence.load_history(day, day)]
     for t in trades:
         t['symbol'] = smart_trader.get_display_name(t['symbol'])
     return jsonify(trades)
 
+@app.route('/api/export/history.<fmt>')
+def api_export_history(fmt):
+    """
+    Streams the closed trades (hot table + archive) as CSV or Parquet.
+    Filters: ?start=YYYY-MM-DD&end=YYYY-MM-DD&mode=LIVE&symbol=NIFTY (symbol is a prefix).
+    """
+    if fmt not in history_export.FORMATS:
+        return jsonify({"status": "error", "message": f"Unknown format '{fmt}' (csv / parquet)"}), 404
+    if not history_export.available(fmt):
+        return jsonify({"status": "error", "message": "Parquet export needs pyarrow installed"}), 400
+    stream, mimetype = history_export.FORMATS[fmt]
+    filters = {k: request.args.get(k) or None for k in ("start", "end", "mode", "symbol")}
+    name = "trade_history_" + "_".join(v for v in filters.values() if v) if any(filters.values()) else "trade_history"
+    return Response(stream_with_context(stream(**filters)), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={name}.{fmt}"})
+
+@app.route('/api/analytics')
+def api_analytics():
+    """
+    Server-side History analytics: ?start=YYYY-MM-DD&end=YYYY-MM-DD&mode=LIVE (default: last 30 days).
+    Win rate, average R, potential vs realized and time in trade, per day / symbol / exit type / mode.
+    """
+    try:
+        return jsonify(analytics.compute(request.args.get('start') or None, request.args.get('end') or None, request.args.get('mode') or None))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except RuntimeError as e:
+        print(f"❌ Analytics Error: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 503
+
 @app.route('/api/delete_trade/<trade_id>', methods=['POST'])
 def api_delete_trade(trade_id):
     if persistence.delete_trade(trade_id):
@@ -321,7 +534,8 @@ def api_manage_trade():
 def api_indices():
     if not bot_active:
         return jsonify({"NIFTY":0, "BANKNIFTY":0, "SENSEX":0})
-    return jsonify(smart_trader.get_indices_ltp(kite))
+    snap = index_feed.snapshot()
+    return jsonify(dict(snap["indices"], watchlist=snap["watchlist"], age=snap["age"]))
 
 @app.route('/api/search')
 def api_search():
@@ -345,8 +559,11 @@ def api_s_ltp():
 def api_panic_exit():
     if not bot_active:
         return jsonify({"status": "error", "message": "Bot not connected"})
-    if broker_ops.panic_exit_all(kite):
+    report = broker_ops.panic_exit_all(kite)
+    if report:
         flash("🚨 PANIC MODE EXECUTED. ALL TRADES CLOSED.")
+        if isinstance(report, dict):
+            return jsonify({"status": "success", "orders": report["orders"], "failed": report["failed"], "wall_ms": report["wall_ms"]})
         return jsonify({"status": "success"})
     return jsonify({"status": "error", "message": "Failed to execute panic mode"})
 
@@ -399,7 +616,7 @@ def test_telegram():
         return jsonify({"status": "error", "message": "Missing credentials"})
     
     # Direct test via Requests (bypassing stored settings to test new input)
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
+    url = f"{config.TELEGRAM_API_URL}/bot{token}/sendMessage"
     payload = {
         "chat_id": chat,
         "text": "✅ <b>RD Algo Terminal:</b> Test Message Received!\nConfiguration is valid.",
@@ -436,79 +653,15 @@ def api_import_trade():
             target_channels=target_channels
         )
         
-        # --- SEQUENTIAL TELEGRAM SENDER (UPDATED) ---
+        # --- STREAMED TELEGRAM DISPATCH ---
+        # Events are enqueued in order; the Telegram Manager keeps per-chat ordering,
+        # paces each chat and threads replies once the NEW_TRADE message is sent.
         queue = result.get('notification_queue', [])
         trade_ref = result.get('trade_ref', {})
         
         if queue and trade_ref:
-            def send_seq_notifications():
-                # Wrap thread in app_context to access DB
-                with app.app_context():
-                    # 1. Send Initial "NEW_TRADE" message -> Returns Dict of IDs
-                    msg_ids = telegram_bot.notify_trade_event(trade_ref, "NEW_TRADE")
-                    
-                    if msg_ids:
-                        from managers.persistence import load_trades, save_trades, save_to_history_db
-                        
-                        trade_id = trade_ref['id']
-                        updated_ref = False
-                        
-                        # Handle Structure: If dict, save dict. If int (legacy), wrap it.
-                        if isinstance(msg_ids, dict):
-                            ids_dict = msg_ids
-                            # If we sent to 'free', main_id might be None or the id for free channel
-                            # We grab the ID corresponding to the selected channel as the "primary" reference
-                            main_id = msg_ids.get(selected_channel) or msg_ids.get('main')
-                        else:
-                            ids_dict = {'main': msg_ids}
-                            main_id = msg_ids
-                        
-                        # Try updating Active Trades
-                        trades = load_trades()
-                        for t in trades:
-                            # Robust comparison: Convert both to strings
-                            if str(t['id']) == str(trade_id):
-                                t['telegram_msg_ids'] = ids_dict
-                                t['telegram_msg_id'] = main_id # Legacy fallback
-                                save_trades(trades)
-                                updated_ref = True
-                                break
-                        
-                        # If not active (e.g., trade closed immediately), update History
-                        if not updated_ref:
-                            trade_ref['telegram_msg_ids'] = ids_dict
-                            trade_ref['telegram_msg_id'] = main_id
-                            save_to_history_db(trade_ref)
-                            
-                        # Update local ref so subsequent events know where to reply
-                        trade_ref['telegram_msg_ids'] = ids_dict
-                        trade_ref['telegram_msg_id'] = main_id
-                    
-                    # 2. Process the rest of the queue
-                    for item in queue:
-                        evt = item['event']
-                        if evt == 'NEW_TRADE': continue # Already sent
-                        
-                        # Small delay to ensure sequence order in Telegram
-                        time.sleep(1.0)
-                        
-                        dat = item.get('data')
-                        t_obj = item.get('trade', trade_ref).copy() 
-                        
-                        # --- CRITICAL FIX: INJECT ID IF MISSING ---
-                        # The replay engine often creates snapshot objects without IDs.
-                        if 'id' not in t_obj:
-                            t_obj['id'] = trade_ref['id']
-                        
-                        # Inject IDs so manager knows where to reply for all channels
-                        t_obj['telegram_msg_ids'] = trade_ref.get('telegram_msg_ids')
-                        t_obj['telegram_msg_id'] = trade_ref.get('telegram_msg_id')
-                        
-                        telegram_bot.notify_trade_event(t_obj, evt, dat)
-
-            # Start thread
-            t = threading.Thread(target=send_seq_notifications)
-            t.start()
+            telegram_bot.notify_trade_event(trade_ref, "NEW_TRADE")
+            telegram_bot.notify_trade_events(replay_engine.iter_replay_notifications(trade_ref, queue))
         
         return jsonify(result)
     except Exception as e:
@@ -532,7 +685,7 @@ def api_sync():
         "status": {
             "active": bot_active, 
             "state": login_state, 
-            "login_url": kite.login_url()
+            "login_url": LOGIN_URL
         },
         "indices": {"NIFTY": 0, "BANKNIFTY": 0, "SENSEX": 0},
         "positions": [],
@@ -540,14 +693,14 @@ def api_sync():
         "specific_ltp": 0
     }
 
-    # 2. Fetch Indices (Only if active)
+    # 2. Indices (Only if active): served from the index feed snapshot, never a broker call
     if bot_active:
-        try:
-            response["indices"] = smart_trader.get_indices_ltp(kite)
-        except: pass
+        snap = index_feed.snapshot()
+        response["indices"] = snap["indices"]
+        response["indices_age"] = snap["age"]
 
     # 3. Active Positions
-    trades = persistence.load_trades()
+    trades = [dict(t) for t in persistence.load_trades()]
     for t in trades:
         t['lot_size'] = smart_trader.get_lot_size(t['symbol'])
         t['symbol'] = smart_trader.get_display_name(t['symbol'])
@@ -555,7 +708,8 @@ def api_sync():
 
     # 4. Closed Trades (Only if requested to save bandwidth)
     if request.json.get('include_closed'):
-        history = persistence.load_history()
+        day = request.json.get('closed_date')
+        history = [dict(t) for t in persistence.load_history(day, day)]
         for t in history:
             t['symbol'] = smart_trader.get_display_name(t['symbol'])
         response["closed_trades"] = history
@@ -635,8 +789,8 @@ def place_trade():
         # Load settings to get multipliers
         app_settings = settings.load_settings()
         
-        # Helper to execute trade with optional overrides
-        def execute(ex_mode, ex_qty, ex_channels, overrides=None):
+        # Helper to build one trade leg with optional overrides
+        def build_leg(ex_mode, ex_qty, ex_channels, overrides=None):
             # Default to form values
             use_sl_points = sl_points
             use_target_controls = target_controls
@@ -665,15 +819,13 @@ def place_trade():
                 use_sl_entry = sl_to_entry
                 use_exit_mult = exit_multiplier
             
-            print(f"[DEBUG MAIN] Executing Helper: Mode={ex_mode}, Qty={ex_qty}, Trail={use_trail}, Mult={use_exit_mult}")
+            print(f"[DEBUG MAIN] Building Leg: Mode={ex_mode}, Qty={ex_qty}, Trail={use_trail}, Mult={use_exit_mult}")
             
-            return trade_manager.create_trade_direct(
-                kite, ex_mode, final_sym, ex_qty, use_sl_points, use_custom_targets, 
-                order_type, limit_price, use_target_controls, 
-                use_trail, use_sl_entry, use_exit_mult, 
-                target_channels=ex_channels,
-                risk_ratios=use_ratios
-            )
+            return {
+                "mode": ex_mode, "quantity": ex_qty, "sl_points": use_sl_points, "custom_targets": use_custom_targets,
+                "target_controls": use_target_controls, "trailing_sl": use_trail, "sl_to_entry": use_sl_entry,
+                "exit_multiplier": use_exit_mult, "target_channels": ex_channels, "risk_ratios": use_ratios
+            }
         
         # --- PREPARE OVERRIDES (Check for Symbol Specific Settings) ---
         # Determine which mode config to check for symbol settings
@@ -788,28 +940,25 @@ def place_trade():
                 'ratios': None 
             }
             
-            # Execute LIVE (Silent)
-            print("[DEBUG MAIN] calling execute('LIVE') with Form Overrides...")
-            res_live = execute("LIVE", live_qty, [], overrides=live_overrides)
-            
-            if res_live['status'] != 'success':
-                flash(f"❌ Shadow Failed: LIVE Execution Error ({res_live['message']})")
-                return redirect('/')
-            
-            # 3. Wait for DB Safety (1s to ensure ID separation)
-            print("[DEBUG MAIN] LIVE Success. Waiting 1s...")
-            time.sleep(1)
+            # LIVE leg is Silent and required: if it fails, no PAPER leg is created
+            live_leg = build_leg("LIVE", live_qty, [], overrides=live_overrides)
+            live_leg['required'] = True
             
             # ==========================================
             # LEG 2: EXECUTE PAPER (Uses Standard Paper Form Inputs)
             # ==========================================
             paper_qty = input_qty
             
-            # Execute PAPER (Broadcast with Main Form Settings)
-            print("[DEBUG MAIN] calling execute('PAPER') with Main Form Inputs...")
-            res_paper = execute("PAPER", paper_qty, target_channels, overrides=None)
+            # PAPER leg (Broadcast with Main Form Settings)
+            paper_leg = build_leg("PAPER", paper_qty, target_channels, overrides=None)
+            
+            # Both legs share one LTP snapshot; the LIVE orders and the saves happen together
+            print("[DEBUG MAIN] Executing SHADOW legs (LIVE + PAPER)...")
+            res_live, res_paper = trade_manager.create_trades_multi(kite, final_sym, order_type, limit_price, [live_leg, paper_leg])
             
-            if res_paper['status'] == 'success':
+            if res_live['status'] != 'success':
+                flash(f"❌ Shadow Failed: LIVE Execution Error ({res_live['message']})")
+            elif res_paper['status'] == 'success':
                 flash(f"👻 Shadow Executed: ✅ LIVE | ✅ PAPER")
             else:
                 flash(f"⚠️ Shadow Partial: ✅ LIVE | ❌ PAPER Failed ({res_paper['message']})")
@@ -831,7 +980,7 @@ def place_trade():
             if symbol_override:
                 std_overrides = symbol_override.copy()
             
-            res = execute(mode_input, final_qty, target_channels, overrides=std_overrides)
+            res = trade_manager.create_trades_multi(kite, final_sym, order_type, limit_price, [build_leg(mode_input, final_qty, target_channels, overrides=std_overrides)])[0]
             
             if res['status'] == 'success':
                 flash(f"✅ Order Placed: {final_sym}")
@@ -859,9 +1008,30 @@ def close_trade(trade_id):
         flash("❌ Error")
     return redirect('/')
 
-if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+def start_leader_services():
+    """Background services: exactly one process (the leader) runs them."""
+    with app.app_context():
+        # Commands queued before this worker took over are not replayed
+        for action in LEADER_COMMANDS:
+            _handled_commands[action] = (shared.get(f"cmd:{action}", max_age=0) or {}).get("at", 0)
     t = threading.Thread(target=background_monitor, daemon=True)
     t.start()
+    # Index / watchlist quotes for every dashboard (one broker call per interval)
+    index_feed.start(app, kite, lambda: bot_active)
+    # Drains the Telegram outbox (also resends alerts left pending by a previous run)
+    telegram_bot.start_dispatcher(app)
+    # Time-based rules: square-off + EOD report per mode, daily instrument refresh
+    with app.app_context():
+        risk_engine.schedule_time_rules(kite, lambda: bot_active)
+    scheduler.daily("instrument_refresh", config.INSTRUMENT_REFRESH_TIME,
+                    lambda: bot_active and smart_trader.fetch_instruments(kite, force=True), grace=3600)
+    scheduler.daily("history_archive", config.HISTORY_ARCHIVE_TIME,
+                    lambda: persistence.archive_history() is not None, grace=3600)
+    scheduler.start(app)
+
+# External engine: run_engine.py campaigns instead, the web workers only serve requests
+if not EXTERNAL_ENGINE and (not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+    leader.campaign(start_leader_services)
 
 # --- NEW CHARTING ROUTES & UPDATED API ---
 
@@ -0,0 +1,133 @@
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from managers.common import IST
+from managers.persistence import load_history, history_day_versions
+from managers.history_export import flatten
+
+TIME_BUCKETS = [0, 5, 15, 30, 60, 120, np.inf]
+TIME_LABELS = ["<5m", "5-15m", "15-30m", "30-60m", "1-2h", "2h+"]
+
+CACHE_DAYS = 400      # closed days kept (a year of ranges; least recently used first out)
+
+_DAY_CACHE = OrderedDict()   # day -> (history version, per-trade metrics frame); closed days only
+_CACHE_LOCK = threading.Lock()
+
+def _underlying(symbol):
+    # NIFTY20261018CE22000 -> NIFTY (equities / indices keep their name)
+    m = re.match(r"^([A-Z&\-]+?)\d", str(symbol or ""))
+    return m.group(1) if m else symbol
+
+def _minutes(entry_time, exit_time):
+    try:
+        fmt = "%Y-%m-%d %H:%M:%S"
+        return (datetime.strptime(exit_time, fmt) - datetime.strptime(entry_time, fmt)).total_seconds() / 60
+    except (TypeError, ValueError):
+        return np.nan
+
+def _potential(t):
+    """Same rule as the History tab: none for direct SL hits / trades that never activated."""
+    hits = t.get('targets_hit_indices') or []
+    if t.get('status') == 'SL_HIT' and not hits: return 0.0
+    if t.get('status') == 'NOT_ACTIVE' or (t.get('status') == 'TIME_EXIT' and t.get('pnl') == 0): return 0.0
+    entry = t.get('entry_price') or 0
+    made_high = max(t.get('made_high') or entry, t.get('exit_price') or 0)
+    return max((made_high - entry) * (t.get('quantity') or 0), 0.0)
+
+def _metrics(t):
+    row = flatten(t)
+    entry, qty = row['entry_price'] or 0, row['quantity'] or 0
+    # Initial risk: original_sl when recorded, else the final (possibly trailed) SL
+    risk_sl = row['original_sl'] if row['original_sl'] is not None else row['sl']
+    risk = abs(entry - risk_sl) * qty if risk_sl is not None else 0
+    pnl = row['pnl'] or 0.0
+    row.update({
+        "day": str(row['exit_time'] or '')[:10],
+        "underlying": _underlying(row['symbol']),
+        "win": pnl > 0,
+        "r_multiple": pnl / risk if risk else np.nan,
+        "potential": _potential(t),
+        "minutes": _minutes(row['entry_time'], row['exit_time']),
+    })
+    return row
+
+def _day_frame(day, today, version):
+    """
+    Per-trade metrics of one exit day. Closed days are cached until their history changes
+    (version: persistence.history_day_versions). A failed read raises (never cached as an empty day).
+    """
+    if day < today:
+        with _CACHE_LOCK:
+            cached = _DAY_CACHE.get(day)
+            if cached and cached[0] == version:
+                _DAY_CACHE.move_to_end(day)
+                return cached[1]
+    try:
+        trades = load_history(day, day, strict=True)
+    except Exception as e:
+        raise RuntimeError(f"History read failed for {day}: {e}") from e
+    frame = pd.DataFrame([_metrics(t) for t in trades])
+    if day < today:
+        with _CACHE_LOCK:
+            _DAY_CACHE[day] = (version, frame)
+            _DAY_CACHE.move_to_end(day)
+            while len(_DAY_CACHE) > CACHE_DAYS:
+                _DAY_CACHE.popitem(last=False)
+    return frame
+
+def _group(df, by):
+    g = df.groupby(by, sort=True)
+    out = g.agg(
+        trades=("id", "count"), wins=("win", "sum"), pnl=("pnl", "sum"),
+        avg_r=("r_multiple", "mean"), potential=("potential", "sum"),
+        avg_minutes=("minutes", "mean"), median_minutes=("minutes", "median"),
+    )
+    out["win_rate"] = out["wins"] / out["trades"] * 100
+    # Captured share of the potential move (realized vs best possible exit)
+    out["capture_pct"] = (out["pnl"] / out["potential"].where(out["potential"] > 0)) * 100
+    out = out.reset_index().round(2)
+    return out.astype(object).where(out.notna(), None).to_dict("records")
+
+def compute(start=None, end=None, mode=None):
+    """
+    Closed-trade stats for exit days start..end ('YYYY-MM-DD', default: the last 30 days):
+    per day / underlying / exit type / mode, plus the time-in-trade distribution.
+    """
+    today = datetime.now(IST).strftime("%Y-%m-%d")
+    end = end or today
+    start = start or (datetime.strptime(end, "%Y-%m-%d") - timedelta(days=29)).strftime("%Y-%m-%d")
+    days = pd.date_range(start, end, freq="D").strftime("%Y-%m-%d")
+
+    try:
+        versions = history_day_versions(list(days))
+    except Exception as e:
+        raise RuntimeError(f"History read failed: {e}") from e
+    frames = [f for f in (_day_frame(d, today, versions[d]) for d in days) if not f.empty]
+    result = {"start": start, "end": end, "mode": mode or "ALL", "summary": None,
+              "by_day": [], "by_symbol": [], "by_exit_type": [], "by_mode": [], "time_in_trade": {}}
+    if not frames:
+        return result
+    df = pd.concat(frames, ignore_index=True)
+    if mode:
+        df = df[df["mode"] == mode].copy()
+    if df.empty:
+        return result
+
+    df["exit_type"] = df["exit_type"].fillna("UNKNOWN")
+    df["all"] = "ALL"
+    result["summary"] = _group(df, "all")[0]
+    result["summary"].pop("all")
+    result["by_day"] = _group(df, "day")
+    result["by_symbol"] = _group(df, "underlying")
+    result["by_exit_type"] = _group(df, "exit_type")
+    result["by_mode"] = _group(df, "mode")
+    buckets = pd.cut(df["minutes"], TIME_BUCKETS, labels=TIME_LABELS, right=False)
+    result["time_in_trade"] = {str(k): int(v) for k, v in buckets.value_counts(sort=False).items()}
+    return result
+
+def cache_stats():
+    with _CACHE_LOCK:
+        return {"days": len(_DAY_CACHE)}
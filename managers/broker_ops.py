@@ -1,7 +1,24 @@
-from managers.common import log_event, get_time_str
-from managers.persistence import TRADE_LOCK, load_trades, save_trades, save_to_history_db
+from managers.common import log_event, get_time_str, get_flask_app
+from managers.persistence import TRADE_LOCK, load_trades, save_trades, save_to_history_db, update_trade_fields
+from managers.session_health import health as session_health
+from managers.order_updates import track_order, settle_from_fills, consumer as order_consumer
+from managers.trade_index import index as trade_index
 import smart_trader
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from managers.rate_limit import TokenBucket
+
+# Kite allows 10 order requests (place / modify / cancel) per second
+ORDER_RATE = 10
+ORDER_BUCKET = TokenBucket(rate=ORDER_RATE, capacity=ORDER_RATE)
+PANIC_WORKERS = 8
+
+# Broker SL Sync: Zerodha allows a limited number of modifications per order
+SL_MODIFY_INTERVAL = 1.0   # seconds, at most one trigger modify per trade per interval
+SL_MODIFY_CAP = 25
+SL_REPLACE_MARGIN = 2      # cancel-and-replace once this close to the cap
+SL_MAX_ERRORS = 3
 
 def place_order(kite, symbol, transaction_type, quantity, order_type="MARKET", product="MIS", price=0, trigger_price=0, exchange=None, tag="RD_ALGO"):
     """
@@ -24,8 +41,10 @@ def place_order(kite, symbol, transaction_type, quantity, order_type="MARKET", p
             trigger_price=trigger_price,
             tag=tag
         )
+        session_health.mark_ok("order")
         return order_id
     except Exception as e:
+        session_health.mark_error(e, "order")
         print(f"❌ Order Placement Failed: {e}")
         raise e
 
@@ -38,8 +57,10 @@ def modify_order(kite, order_id, quantity=None, price=None, trigger_price=None):
             price=price,
             trigger_price=trigger_price
         )
+        session_health.mark_ok("order")
         return True
     except Exception as e:
+        session_health.mark_error(e, "order")
         print(f"❌ Order Modification Failed: {e}")
         raise e
 
@@ -67,13 +88,25 @@ def move_to_history(trade, final_status, exit_price):
     if "Closed:" not in str(trade.get('logs', [])):
          log_event(trade, f"Closed: {final_status} @ {exit_price} | P/L ₹ {real_pnl:.2f}")
     
+    # LIVE: fills already reported by the broker win over the estimate
+    if trade.get('broker_orders'):
+        settle_from_fills(trade)
+    
     save_to_history_db(trade)
+    # Missed-opportunity tracking of today's closed trades
+    trade_index.add_closed(trade)
 
 def manage_broker_sl(kite, trade, qty_to_remove=0, cancel_completely=False):
     """
     Manages the physical Stop Loss order on the Broker (Zerodha) side.
     Can cancel the SL completely or modify the quantity (for partial exits).
     """
+    # Full exit: stop trigger syncing first (waits for an in-flight replace, returns the live order ID)
+    full_exit = cancel_completely or qty_to_remove >= trade['quantity']
+    if full_exit:
+        synced_id = sl_sync.forget(trade.get('id'))
+        if synced_id: trade['sl_order_id'] = synced_id
+
     sl_id = trade.get('sl_order_id')
     # Only proceed if there is an SL Order ID and the mode is LIVE
     if not sl_id or trade['mode'] != 'LIVE': 
@@ -81,7 +114,7 @@ def manage_broker_sl(kite, trade, qty_to_remove=0, cancel_completely=False):
 
     try:
         # Scenario 1: Cancel SL completely (Full Exit or Panic)
-        if cancel_completely or qty_to_remove >= trade['quantity']:
+        if full_exit:
             kite.cancel_order(variety=kite.VARIETY_REGULAR, order_id=sl_id)
             log_event(trade, f"Broker SL Cancelled (ID: {sl_id})")
             trade['sl_order_id'] = None 
@@ -95,17 +128,313 @@ def manage_broker_sl(kite, trade, qty_to_remove=0, cancel_completely=False):
                     order_id=sl_id,
                     quantity=new_qty
                 )
+                sl_sync.note_quantity(trade, new_qty)
                 log_event(trade, f"Broker SL Qty Modified to {new_qty}")
                 
     except Exception as e:
         log_event(trade, f"⚠️ Broker SL Update Failed: {e}")
 
+# --- BROKER SL SYNC ---
+class BrokerSLSync:
+    """
+    Coalesces trigger-price changes of broker SL-M orders.
+    - The risk loop only records the desired trigger per trade (request_trigger, non-blocking).
+    - A background thread sends at most one modify per trade per SL_MODIFY_INTERVAL,
+      always with the latest desired value; intermediate values are skipped.
+    - Modifications per order are counted; near SL_MODIFY_CAP the order is cancelled
+      and replaced with a fresh SL-M (new ID written back to the trade).
+    - Only the leader's instance sends trigger modifies (reconcile() from its risk loop). The shared
+      trade record carries the state: 'sl' is the desired trigger, 'sl_trigger' the last one sent and
+      'sl_mods' the modify count of the current order, so SL edits and quantity modifies made in
+      other workers reach the leader through the journal.
+    """
+    def __init__(self):
+        self._owner = False
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._kite = None
+        self._thread = None
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sl-sync")
+
+    def _entry(self, trade):
+        """Called with self._lock held."""
+        t_id = str(trade['id'])
+        e = self._entries.get(t_id)
+        # A new SL order placed elsewhere (not one of ours) starts a fresh count
+        if e is None or trade['sl_order_id'] not in e['known_ids']:
+            sent = trade.get('sl_trigger', trade.get('sl'))
+            sent = float(sent) if sent is not None else None
+            e = {
+                'order_id': trade['sl_order_id'], 'known_ids': {trade['sl_order_id']}, 'desired': sent, 'sent': sent,
+                'last_sent_at': 0, 'mods': trade.get('sl_mods', 0), 'errors': 0, 'inflight': False, 'closed': False,
+                'needs_place': False, 'op_lock': threading.Lock()
+            }
+            self._entries[t_id] = e
+        e['trade_id'] = trade['id']
+        e['symbol'] = trade['symbol']
+        e['exchange'] = trade.get('exchange') or smart_trader.get_exchange_name(trade['symbol'])
+        e['quantity'] = trade['quantity']
+        return e
+
+    def request_trigger(self, kite, trade, trigger):
+        """
+        Records the desired SL trigger for a LIVE trade. Never touches the broker itself.
+        Outside the leader the new 'sl' on the (journaled) trade is the request: its reconcile() sends it.
+        """
+        if trade.get('mode') != 'LIVE' or not trade.get('sl_order_id'):
+            return False
+        if not self._owner:
+            return True
+        with self._lock:
+            e = self._entry(trade)
+            e['desired'] = float(trigger)
+            e['errors'] = 0
+        self._kite = kite
+        self._start()
+        self._wake.set()
+        return True
+
+    def note_quantity(self, trade, quantity):
+        """
+        A quantity modify done elsewhere also counts towards the order's cap. Call with TRADE_LOCK held:
+        the count is kept on the trade record, so the leader sees modifies made by any worker.
+        """
+        trade['sl_mods'] = trade.get('sl_mods', 0) + 1
+        with self._lock:
+            e = self._entries.get(str(trade.get('id')))
+            if e:
+                e['quantity'] = quantity
+                e['mods'] = max(e['mods'] + 1, trade['sl_mods'])
+
+    def reconcile(self, kite, trades):
+        """
+        Leader's risk loop (TRADE_LOCK held): makes this instance the one that sends modifies and
+        picks up SL levels / modify counts changed by other workers. Trades no longer active are dropped.
+        """
+        self._owner = True
+        self._kite = kite
+        live = {}
+        wake = False
+        with self._lock:
+            for t in trades:
+                if t.get('mode') != 'LIVE' or not t.get('sl_order_id') or t.get('status') == 'PENDING':
+                    continue
+                e = self._entry(t)
+                live[str(t['id'])] = e
+                e['mods'] = max(e['mods'], t.get('sl_mods', 0))
+                if t.get('sl') is not None and float(t['sl']) != e['desired']:
+                    e['desired'] = float(t['sl'])
+                    e['errors'] = 0
+                    wake = True
+            stale = [t_id for t_id in self._entries if t_id not in live]
+        for t_id in stale:
+            self.forget(t_id)
+        if wake:
+            self._start()
+            self._wake.set()
+
+    def forget(self, trade_id):
+        """
+        Stops syncing a trade (exit). Waits for an in-flight modify/replace to finish and
+        returns the broker SL order ID that is live now (None if unknown).
+        """
+        with self._lock:
+            e = self._entries.pop(str(trade_id), None)
+        if not e:
+            return None
+        with e['op_lock']:
+            e['closed'] = True
+            return e['order_id']
+
+    def pending(self):
+        with self._lock:
+            return {t_id: {'desired': e['desired'], 'sent': e['sent'], 'mods': e['mods'], 'inflight': e['inflight']}
+                    for t_id, e in self._entries.items() if e['desired'] != e['sent']}
+
+    def _start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="sl-sync-loop", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(SL_MODIFY_INTERVAL)
+            self._wake.clear()
+            now = time.time()
+            due = []
+            with self._lock:
+                for t_id, e in self._entries.items():
+                    if e['closed'] or e['inflight']: continue
+                    if e['desired'] is None or (e['desired'] == e['sent'] and not e['needs_place']): continue
+                    if now - e['last_sent_at'] < SL_MODIFY_INTERVAL: continue
+                    e['inflight'] = True
+                    due.append((t_id, e, e['desired']))
+            for t_id, e, trigger in due:
+                self._pool.submit(self._apply, t_id, e, trigger)
+
+    def _apply(self, t_id, e, trigger):
+        kite = self._kite
+        replaced_id = None
+        synced = False
+        try:
+            with e['op_lock']:
+                if e['closed']: return
+                try:
+                    if e['needs_place'] or e['mods'] >= SL_MODIFY_CAP - SL_REPLACE_MARGIN:
+                        replaced_id = self._replace(kite, e, trigger)
+                    else:
+                        ORDER_BUCKET.acquire()
+                        kite.modify_order(variety=kite.VARIETY_REGULAR, order_id=e['order_id'], trigger_price=trigger)
+                        e['mods'] += 1
+                    e['sent'] = trigger
+                    e['errors'] = 0
+                    synced = True
+                    session_health.mark_ok("order")
+                except Exception as ex:
+                    e['errors'] += 1
+                    session_health.mark_error(ex, "order")
+                    print(f"⚠️ Broker SL Sync Failed ({e['symbol']} -> {trigger}): {ex}")
+                    if e['errors'] >= SL_MAX_ERRORS and not e['needs_place']:
+                        # Give up on this value (e.g. SL already executed); a new request re-arms it
+                        e['sent'] = trigger
+        finally:
+            e['last_sent_at'] = time.time()
+            e['inflight'] = False
+
+        # Write the broker state back outside op_lock (TRADE_LOCK may be held by the risk loop)
+        if synced and not e['closed']:
+            fields = {'sl_trigger': trigger, 'sl_mods': e['mods']}
+            if replaced_id: fields['sl_order_id'] = replaced_id
+            app = get_flask_app()
+            if app:
+                with app.app_context():
+                    update_trade_fields(t_id, **fields)
+
+    def _replace(self, kite, e, trigger):
+        """
+        Cancel-and-replace near the modification cap. If the new order fails after the
+        cancel, 'needs_place' makes the next pass place it again.
+        """
+        if not e['needs_place']:
+            ORDER_BUCKET.acquire()
+            kite.cancel_order(variety=kite.VARIETY_REGULAR, order_id=e['order_id'])
+            e['needs_place'] = True
+            print(f"🔁 Broker SL {e['order_id']} ({e['symbol']}) near modify cap, replacing")
+
+        ORDER_BUCKET.acquire()
+        new_id = kite.place_order(
+            variety=kite.VARIETY_REGULAR,
+            exchange=e['exchange'],
+            tradingsymbol=e['symbol'],
+            transaction_type=kite.TRANSACTION_TYPE_SELL,
+            quantity=e['quantity'],
+            order_type=kite.ORDER_TYPE_SLM,
+            product=kite.PRODUCT_MIS,
+            trigger_price=trigger,
+            tag="RD_SL"
+        )
+        e['order_id'] = new_id
+        e['known_ids'].add(new_id)
+        order_consumer.register(new_id, e['trade_id'])
+        e['needs_place'] = False
+        e['mods'] = 0
+        return new_id
+
+sl_sync = BrokerSLSync()
+
+def _timed_order_call(label, symbol, func, bucket, **kwargs):
+    """
+    Runs one broker call under the order rate limit and returns its report row.
+    """
+    bucket.acquire()
+    start = time.perf_counter()
+    row = {"action": label, "symbol": symbol, "ok": True, "order_id": None, "error": None}
+    try:
+        row["order_id"] = func(**kwargs)
+        session_health.mark_ok("order")
+    except Exception as e:
+        row["ok"] = False
+        row["error"] = str(e)
+        session_health.mark_error(e, "order")
+    row["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return row
+
+def _panic_symbol(kite, trades, bucket):
+    """
+    Exits every trade of one symbol: all SL cancels first, then the market sells,
+    so a resting SL can never fill after the position is already closed.
+    """
+    rows = []
+    for t in trades:
+        synced_id = sl_sync.forget(t.get('id'))
+        if synced_id: t['sl_order_id'] = synced_id
+        if not t.get('sl_order_id'): continue
+        row = _timed_order_call("CANCEL_SL", t['symbol'], kite.cancel_order, bucket, variety=kite.VARIETY_REGULAR, order_id=t['sl_order_id'])
+        if row["ok"]:
+            log_event(t, f"Broker SL Cancelled (ID: {t['sl_order_id']})")
+            t['sl_order_id'] = None
+        else:
+            log_event(t, f"⚠️ Broker SL Update Failed: {row['error']}")
+        rows.append(row)
+
+    for t in trades:
+        # Already flat at the broker (SL filled): nothing left to sell
+        if t.get('sl_filled'): continue
+        row = _timed_order_call(
+            "EXIT", t['symbol'], kite.place_order, bucket,
+            variety=kite.VARIETY_REGULAR,
+            exchange=t.get('exchange') or smart_trader.get_exchange_name(t['symbol']),
+            tradingsymbol=t['symbol'],
+            transaction_type=kite.TRANSACTION_TYPE_SELL,
+            quantity=t['quantity'],
+            order_type=kite.ORDER_TYPE_MARKET,
+            product=kite.PRODUCT_MIS,
+            tag="PANIC_EXIT"
+        )
+        if row["ok"]:
+            track_order(t, row["order_id"], "EXIT", t['quantity'])
+        else:
+            print(f"Panic Broker Fail {t['symbol']}: {row['error']}")
+        rows.append(row)
+    return rows
+
+def execute_panic_orders(kite, trades, workers=PANIC_WORKERS, bucket=None):
+    """
+    Fires SL cancels and exit orders for LIVE trades concurrently (one job per symbol)
+    under the shared order rate limit. Returns a report with per-order latency and failures.
+    """
+    bucket = bucket or ORDER_BUCKET
+    by_symbol = {}
+    for t in trades:
+        by_symbol.setdefault(t['symbol'], []).append(t)
+
+    start = time.perf_counter()
+    rows = []
+    if by_symbol:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(by_symbol)))) as pool:
+            for result in pool.map(lambda items: _panic_symbol(kite, items, bucket), by_symbol.values()):
+                rows.extend(result)
+
+    latencies = [r["latency_ms"] for r in rows]
+    return {
+        "orders": len(rows),
+        "failed": [r for r in rows if not r["ok"]],
+        "wall_ms": round((time.perf_counter() - start) * 1000, 1),
+        "max_latency_ms": max(latencies) if latencies else 0,
+        "avg_latency_ms": round(sum(latencies) / len(latencies), 1) if latencies else 0,
+        "results": rows
+    }
+
 def panic_exit_all(kite):
     """
     Emergency Function: Immediately closes all active positions.
-    1. Cancels pending Broker SL orders.
-    2. Places Market Sell orders for all open quantities.
+    1. Cancels pending Broker SL orders (before the sell of the same symbol).
+    2. Places Market Sell orders for all open quantities, concurrently across symbols.
     3. Moves all trades to history with status 'PANIC_EXIT'.
+    Returns the order report (truthy), or True when there was nothing to close.
     """
     with TRADE_LOCK:
         trades = load_trades()
@@ -114,29 +443,16 @@ def panic_exit_all(kite):
             
         print(f"🚨 PANIC MODE TRIGGERED: Closing {len(trades)} positions.")
         
+        # Handle LIVE trades on the broker side
+        live = [t for t in trades if t['mode'] == "LIVE" and t['status'] != 'PENDING']
+        report = execute_panic_orders(kite, live)
+        if live:
+            print(f"🚨 PANIC ORDERS: {report['orders']} sent in {report['wall_ms']}ms "
+                  f"(avg {report['avg_latency_ms']}ms, max {report['max_latency_ms']}ms), {len(report['failed'])} failed")
+            for r in report['failed']:
+                print(f"   ❌ {r['action']} {r['symbol']}: {r['error']}")
+        
         for t in trades:
-            # Handle LIVE trades on the broker side
-            if t['mode'] == "LIVE" and t['status'] != 'PENDING':
-                # First, cancel the protection SL to avoid double execution
-                manage_broker_sl(kite, t, cancel_completely=True)
-                
-                # Then place the exit order
-                try: 
-                    place_order(
-                        kite,
-                        symbol=t['symbol'], 
-                        exchange=t['exchange'], 
-                        transaction_type=kite.TRANSACTION_TYPE_SELL, 
-                        quantity=t['quantity'], 
-                        order_type=kite.ORDER_TYPE_MARKET, 
-                        product=kite.PRODUCT_MIS,
-                        tag="PANIC_EXIT"
-                    )
-                    # [UPDATED] Sleep 0.2s to prevent 'Rate Limit Exceeded' during mass exit
-                    time.sleep(0.2)
-                except Exception as e: 
-                    print(f"Panic Broker Fail {t['symbol']}: {e}")
-            
             # Move to internal history
             # Use current_ltp if available, else fallback to entry (neutral exit logic for panic if data missing)
             exit_p = t.get('current_ltp', t['entry_price'])
@@ -144,4 +460,4 @@ def panic_exit_all(kite):
         
         # Clear active trades list
         save_trades([])
-        return True
+        return report
@@ -1,7 +1,8 @@
+import sys
 import pytz
 from datetime import datetime
 import settings
-from managers.persistence import load_history, load_trades
+from managers.persistence import load_trades, get_todays_realized_pnl
 
 # Global Timezone
 IST = pytz.timezone('Asia/Kolkata')
@@ -13,6 +14,25 @@ def get_time_str():
     """
     return datetime.now(IST).strftime("%Y-%m-%d %H:%M:%S")
 
+def get_flask_app():
+    """
+    Locates the Flask app instance so background threads can open an app context
+    for database work.
+    """
+    # 1. Try finding 'app' in __main__ (Run as script)
+    if '__main__' in sys.modules and hasattr(sys.modules['__main__'], 'app'):
+        return sys.modules['__main__'].app
+    
+    # 2. Try importing 'main' (Run as module/gunicorn)
+    try:
+        import main
+        if hasattr(main, 'app'):
+            return main.app
+    except ImportError:
+        pass
+    
+    return None
+
 def log_event(trade, message):
     """
     Appends a timestamped message to the trade's log list.
@@ -44,15 +64,8 @@ def get_day_pnl(mode):
     1. Realized P&L from closed trades today.
     2. Unrealized P&L from currently active trades.
     """
-    today_str = datetime.now(IST).strftime("%Y-%m-%d")
-    total = 0.0
-    
-    # 1. Sum Realized P&L from History
-    history = load_history()
-    for t in history:
-        # Check if exit_time exists and matches today
-        if t.get('exit_time') and t['exit_time'].startswith(today_str) and t['mode'] == mode:
-            total += t.get('pnl', 0)
+    # 1. Sum Realized P&L from History (cached per mode until the history changes)
+    total = get_todays_realized_pnl(mode)
             
     # 2. Sum Unrealized P&L from Active Trades
     active = load_trades()
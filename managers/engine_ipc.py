@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import socket
+import threading
+from collections import deque
+import config
+
+class LoopStats:
+    """Risk loop iteration times (last 'window' iterations) for latency percentiles."""
+    def __init__(self, window=1200):
+        self._times = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.iterations = 0
+        self.last_at = None
+
+    def record(self, seconds):
+        with self._lock:
+            self._times.append(seconds)
+            self.iterations += 1
+            self.last_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            times = sorted(self._times)
+            iterations, last_at = self.iterations, self.last_at
+        pct = lambda p: round(times[min(int(len(times) * p), len(times) - 1)] * 1000, 2) if times else None
+        return {
+            "iterations": iterations,
+            "last_age": round(time.time() - last_at, 1) if last_at else None,
+            "p50_ms": pct(0.5), "p90_ms": pct(0.9), "p99_ms": pct(0.99),
+            "max_ms": round(times[-1] * 1000, 2) if times else None,
+        }
+
+class EngineServer:
+    """
+    Engine side of the IPC channel: JSON lines over a Unix socket (one request line -> one reply line).
+    Handlers run in the connection's thread inside an app context, so they must be quick.
+    """
+    def __init__(self, path, handlers):
+        self.path = path
+        self.handlers = handlers
+        self._sock = None
+
+    def start(self, app):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)   # stale socket of a previous engine (we hold the leader lock)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        os.chmod(self.path, 0o600)   # commands: local clients of this user only
+        self._sock.listen(16)
+        threading.Thread(target=self._accept_loop, args=(app,), name="engine-ipc", daemon=True).start()
+        print(f"🔌 Engine IPC listening on {self.path}")
+
+    def _accept_loop(self, app):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return   # closed
+            threading.Thread(target=self._serve, args=(conn, app), daemon=True).start()
+
+    def _serve(self, conn, app):
+        with conn, conn.makefile("rwb") as f:
+            for line in f:
+                try:
+                    req = json.loads(line)
+                    handler = self.handlers[req.pop("cmd")]
+                    with app.app_context():
+                        reply = {"ok": True, "result": handler(**req)}
+                except Exception as e:
+                    reply = {"ok": False, "error": str(e)}
+                try:
+                    f.write(json.dumps(reply).encode() + b"\n")
+                    f.flush()
+                except OSError:
+                    return
+
+    def stop(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class EngineClient:
+    """
+    Web-tier side: one persistent connection per thread, reconnected on failure.
+    call() returns None when the engine is unreachable (callers fall back to the shared store).
+    """
+    def __init__(self, path, timeout=2.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._snapshot = (0, None)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        self._local.sock = sock
+        self._local.file = sock.makefile("rwb")
+        return self._local.file
+
+    def _close(self):
+        for attr in ("file", "sock"):
+            obj = getattr(self._local, attr, None)
+            if obj is not None:
+                try:
+                    obj.close()
+                except OSError:
+                    pass
+                setattr(self._local, attr, None)
+
+    def call(self, cmd, **args):
+        line = json.dumps(dict(args, cmd=cmd)).encode() + b"\n"
+        for attempt in (1, 2):   # second try on a fresh connection (engine restarted)
+            try:
+                f = getattr(self._local, "file", None) or self._connect()
+                f.write(line)
+                f.flush()
+                raw = f.readline()
+                if not raw:
+                    raise ConnectionError("engine closed the connection")
+                reply = json.loads(raw)
+                if not reply.get("ok"):
+                    print(f"⚠️ Engine IPC '{cmd}' Error: {reply.get('error')}")
+                    return None
+                return reply.get("result")
+            except (OSError, ValueError) as e:
+                self._close()
+                if attempt == 2:
+                    print(f"⚠️ Engine IPC Unreachable ({cmd}): {e}")
+        return None
+
+    def snapshot(self, max_age=0.5):
+        """Engine state, cached for max_age seconds per process (read before every request)."""
+        read_at, snap = self._snapshot
+        if time.time() - read_at < max_age:
+            return snap
+        snap = self.call("snapshot")
+        self._snapshot = (time.time(), snap)
+        return snap
+
+# Singleton Instances
+loop_stats = LoopStats()
+client = EngineClient(config.ENGINE_SOCKET)
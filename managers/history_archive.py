@@ -0,0 +1,238 @@
+import os
+import io
+import copy
+import json
+import gzip
+import threading
+from collections import OrderedDict
+import config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CACHE_MONTHS = 3   # decoded archive months kept in memory (archives only change when a month is appended)
+
+class HistoryArchive:
+    """
+    Cold storage for closed trades: one compressed JSON-lines file per exit month
+    (history-YYYY-MM.jsonl.zst with zstandard installed, else .jsonl.gz).
+    - write_month() merges into the month's file (by trade id) and replaces it atomically,
+      so an archival run interrupted before the DB delete can simply run again.
+    - Reads decode whole months (small) and keep the last few in an LRU cache.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._cache = OrderedDict()   # path -> (mtime, trades)
+        self._ids = None              # trade_id -> month, rebuilt when the archive files change
+        self._ids_signature = None    # _signature() the id map was built from
+
+    # --- Files ---
+    def _path(self, month, ext=None):
+        if ext is None:
+            ext = ".jsonl.zst" if zstandard else ".jsonl.gz"
+        return os.path.join(self.directory, f"history-{month}{ext}")
+
+    def _existing_path(self, month):
+        for ext in (".jsonl.zst", ".jsonl.gz"):
+            path = self._path(month, ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def months(self):
+        """Archived months ('YYYY-MM'), oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        found = set()
+        for name in os.listdir(self.directory):
+            if name.startswith("history-") and (name.endswith(".jsonl.zst") or name.endswith(".jsonl.gz")):
+                found.add(name[len("history-"):len("history-") + 7])
+        return sorted(found)
+
+    def _decode(self, path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError(f"zstandard is not installed, cannot read {os.path.basename(path)}")
+            raw = zstandard.ZstdDecompressor().decompress(raw)
+        else:
+            raw = gzip.decompress(raw)
+        return [json.loads(line) for line in raw.decode("utf-8").splitlines() if line]
+
+    def _encode(self, trades):
+        raw = "".join(json.dumps(t) + "\n" for t in trades).encode("utf-8")
+        if zstandard:
+            return zstandard.ZstdCompressor(level=10).compress(raw)
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=6, mtime=0) as gz:
+            gz.write(raw)
+        return buf.getvalue()
+
+    # --- Reads ---
+    def _load_month(self, month):
+        """Decoded month (cached, newest id first). Raises on a missing codec or a corrupt file."""
+        path = self._existing_path(month)
+        if path is None:
+            return []
+        mtime = os.path.getmtime(path)
+        cached = self._cache.get(path)
+        if cached and cached[0] == mtime:
+            self._cache.move_to_end(path)
+            return cached[1]
+        trades = self._decode(path)
+        trades.sort(key=lambda t: t['id'], reverse=True)
+        self._cache[path] = (mtime, trades)
+        while len(self._cache) > CACHE_MONTHS:
+            self._cache.popitem(last=False)
+        return trades
+
+    def _cached_month(self, month):
+        """Like _load_month(), but an unreadable month reads as empty. Shared cache: never mutate."""
+        with self._lock:
+            try:
+                return self._load_month(month)
+            except Exception as e:
+                print(f"❌ History Archive Read Error ({month}): {e}")
+                return []
+
+    def read_month(self, month):
+        """Trades archived for one exit month (newest id first), as copies the caller may change."""
+        return copy.deepcopy(self._cached_month(month))
+
+    def query(self, start=None, end=None, strict=False):
+        """
+        Archived trades with start <= exit date <= end ('YYYY-MM-DD', either may be None), as copies.
+        strict: raise on an unreadable month instead of skipping it.
+        """
+        result = []
+        for month in self.months():
+            if (start and month < start[:7]) or (end and month > end[:7]):
+                continue
+            if strict:
+                with self._lock:
+                    trades = self._load_month(month)
+            else:
+                trades = self._cached_month(month)
+            for t in trades:
+                day = str(t.get('exit_time', ''))[:10]
+                if (start and day < start) or (end and day > end):
+                    continue
+                result.append(copy.deepcopy(t))
+        return result
+
+    def iter_query(self, start=None, end=None):
+        """Like query(), but streams each month's file line by line, uncached (exports)."""
+        for month in self.months():
+            if (start and month < start[:7]) or (end and month > end[:7]):
+                continue
+            path = self._existing_path(month)
+            if path is None:
+                continue
+            try:
+                if path.endswith(".zst"):
+                    if zstandard is None:
+                        raise RuntimeError(f"zstandard is not installed, cannot read {os.path.basename(path)}")
+                    raw = open(path, "rb")
+                    stream = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw), encoding="utf-8")
+                else:
+                    raw = None
+                    stream = gzip.open(path, "rt", encoding="utf-8")
+            except Exception as e:
+                print(f"❌ History Archive Read Error ({month}): {e}")
+                continue
+            try:
+                for line in stream:
+                    if not line.strip():
+                        continue
+                    t = json.loads(line)
+                    day = str(t.get('exit_time', ''))[:10]
+                    if (start and day < start) or (end and day > end):
+                        continue
+                    yield t
+            finally:
+                stream.close()
+                if raw: raw.close()
+
+    def _signature(self):
+        """(month, mtime) of every archive file: changes when any process adds or rewrites a month."""
+        signature = []
+        for month in self.months():
+            path = self._existing_path(month)
+            try:
+                signature.append((month, os.stat(path).st_mtime_ns))
+            except (OSError, TypeError):
+                continue   # removed while listing
+        return tuple(signature)
+
+    def month_version(self, month):
+        """Changes whenever the month's file is rewritten (by any process). None if not archived."""
+        path = self._existing_path(month)
+        try:
+            return os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            return None
+
+    def find_trade(self, trade_id):
+        with self._lock:
+            signature = self._signature()
+            if self._ids is None or signature != self._ids_signature:
+                self._ids = {t['id']: m for m in self.months() for t in self._cached_month(m)}
+                self._ids_signature = signature
+            month = self._ids.get(int(trade_id))
+        if month is None:
+            return None
+        found = next((t for t in self._cached_month(month) if t['id'] == int(trade_id)), None)
+        return copy.deepcopy(found)
+
+    # --- Writes ---
+    def write_month(self, month, trades):
+        """Merges 'trades' into the month's archive (same id: the new record wins)."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # Strict read of the file itself (not the shared cache): an unreadable month must abort
+            # the run, never be overwritten with 'trades' only
+            path = self._existing_path(month)
+            merged = {t['id']: t for t in (self._decode(path) if path else [])}
+            merged.update({t['id']: t for t in trades})
+            self._replace(month, sorted(merged.values(), key=lambda t: t['id'], reverse=True))
+            if self._ids is not None:
+                self._ids.update({t['id']: month for t in trades})
+
+    def delete_trade(self, trade_id):
+        """Removes an archived trade. Returns True if it was found."""
+        t_id = int(trade_id)
+        with self._lock:
+            for month in reversed(self.months()):
+                trades = self._cached_month(month)
+                if any(t['id'] == t_id for t in trades):
+                    self._replace(month, [t for t in trades if t['id'] != t_id])
+                    if self._ids is not None:
+                        self._ids.pop(t_id, None)
+                    return True
+        return False
+
+    def _replace(self, month, trades):
+        old_path = self._existing_path(month)
+        path = self._path(month)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self._encode(trades))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        if old_path and old_path != path:
+            os.remove(old_path)
+        for p in (old_path, path):
+            self._cache.pop(p, None)
+
+    def stats(self):
+        months = self.months()
+        size = sum(os.path.getsize(self._existing_path(m)) for m in months)
+        return {"months": len(months), "oldest": months[0] if months else None, "bytes": size, "codec": "zstd" if zstandard else "gzip"}
+
+# Singleton Instance
+archive = HistoryArchive(config.HISTORY_ARCHIVE_DIR)
@@ -0,0 +1,143 @@
+import io
+import csv
+from database import TradeHistory
+from managers.persistence import history_record
+from managers.history_archive import archive as history_archive
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+CHUNK_SIZE = 500   # rows per DB fetch / CSV write / Parquet row group
+
+# Flattened export columns: (name, arrow type)
+COLUMNS = [
+    ("id", "int64"), ("entry_time", "string"), ("exit_time", "string"), ("mode", "string"),
+    ("symbol", "string"), ("exchange", "string"), ("order_type", "string"), ("quantity", "int64"),
+    ("entry_price", "float64"), ("exit_price", "float64"), ("sl", "float64"), ("original_sl", "float64"),
+    ("t1", "float64"), ("t2", "float64"), ("t3", "float64"), ("targets_hit", "string"), ("targets_hit_count", "int64"),
+    ("trailing_sl", "float64"), ("highest_ltp", "float64"), ("made_high", "float64"), ("virtual_sl_hit", "bool_"),
+    ("pnl", "float64"), ("pnl_source", "string"), ("exit_type", "string"),
+]
+
+def _num(value, cast=float):
+    try:
+        return cast(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+def flatten(t):
+    """One closed trade as a flat row (lists and nested fields expanded, logs dropped)."""
+    targets = list(t.get('targets') or [])[:3]
+    targets += [None] * (3 - len(targets))
+    hits = sorted(t.get('targets_hit_indices') or [])
+    return {
+        "id": _num(t.get('id'), int), "entry_time": t.get('entry_time'), "exit_time": t.get('exit_time'),
+        "mode": t.get('mode'), "symbol": t.get('symbol'), "exchange": t.get('exchange'), "order_type": t.get('order_type'),
+        "quantity": _num(t.get('quantity'), int), "entry_price": _num(t.get('entry_price')), "exit_price": _num(t.get('exit_price')),
+        "sl": _num(t.get('sl')), "original_sl": _num(t.get('original_sl')),
+        "t1": _num(targets[0]), "t2": _num(targets[1]), "t3": _num(targets[2]),
+        "targets_hit": "|".join(f"T{i + 1}" for i in hits), "targets_hit_count": len(hits),
+        "trailing_sl": _num(t.get('trailing_sl')), "highest_ltp": _num(t.get('highest_ltp')), "made_high": _num(t.get('made_high')),
+        "virtual_sl_hit": bool(t.get('virtual_sl_hit', False)),
+        "pnl": _num(t.get('pnl')), "pnl_source": t.get('pnl_source'), "exit_type": t.get('exit_type', t.get('status')),
+    }
+
+def iter_history(start=None, end=None, mode=None, symbol=None, chunk_size=CHUNK_SIZE):
+    """
+    Closed trades (archive first, then the hot table) as lists of at most chunk_size flat rows.
+    The hot table is read through a server-side cursor, and archive files are decoded line by line,
+    so memory stays bounded by one chunk. Filters: exit date range ('YYYY-MM-DD'), mode, symbol prefix.
+    """
+    def wanted(t):
+        return (not mode or t.get('mode') == mode) and (not symbol or str(t.get('symbol', '')).startswith(symbol))
+
+    query = TradeHistory.query
+    if start: query = query.filter(TradeHistory.exit_time >= start)
+    if end: query = query.filter(TradeHistory.exit_time <= f"{end} 23:59:59")
+    if mode: query = query.filter(TradeHistory.mode == mode)
+    if symbol: query = query.filter(TradeHistory.symbol.like(f"{symbol}%"))
+
+    def archived_rows(batch):
+        # Rows still in the hot table win over an archived copy (interrupted archival run):
+        # one id IN (...) lookup per chunk, never the whole id set
+        ids = [t['id'] for t in batch]
+        hot = {i for (i,) in query.filter(TradeHistory.id.in_(ids)).with_entities(TradeHistory.id)}
+        return [flatten(t) for t in batch if t['id'] not in hot]
+
+    batch = []
+    for t in history_archive.iter_query(start, end):
+        if wanted(t):
+            batch.append(t)
+            if len(batch) >= chunk_size:
+                rows = archived_rows(batch)
+                batch = []
+                if rows: yield rows
+    chunk = archived_rows(batch) if batch else []
+
+    for rec in query.order_by(TradeHistory.id).execution_options(stream_results=True).yield_per(chunk_size):
+        chunk.append(flatten(history_record(rec)))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def stream_csv(**filters):
+    """CSV text chunks: the header, then one block per chunk of rows."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=[name for name, _ in COLUMNS])
+    writer.writeheader()
+    yield buf.getvalue()
+    for rows in iter_history(**filters):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue()
+
+class _Drain(io.RawIOBase):
+    """Write-only sink that hands the bytes written so far to the caller (Parquet streaming)."""
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        out = b"".join(self._parts)
+        self._parts = []
+        return out
+
+def stream_parquet(**filters):
+    """Parquet bytes: one row group per chunk, flushed as soon as it is written. Needs pyarrow."""
+    if pyarrow is None:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+    schema = pyarrow.schema([(name, getattr(pyarrow, kind)()) for name, kind in COLUMNS])
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for rows in iter_history(**filters):
+            writer.write_table(pyarrow.Table.from_pylist(rows, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+FORMATS = {
+    "csv": (stream_csv, "text/csv"),
+    "parquet": (stream_parquet, "application/vnd.apache.parquet"),
+}
+
+def available(fmt):
+    return fmt == "csv" or (fmt == "parquet" and pyarrow is not None)
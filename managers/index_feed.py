@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import threading
+import config
+import settings
+import smart_trader
+from database import db
+
+WATCHLIST_REFRESH = 30   # seconds between watchlist re-reads from settings
+
+class IndexFeed:
+    """
+    One background poller (in the leader / engine process) quotes the indices and the watchlist every
+    'interval' seconds in a single kite.quote() call and publishes the result. API handlers read the
+    snapshot instead of calling the broker, so quote traffic does not grow with open dashboards.
+    The snapshot is mirrored to RUN_DIR/indices.json for the other workers (re-read only when it changes).
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self._path = os.path.join(config.RUN_DIR, "indices.json")
+        self._lock = threading.Lock()
+        self._snapshot = {"indices": {name: 0 for name in smart_trader.MAIN_INDICES}, "watchlist": {}, "updated_at": None}
+        self._file_mtime = None
+        self._thread = None
+        self._watchlist = []
+        self.errors = 0
+
+    def start(self, app, kite, is_active):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, args=(app, kite, is_active), name="index-feed", daemon=True)
+            self._thread.start()
+
+    def _run(self, app, kite, is_active):
+        watch_at = 0
+        while True:
+            started = time.time()
+            try:
+                if is_active():
+                    if started - watch_at > WATCHLIST_REFRESH:
+                        with app.app_context():
+                            try:
+                                self._watchlist = settings.load_settings().get("watchlist", [])
+                            finally:
+                                db.session.remove()
+                        watch_at = started
+                    self.refresh(kite)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ Index Feed Error: {e}")
+            time.sleep(max(self.interval - (time.time() - started), 0.05))
+
+    def refresh(self, kite):
+        """Quotes indices + watchlist in one call and publishes the snapshot."""
+        watch_keys = {name: smart_trader.get_quote_key(name) for name in self._watchlist}
+        keys = list(dict.fromkeys([*smart_trader.MAIN_INDICES.values(), *watch_keys.values()]))
+        q = kite.quote(keys) or {}
+        ltp = lambda key: q.get(key, {}).get('last_price', 0)
+        snap = {
+            "indices": {name: ltp(key) for name, key in smart_trader.MAIN_INDICES.items()},
+            "watchlist": {name: ltp(key) for name, key in watch_keys.items()},
+            "updated_at": time.time(),
+        }
+        with self._lock:
+            self._snapshot = snap
+        self._write(snap)
+
+    def _write(self, snap):
+        os.makedirs(config.RUN_DIR, exist_ok=True)
+        tmp = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(snap, f)
+        os.replace(tmp, self._path)
+
+    def snapshot(self):
+        """Latest published snapshot (plus its age in seconds)."""
+        if not (self._thread and self._thread.is_alive()):
+            self._read_file()
+        with self._lock:
+            snap = self._snapshot
+        updated = snap.get("updated_at")
+        return dict(snap, age=round(time.time() - updated, 1) if updated else None)
+
+    def _read_file(self):
+        try:
+            mtime = os.path.getmtime(self._path)
+        except OSError:
+            return
+        if mtime == self._file_mtime:
+            return
+        try:
+            with open(self._path) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            return   # mid-replace / partial: keep the previous snapshot
+        with self._lock:
+            self._snapshot = snap
+            self._file_mtime = mtime
+
+# Singleton Instance
+feed = IndexFeed(config.INDEX_REFRESH_SECONDS)
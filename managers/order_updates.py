@@ -0,0 +1,282 @@
+import time
+import queue
+import hmac
+import hashlib
+import threading
+from datetime import datetime
+import config
+from database import db, TradeHistory
+from managers.persistence import TRADE_LOCK, load_trades, invalidate_realized_pnl, journal_trades, commit_journal, history_record, write_history_record
+from managers.common import IST, log_event
+from managers.session_health import health as session_health
+from managers.trade_index import index as trade_index
+
+RECONCILE_INTERVAL = 30    # seconds between batched kite.orders() reconciliations
+BATCH_SIZE = 100
+TERMINAL_STATUSES = ["COMPLETE", "CANCELLED", "REJECTED"]
+EXIT_ROLES = ["EXIT", "SL"]
+
+def track_order(trade, order_id, role, quantity):
+    """
+    Records a broker order on the trade ('broker_orders') so fills can be matched later.
+    role: ENTRY / SL / EXIT. Call with TRADE_LOCK held (the trade is a cached dict).
+    """
+    if not order_id: return
+    trade.setdefault('broker_orders', []).append({
+        "order_id": str(order_id), "role": role, "qty": quantity,
+        "status": "PLACED", "filled": 0, "avg": 0
+    })
+    if role == "SL":
+        # A fresh SL-M rests at the trade's SL: the leader's sl_sync starts from here (see BrokerSLSync)
+        trade['sl_trigger'] = trade.get('sl')
+        trade['sl_mods'] = 0
+    consumer.register(order_id, trade['id'])
+
+def _fill_avg(orders, roles):
+    qty = sum(o['filled'] for o in orders if o['role'] in roles and o['filled'])
+    if not qty: return 0, 0
+    return sum(o['filled'] * o['avg'] for o in orders if o['role'] in roles and o['filled']) / qty, qty
+
+def apply_order_update(trade, order, is_active):
+    """
+    Applies one broker order snapshot (Kite order dict) to a trade.
+    Returns True if the trade changed.
+    """
+    order_id = str(order.get('order_id'))
+    orders = trade.setdefault('broker_orders', [])
+    rec = next((o for o in orders if o['order_id'] == order_id), None)
+    if rec is None:
+        role = "SL" if str(trade.get('sl_order_id')) == order_id else ("EXIT" if order.get('transaction_type') == "SELL" else "ENTRY")
+        rec = {"order_id": order_id, "role": role, "qty": order.get('quantity'), "status": "PLACED", "filled": 0, "avg": 0}
+        orders.append(rec)
+
+    status = order.get('status')
+    filled = int(order.get('filled_quantity') or 0)
+    avg = float(order.get('average_price') or 0)
+    if rec['status'] == status and rec['filled'] == filled:
+        return False
+
+    rec.update({"status": status, "filled": filled, "avg": avg})
+
+    if status == "REJECTED":
+        log_event(trade, f"⚠️ Broker {rec['role']} Order {order_id} Rejected: {order.get('status_message')}")
+    elif status == "COMPLETE" and rec['role'] == "ENTRY":
+        entry_avg, _ = _fill_avg(orders, ["ENTRY"])
+        if entry_avg and round(entry_avg, 2) != trade.get('entry_price'):
+            log_event(trade, f"Entry Filled @ {entry_avg:.2f} (Est. {trade.get('entry_price')})")
+            trade['entry_price'] = round(entry_avg, 2)
+    elif status == "COMPLETE" and rec['role'] == "SL":
+        log_event(trade, f"Broker SL Executed @ {avg} (ID: {order_id})")
+        trade['sl_order_id'] = None
+        # The position is already flat at the broker: the risk loop closes it without a new sell
+        if is_active: trade['sl_filled'] = True
+    elif status == "COMPLETE":
+        log_event(trade, f"Exit Filled {filled} @ {avg} (ID: {order_id})")
+
+    if not is_active:
+        settle_from_fills(trade)
+    return True
+
+def settle_from_fills(trade):
+    """
+    Closed trade: replaces the estimated P/L (LTP / SL level) with the realized P/L of the
+    actual fills, including partial exits, once every exit order is final.
+    Returns True if the trade was settled.
+    """
+    orders = trade.get('broker_orders') or []
+    pending_exits = [o for o in orders if o['role'] in EXIT_ROLES and o['status'] not in TERMINAL_STATUSES]
+    exit_avg, exit_qty = _fill_avg(orders, EXIT_ROLES)
+    if not exit_qty or pending_exits:
+        return False
+
+    entry_avg, _ = _fill_avg(orders, ["ENTRY"])
+    entry = entry_avg or trade.get('entry_price', 0)
+    pnl = round(sum((o['avg'] - entry) * o['filled'] for o in orders if o['role'] in EXIT_ROLES and o['filled']), 2)
+    if pnl != trade.get('pnl'):
+        log_event(trade, f"P/L Corrected From Fills: ₹ {pnl:.2f} (Was ₹ {float(trade.get('pnl') or 0):.2f})")
+    trade['pnl'] = pnl
+    trade['exit_price'] = round(exit_avg, 2)
+    trade['pnl_source'] = "BROKER"
+    return True
+
+class OrderUpdateConsumer:
+    """
+    Consumes broker order updates asynchronously and writes fills back to trades.
+    Sources: KiteTicker order updates, Kite postbacks (/api/postback) or the mock
+    broker's listener. A periodic batched kite.orders() call reconciles anything missed.
+    submit() never blocks; updates are applied in batches (one commit per batch).
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._index = {}        # order_id -> trade_id
+        self._lock = threading.Lock()
+        self._thread = None
+        self._kite = None
+        self._app = None
+        self._ticker = None
+        self._stream_token = None
+        self._last_reconcile = 0
+        self.stats = {"updates": 0, "applied": 0, "reconciles": 0}
+
+    def register(self, order_id, trade_id):
+        with self._lock:
+            self._index[str(order_id)] = trade_id
+
+    def submit(self, order):
+        if isinstance(order, dict) and order.get('order_id'):
+            self._queue.put(order)
+
+    def handle_postback(self, order):
+        """
+        Queued when this process runs the consumer (the leader); any other gunicorn worker
+        applies the update itself (under the cross-process TRADE_LOCK) instead of dropping it.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self.submit(order)
+        elif isinstance(order, dict) and order.get('order_id'):
+            self._apply_batch([order])
+
+    # --- Sources ---
+    def ensure_running(self, kite, app):
+        """
+        Cheap, called from the monitor loop. Starts the worker and the update source once.
+        """
+        self._kite = kite
+        self._app = app
+        if self._thread is None or not self._thread.is_alive():
+            with app.app_context():
+                self._rebuild_index()
+            self._thread = threading.Thread(target=self._loop, name="order-updates", daemon=True)
+            self._thread.start()
+
+        if hasattr(kite, "subscribe_order_updates"):
+            # Mock broker stand-in
+            if self._stream_token is None:
+                kite.subscribe_order_updates(self.submit)
+                self._stream_token = "mock"
+        elif config.ORDER_UPDATE_STREAM and kite.access_token and self._stream_token is None:
+            self._start_ticker(kite.access_token)
+
+    def _start_ticker(self, access_token):
+        try:
+            from kiteconnect import KiteTicker
+        except ImportError:
+            return
+        # The ticker's reactor cannot be restarted in-process; after a token change the
+        # postbacks and reconciliation keep fills flowing until the next restart.
+        self._stream_token = access_token
+        ticker = KiteTicker(config.API_KEY, access_token)
+        ticker.on_order_update = lambda ws, data: (session_health.mark_ok("tick"), self.submit(data))
+        ticker.on_connect = lambda ws, response: print("📡 Order Update Stream Connected")
+        ticker.on_error = lambda ws, code, reason: print(f"⚠️ Order Update Stream Error: {code} {reason}")
+        ticker.connect(threaded=True)
+        self._ticker = ticker
+
+    def verify_postback(self, data):
+        """Kite postback checksum: sha256(order_id + order_timestamp + api_secret)."""
+        if not config.API_SECRET: return False
+        raw = f"{data.get('order_id')}{data.get('order_timestamp')}{config.API_SECRET}"
+        return hmac.compare_digest(hashlib.sha256(raw.encode()).hexdigest(), str(data.get('checksum') or ''))
+
+    # --- Worker ---
+    def _rebuild_index(self):
+        """
+        After a restart: orders of active trades (and their live SL) are tracked again, plus the
+        still-open exit orders of trades closed today (possibly by another worker), so their fills
+        can settle the P/L.
+        """
+        for t in load_trades():
+            for o in t.get('broker_orders', []):
+                self.register(o['order_id'], t['id'])
+            if t.get('sl_order_id'):
+                self.register(t['sl_order_id'], t['id'])
+
+        today = datetime.now(IST).strftime("%Y-%m-%d")
+        for rec in TradeHistory.query.filter(TradeHistory.exit_time >= today).all():
+            t = history_record(rec)
+            orders = t.get('broker_orders') or []
+            if orders and not all(o['status'] in TERMINAL_STATUSES for o in orders):
+                for o in orders:
+                    self.register(o['order_id'], t['id'])
+
+    def _loop(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=1.0))
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            with self._app.app_context():
+                try:
+                    if batch:
+                        self._apply_batch(batch)
+                    if time.time() - self._last_reconcile > RECONCILE_INTERVAL:
+                        self._reconcile()
+                except Exception as e:
+                    print(f"❌ Order Update Error: {e}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def _reconcile(self):
+        """One kite.orders() call for every tracked order still open."""
+        self._last_reconcile = time.time()
+        # Orders placed by other workers are only known through the shared trade book
+        self._rebuild_index()
+        with self._lock:
+            if not self._index: return
+            tracked = set(self._index)
+        orders = self._kite.orders()
+        session_health.mark_ok("orders")
+        self.stats["reconciles"] += 1
+        self._apply_batch([o for o in orders if str(o.get('order_id')) in tracked])
+
+    def _apply_batch(self, updates):
+        self.stats["updates"] += len(updates)
+        with self._lock:
+            unknown = any(str(o.get('order_id')) not in self._index for o in updates)
+        if unknown:
+            self._rebuild_index()
+        by_trade = {}
+        with self._lock:
+            for o in updates:
+                trade_id = self._index.get(str(o.get('order_id')))
+                if trade_id is not None:
+                    by_trade.setdefault(str(trade_id), []).append(o)
+        if not by_trade: return
+
+        with TRADE_LOCK:
+            active = {str(t['id']): t for t in load_trades()}
+            changed = 0
+            changed_active = []
+            for trade_id, orders in by_trade.items():
+                trade = active.get(trade_id)
+                if trade is not None:
+                    if any([apply_order_update(trade, o, True) for o in orders]):
+                        changed_active.append(trade)
+                        # A fill (e.g. broker SL executed) needs a risk pass even if the price did not move
+                        trade_index.touch(trade)
+                        changed += 1
+                    continue
+
+                rec = TradeHistory.query.get(int(trade_id))
+                if not rec: continue
+                trade = history_record(rec)
+                if any([apply_order_update(trade, o, False) for o in orders]):
+                    write_history_record(rec, trade)
+                    changed += 1
+                    # Closed and every order final: stop tracking
+                    if all(o['status'] in TERMINAL_STATUSES for o in trade.get('broker_orders', [])):
+                        with self._lock:
+                            for o in trade['broker_orders']:
+                                self._index.pop(o['order_id'], None)
+            if changed:
+                commit_journal(journal_trades(changed_active))
+                invalidate_realized_pnl()
+                self.stats["applied"] += changed
+
+# Singleton Instance
+consumer = OrderUpdateConsumer()
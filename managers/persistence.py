@@ -1,53 +1,464 @@
+import os
 import json
+import atexit
 import threading
-from datetime import datetime
-from database import db, ActiveTrade, TradeHistory, RiskState, TelegramMessage
+from datetime import datetime, timedelta
+import pytz
+import config
+from database import db, ActiveTrade, TradeHistory, TradeEvent, TradeSnapshot, RiskState, TelegramMessage, BrokerSession, TradeCounter, HOT_FIELDS
+from managers.trade_index import index as trade_index
+from managers.history_archive import archive as history_archive
+from managers.shared_state import ProcessLock, _run_path
 
-# Global Lock for thread safety
-TRADE_LOCK = threading.Lock()
+# Global Lock for thread safety (and across gunicorn workers: the trade book is shared through the journal)
+TRADE_LOCK = ProcessLock("trades.lock")
 
 # [FIX] Global In-Memory Cache
 _ACTIVE_TRADES_CACHE = None
 
 # --- Risk State Persistence ---
+# In-memory per mode (source of truth once loaded), written behind: changes are
+# coalesced for RISK_FLUSH_DELAY seconds and flushed in one commit (and at exit).
+RISK_FLUSH_DELAY = 2.0
+_RISK_STATE = {}
+_RISK_DIRTY = set()
+_RISK_LOCK = threading.Lock()
+_risk_flush_timer = None
+
 def get_risk_state(mode):
+    """Returns a copy of the mode's risk state (DB read only on first use)."""
+    with _RISK_LOCK:
+        if mode in _RISK_STATE:
+            return dict(_RISK_STATE[mode])
+    state = {'high_pnl': float('-inf'), 'global_sl': float('-inf'), 'active': False}
     try:
         record = RiskState.query.filter_by(id=mode).first()
         if record:
-            return json.loads(record.data)
+            state = json.loads(record.data)
     except Exception as e:
         print(f"Error fetching risk state for {mode}: {e}")
-    return {'high_pnl': float('-inf'), 'global_sl': float('-inf'), 'active': False}
+        return state
+    with _RISK_LOCK:
+        _RISK_STATE.setdefault(mode, state)
+        return dict(_RISK_STATE[mode])
 
 def save_risk_state(mode, state):
+    """Updates memory immediately; the DB write happens in the background."""
+    global _risk_flush_timer
+    with _RISK_LOCK:
+        _RISK_STATE[mode] = dict(state)
+        _RISK_DIRTY.add(mode)
+        if _risk_flush_timer is None:
+            _risk_flush_timer = threading.Timer(RISK_FLUSH_DELAY, _flush_risk_state_async)
+            _risk_flush_timer.daemon = True
+            _risk_flush_timer.start()
+
+def _flush_risk_state_async():
+    from managers.common import get_flask_app
+    app = get_flask_app()
+    if app is None:
+        return flush_risk_state()
+    with app.app_context():
+        try:
+            flush_risk_state()
+        finally:
+            db.session.remove()
+
+def flush_risk_state():
+    """Writes every changed mode in one commit. Needs an app context."""
+    global _risk_flush_timer
+    with _RISK_LOCK:
+        _risk_flush_timer = None
+        pending = {mode: json.dumps(_RISK_STATE[mode]) for mode in _RISK_DIRTY}
+        _RISK_DIRTY.clear()
+    if not pending: return
     try:
-        record = RiskState.query.filter_by(id=mode).first()
-        if not record:
-            record = RiskState(id=mode, data=json.dumps(state))
-            db.session.add(record)
-        else:
-            record.data = json.dumps(state)
+        for mode, data in pending.items():
+            record = RiskState.query.filter_by(id=mode).first()
+            if not record:
+                db.session.add(RiskState(id=mode, data=data))
+            else:
+                record.data = data
         db.session.commit()
     except Exception as e:
         print(f"Risk State Save Error: {e}")
         db.session.rollback()
+        # Keep them dirty for the next flush
+        with _RISK_LOCK:
+            _RISK_DIRTY.update(pending)
+
+@atexit.register
+def _flush_risk_state_at_exit():
+    with _RISK_LOCK:
+        if not _RISK_DIRTY: return
+    try:
+        _flush_risk_state_async()
+    except Exception as e:
+        print(f"Risk State Flush At Exit Error: {e}")
+
+# --- Today's Realized P&L (cached per mode, reset whenever history changes) ---
+_REALIZED_PNL = {}
+
+def invalidate_realized_pnl():
+    _REALIZED_PNL.clear()
+
+# Per exit-day change counter of the closed trades (lets analytics cache closed days)
+_HISTORY_VERSION = {}
+
+def touch_history_day(exit_time):
+    day = str(exit_time or '')[:10]
+    _HISTORY_VERSION[day] = _HISTORY_VERSION.get(day, 0) + 1
+
+def history_day_versions(days):
+    """
+    Version per exit day ('YYYY-MM-DD'): this process's change counter, a fingerprint of the day's
+    TradeHistory rows (one grouped query: count, max id, P/L, made_high, document size) and the
+    archive file's mtime, so changes committed by other workers are seen too. Raises on a DB error.
+    """
+    if not days: return {}
+    day_col = db.func.substr(TradeHistory.exit_time, 1, 10)
+    rows = db.session.query(
+        day_col, db.func.count(TradeHistory.id), db.func.max(TradeHistory.id), db.func.sum(TradeHistory.pnl),
+        db.func.sum(TradeHistory.made_high), db.func.sum(db.func.length(TradeHistory.data))
+    ).filter(TradeHistory.exit_time >= min(days), TradeHistory.exit_time <= f"{max(days)} 23:59:59").group_by(day_col).all()
+    hot = {r[0]: tuple(r[1:]) for r in rows}
+    months = {m: history_archive.month_version(m) for m in {d[:7] for d in days}}
+    return {d: (_HISTORY_VERSION.get(d, 0), hot.get(d), months[d[:7]]) for d in days}
+
+def get_todays_realized_pnl(mode):
+    """Sum of today's (IST) closed P&L for a mode: one SQL aggregate, then cached until history changes."""
+    today_str = datetime.now(_IST).strftime("%Y-%m-%d")
+    key = (today_str, mode)
+    if key not in _REALIZED_PNL:
+        try:
+            total = db.session.query(db.func.sum(TradeHistory.pnl)).filter(
+                TradeHistory.mode == mode, TradeHistory.exit_time.like(f"{today_str}%")
+            ).scalar()
+        except Exception as e:
+            print(f"Realized P/L Error: {e}")
+            return 0.0
+        _REALIZED_PNL[key] = float(total or 0)
+    return _REALIZED_PNL[key]
+
+# --- Daily Trade Counters (trades started per IST entry day and mode) ---
+def count_new_trades(records):
+    """
+    Adds newly created trades to the daily counters. No commit: the counters are saved with the
+    caller's save_trades() / history write, so a trade that was not stored is not counted.
+    """
+    per_key = {}
+    for t in records:
+        key = (str(t.get('entry_time', ''))[:10], t.get('mode'))
+        per_key[key] = per_key.get(key, 0) + 1
+    for (day, mode), n in per_key.items():
+        rec = db.session.get(TradeCounter, (day, mode))
+        if rec is None:
+            db.session.add(TradeCounter(day=day, mode=mode, count=n))
+        else:
+            rec.count = TradeCounter.count + n   # SQL-side increment (other workers)
+
+def get_trade_counts(day=None):
+    """{mode: trades started} for an entry day (default: today, IST)."""
+    day = day or datetime.now(_IST).strftime("%Y-%m-%d")
+    return {r.mode: r.count for r in TradeCounter.query.filter_by(day=day)}
+
+def seed_trade_counters():
+    """First start with the counters table: counts today's trades from the active book and today's history."""
+    if TradeCounter.query.first() is not None:
+        return
+    today = datetime.now(_IST).strftime("%Y-%m-%d")
+    started = [t for t in load_trades() + load_history(today, today) if str(t.get('entry_time', '')).startswith(today)]
+    if started:
+        count_new_trades(started)
+        db.session.commit()
 
 # --- Active Trades Persistence ---
+# Durability is an append-only journal (TradeEvent): every save appends one small event per
+# changed trade (only the changed fields). Every JOURNAL_SNAPSHOT_EVERY events the ActiveTrade
+# rows are rewritten as a compacted snapshot (TradeSnapshot checkpoint) and the events it covers
+# are deleted; startup loads the snapshot and replays the events after it.
+# Other workers' writes are picked up by load_trades(): every commit writes the newest event id
+# to a head file, and a reader whose last applied id is behind replays the new events (or reloads
+# the snapshot if a compaction removed events it had not applied yet).
+# Per-tick fields (VOLATILE_FIELDS) never enter the journal: they are shared through a small
+# RUN_DIR file instead, so price ticks do not grow the TradeEvent table.
+JOURNAL_SNAPSHOT_EVERY = 500
+VOLATILE_FIELDS = ("current_ltp",)
+_JOURNAL_SHADOW = {}          # trade_id -> (json, dict): last persisted state of each active trade
+_events_since_snapshot = 0
+_journal_applied = 0          # newest event id reflected in the cache
+_own_events = []              # events added by this process, not committed yet
+_own_event_ids = set()        # committed by this process, not yet passed by a catch-up
+_JOURNAL_HEAD = _run_path("journal.head")
+_VOLATILE_FILE = _run_path("volatile.json")
+_volatile_published = {}      # id -> volatile fields last written by this process
+_volatile_mtime = None        # mtime of the volatile file last written / applied here
+
+def _read_journal_head():
+    try:
+        with open(_JOURNAL_HEAD) as f:
+            return int(f.read() or 0)
+    except (OSError, ValueError):
+        return None
+
+def _write_journal_head(event_id):
+    try:
+        tmp = f"{_JOURNAL_HEAD}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            f.write(str(event_id))
+        os.replace(tmp, _JOURNAL_HEAD)
+    except OSError as e:
+        print(f"Journal Head Write Error: {e}")
+
+def _shadow_state(t):
+    """(json, dict) of a trade without its volatile fields: what the journal diffs against."""
+    t_json = json.dumps({k: v for k, v in t.items() if k not in VOLATILE_FIELDS})
+    return t_json, json.loads(t_json)
+
+def _publish_volatile(trades):
+    """Writes the active trades' volatile fields for the other workers (only when they changed)."""
+    global _volatile_published, _volatile_mtime
+    values = {str(t['id']): {k: t[k] for k in VOLATILE_FIELDS if k in t} for t in trades}
+    if values == _volatile_published:
+        return
+    try:
+        tmp = f"{_VOLATILE_FILE}.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(values, f)
+        os.replace(tmp, _VOLATILE_FILE)
+        _volatile_published = values
+        _volatile_mtime = os.path.getmtime(_VOLATILE_FILE)
+    except OSError as e:
+        print(f"Volatile Fields Write Error: {e}")
+
+def _apply_volatile():
+    """Overlays the volatile fields another worker published onto the cached trades."""
+    global _volatile_mtime
+    try:
+        mtime = os.path.getmtime(_VOLATILE_FILE)
+        if mtime == _volatile_mtime:
+            return
+        with open(_VOLATILE_FILE) as f:
+            values = json.load(f)
+    except (OSError, ValueError):
+        return
+    for t in _ACTIVE_TRADES_CACHE:
+        t.update(values.get(str(t['id']), {}))
+    _volatile_mtime = mtime
+
+def _event_name(old, new):
+    if old is None: return "created"
+    if old.get('status') == 'PENDING' and new.get('status') != 'PENDING': return "activated"
+    if old.get('targets_hit_indices') != new.get('targets_hit_indices'): return "target_hit"
+    if old.get('quantity') != new.get('quantity'): return "qty_changed"
+    if old.get('sl') != new.get('sl'): return "sl_moved"
+    if old.get('mode') != new.get('mode'): return "promoted"
+    return "updated"
+
+def journal_trades(trades, closed_ids=()):
+    """
+    Adds journal events (no commit) for the trades that changed since they were last persisted,
+    and a 'closed' event per id in closed_ids. Returns the shadow updates to hand to commit_journal().
+    """
+    now = datetime.now(_IST).strftime("%Y-%m-%d %H:%M:%S")
+    pending = {}
+    del _own_events[:]
+    for t in trades:
+        new_json, new_state = _shadow_state(t)
+        old = _JOURNAL_SHADOW.get(t['id'])
+        if old is not None and old[0] == new_json:
+            continue
+        if old is None:
+            payload = dict(new_state, **{k: t[k] for k in VOLATILE_FIELDS if k in t})
+        else:
+            old_state = old[1]
+            payload = {
+                "set": {k: v for k, v in new_state.items() if old_state.get(k, object()) != v},
+                "unset": [k for k in old_state if k not in new_state]
+            }
+        _own_events.append(TradeEvent(trade_id=int(t['id']), event=_event_name(old and old[1], new_state), data=json.dumps(payload), created_at=now))
+        pending[t['id']] = (new_json, new_state)
+    for t_id in closed_ids:
+        _own_events.append(TradeEvent(trade_id=int(t_id), event="closed", created_at=now))
+        pending[t_id] = None
+    db.session.add_all(_own_events)
+    return pending
+
+def commit_journal(pending):
+    """Commits the session, then records the journaled states as persisted."""
+    global _events_since_snapshot
+    db.session.flush()
+    ids = [ev.id for ev in _own_events if ev.id is not None]   # before commit: compaction may delete the rows
+    db.session.commit()
+    for t_id, state in pending.items():
+        if state is None: _JOURNAL_SHADOW.pop(t_id, None)
+        else: _JOURNAL_SHADOW[t_id] = state
+    _events_since_snapshot += len(pending)
+    del _own_events[:]
+    if ids:
+        _own_event_ids.update(ids)
+        _write_journal_head(max(ids))
+
+def _catch_up_due():
+    """Cheap lock-free check: did another worker commit events or publish volatile fields?"""
+    head = _read_journal_head()
+    if head is None or head > _journal_applied:
+        return True
+    try:
+        return os.path.getmtime(_VOLATILE_FILE) != _volatile_mtime
+    except OSError:
+        return False
+
+def _catch_up():
+    """Applies the journal events other workers committed since this cache was built / last caught up."""
+    global _ACTIVE_TRADES_CACHE, _journal_applied, _events_since_snapshot
+    _apply_volatile()
+    head = _read_journal_head()
+    if head is not None and head <= _journal_applied:
+        return
+    checkpoint = TradeSnapshot.query.get('active')
+    if checkpoint is not None and checkpoint.last_event_id > _journal_applied:
+        # Compacted past us: the events we miss are gone, rebuild from the snapshot
+        before = {t['id'] for t in _ACTIVE_TRADES_CACHE}
+        _ACTIVE_TRADES_CACHE = None
+        gone = before - {t['id'] for t in load_trades()}
+        if gone:
+            _track_closed(gone)
+        return
+    events = TradeEvent.query.filter(TradeEvent.id > _journal_applied).order_by(TradeEvent.id).all()
+    if not events:
+        return
+    book = {t['id']: t for t in _ACTIVE_TRADES_CACHE}
+    changed, closed = set(), set()
+    for ev in events:
+        _journal_applied = max(_journal_applied, ev.id)
+        if ev.id in _own_event_ids:
+            _own_event_ids.discard(ev.id)
+            continue
+        _apply_event(book, ev)
+        changed.add(int(ev.trade_id))
+        if ev.event == "closed":
+            closed.add(int(ev.trade_id))
+    if not changed:
+        return
+
+    _ACTIVE_TRADES_CACHE = list(book.values())
+    for t_id in changed:
+        t = book.get(t_id)
+        if t is None:
+            _JOURNAL_SHADOW.pop(t_id, None)
+            continue
+        _JOURNAL_SHADOW[t_id] = _shadow_state(t)
+        trade_index.touch(t)
+    trade_index.set_active(_ACTIVE_TRADES_CACHE)
+    _events_since_snapshot += len(changed)
+    if closed:
+        _track_closed(closed)
+
+def _track_closed(trade_ids):
+    """Trades another worker closed: P/L caches, and the leader's missed-opportunity tracking (trade_index)."""
+    invalidate_realized_pnl()
+    touch_history_day(datetime.now(_IST).strftime("%Y-%m-%d"))
+    if not trade_index.day:
+        return   # not tracking closed trades in this process
+    for rec in TradeHistory.query.filter(TradeHistory.id.in_(list(trade_ids))).all():
+        trade_index.add_closed(history_record(rec))
+
+def _apply_event(book, ev):
+    t_id = int(ev.trade_id)
+    if ev.event == "closed":
+        book.pop(t_id, None)
+        return
+    payload = json.loads(ev.data)
+    if ev.event == "created" or t_id not in book:
+        book[t_id] = payload if ev.event == "created" else dict(payload.get("set", {}), id=t_id)
+        return
+    book[t_id].update(payload.get("set", {}))
+    for k in payload.get("unset", []):
+        book[t_id].pop(k, None)
+
+def _write_snapshot(trades):
+    """
+    Compaction: rewrites the ActiveTrade rows from memory, moves the checkpoint and deletes the
+    events it covers but the last (no commit). Returns the checkpoint's last event id.
+    """
+    db.session.flush()
+    last_event_id = db.session.query(db.func.max(TradeEvent.id)).scalar() or 0
+    # The newest row stays: SQLite (no AUTOINCREMENT) would otherwise reuse ids below the checkpoint
+    TradeEvent.query.filter(TradeEvent.id < last_event_id).delete(synchronize_session=False)
+
+    existing_map = {r.id: r for r in ActiveTrade.query.all()}
+    new_ids = set()
+    for t in trades:
+        t_id = int(t['id'])
+        new_ids.add(t_id)
+        rec = existing_map.get(t_id)
+        if rec is None:
+            rec = ActiveTrade(id=t_id)
+            db.session.add(rec)
+        # Extract fields for SQL Columns
+        rec.data = json.dumps(t)
+        rec.symbol = t.get('symbol')
+        rec.mode = t.get('mode')
+        rec.status = t.get('status')
+        rec.sl = t.get('sl')
+        rec.quantity = t.get('quantity')
+    for old_id, record in existing_map.items():
+        if old_id not in new_ids:
+            db.session.delete(record)
+
+    checkpoint = TradeSnapshot.query.get('active')
+    if checkpoint is None:
+        checkpoint = TradeSnapshot(id='active')
+        db.session.add(checkpoint)
+    checkpoint.last_event_id = last_event_id
+    checkpoint.trades = len(trades)
+    checkpoint.created_at = datetime.now(_IST).strftime("%Y-%m-%d %H:%M:%S")
+    return last_event_id
+
 def load_trades():
     """
     [FIX] Returns cached trades if available to reduce DB I/O.
+    First call: latest snapshot (ActiveTrade rows) + replay of the journal tail.
     """
-    global _ACTIVE_TRADES_CACHE
+    global _ACTIVE_TRADES_CACHE, _events_since_snapshot, _journal_applied, _volatile_mtime
     
-    # Return Cache if warm
+    # Return Cache if warm (after picking up other workers' changes)
     if _ACTIVE_TRADES_CACHE is not None:
+        try:
+            if _catch_up_due():
+                # Rebinds the cache / mutates the shared dicts: never under a writer's feet
+                if TRADE_LOCK.owned():
+                    _catch_up()
+                else:
+                    with TRADE_LOCK:
+                        _catch_up()
+        except Exception as e:
+            print(f"[DEBUG] Journal Catch-Up Error: {e}")
+            db.session.rollback()
         return _ACTIVE_TRADES_CACHE
 
     try:
         # Initial Load from DB
         db.session.remove() 
-        raw_rows = ActiveTrade.query.all()
-        _ACTIVE_TRADES_CACHE = [json.loads(r.data) for r in raw_rows]
+        book = {r.id: json.loads(r.data) for r in ActiveTrade.query.order_by(ActiveTrade.id).all()}
+        checkpoint = TradeSnapshot.query.get('active')
+        tail = TradeEvent.query.filter(TradeEvent.id > (checkpoint.last_event_id if checkpoint else 0)).order_by(TradeEvent.id).all()
+        for ev in tail:
+            _apply_event(book, ev)
+        if tail:
+            print(f"📜 Trade Journal: replayed {len(tail)} event(s) on top of the snapshot")
+
+        _ACTIVE_TRADES_CACHE = list(book.values())
+        _JOURNAL_SHADOW.clear()
+        for t in _ACTIVE_TRADES_CACHE:
+            _JOURNAL_SHADOW[t['id']] = _shadow_state(t)
+        _events_since_snapshot = len(tail)
+        _journal_applied = tail[-1].id if tail else (checkpoint.last_event_id if checkpoint else 0)
+        _own_event_ids.clear()
+        _volatile_mtime = None
+        _apply_volatile()
+        trade_index.set_active(_ACTIVE_TRADES_CACHE)
         return _ACTIVE_TRADES_CACHE
     except Exception as e:
         print(f"[DEBUG] Load Trades Error: {e}")
@@ -55,76 +466,250 @@ def load_trades():
 
 def save_trades(trades):
     """
-    [FIX] Updates Cache AND Database (including new SQL columns).
+    [FIX] Updates Cache AND Database.
+    Appends journal events for the changed / removed trades only; compacts into a snapshot
+    every JOURNAL_SNAPSHOT_EVERY events.
     """
-    global _ACTIVE_TRADES_CACHE
+    global _ACTIVE_TRADES_CACHE, _events_since_snapshot, _journal_applied
     try:
-        # 1. Update Memory Cache Immediately
+        # 1. Update Memory Cache Immediately (and the risk engine's symbol index)
         _ACTIVE_TRADES_CACHE = trades
+        trade_index.set_active(trades)
+        _publish_volatile(trades)
 
-        # 2. Sync to DB
-        existing_records = ActiveTrade.query.all()
-        existing_map = {r.id: r for r in existing_records}
-        new_ids = set()
+        # 2. Journal the changes
+        live_ids = {t['id'] for t in trades}
+        closed_ids = [t_id for t_id in _JOURNAL_SHADOW if t_id not in live_ids]
+        pending = journal_trades(trades, closed_ids)
+        if not pending:
+            return
 
-        for t in trades:
-            t_id = int(t['id'])
-            new_ids.add(t_id)
-            json_data = json.dumps(t)
-            
-            # Extract fields for SQL Columns
-            sym = t.get('symbol')
-            mod = t.get('mode')
-            sta = t.get('status')
-            
-            if t_id in existing_map:
-                # Update existing record
-                rec = existing_map[t_id]
-                rec.data = json_data
-                rec.symbol = sym
-                rec.mode = mod
-                rec.status = sta
-            else:
-                # Insert new record with columns
-                new_record = ActiveTrade(
-                    id=t_id, 
-                    data=json_data,
-                    symbol=sym,
-                    mode=mod,
-                    status=sta
-                )
-                db.session.add(new_record)
-        
-        # 3. Delete removed records
-        for old_id, record in existing_map.items():
-            if old_id not in new_ids:
-                db.session.delete(record)
-        
-        db.session.commit()
+        # 3. Periodic compaction
+        compact = _events_since_snapshot + len(pending) >= JOURNAL_SNAPSHOT_EVERY
+        checkpoint_id = _write_snapshot(trades) if compact else None
+        commit_journal(pending)
+        if compact:
+            _events_since_snapshot = 0
+            # The cache is the snapshot: everything up to the checkpoint is applied (and deleted)
+            _journal_applied = max(_journal_applied, checkpoint_id)
+            _own_event_ids.difference_update([i for i in _own_event_ids if i <= checkpoint_id])
     except Exception as e:
         print(f"Save Trades Error: {e}")
         db.session.rollback()
 
+def update_trade_fields(trade_id, **fields):
+    """
+    Sets fields on one active trade: the cached dict and one journal event (no full-book rewrite).
+    Used by background workers that must not rewrite the whole book. Acquires TRADE_LOCK itself.
+    Returns False if the trade is no longer active.
+    """
+    with TRADE_LOCK:
+        try:
+            cached = next((t for t in load_trades() if str(t['id']) == str(trade_id)), None)
+            if cached is None:
+                return False
+            cached.update(fields)
+            commit_journal(journal_trades([cached]))
+            return True
+        except Exception as e:
+            print(f"Update Trade Fields Error: {e}")
+            db.session.rollback()
+    return False
+
+def attach_telegram_msg_id(trade_id, key, msg_id):
+    """
+    Records the latest Telegram message ID of a channel thread on a single trade.
+    Acquires TRADE_LOCK itself.
+    """
+    return attach_telegram_msg_ids([(trade_id, key, msg_id)]) > 0
+
+def attach_telegram_msg_ids(updates):
+    """
+    Batch version: 'updates' is a list of (trade_id, key, msg_id).
+    Updates the cached trades with one journal event each (no full-book rewrite),
+    falling back to the TradeHistory row for closed trades. One commit for the whole batch.
+    Acquires TRADE_LOCK itself. Returns the number of trades updated.
+    """
+    def apply(t, key, msg_id):
+        if not isinstance(t.get('telegram_msg_ids'), dict):
+            t['telegram_msg_ids'] = {}
+        t['telegram_msg_ids'][key] = msg_id
+        # Legacy fallback for single channel support
+        if key == 'main':
+            t['telegram_msg_id'] = msg_id
+
+    if not updates: return 0
+    with TRADE_LOCK:
+        try:
+            cache = {str(t['id']): t for t in load_trades()}
+            active, closed = {}, {}
+            for trade_id, key, msg_id in updates:
+                cached = cache.get(str(trade_id))
+                if cached is not None:
+                    apply(cached, key, msg_id)
+                    active[int(trade_id)] = cached
+                else:
+                    closed.setdefault(int(trade_id), []).append((key, msg_id))
+
+            pending = journal_trades(active.values())
+
+            for t_id, items in closed.items():
+                rec = TradeHistory.query.get(t_id)
+                if not rec: continue
+                data = history_record(rec)
+                for key, msg_id in items:
+                    apply(data, key, msg_id)
+                write_history_record(rec, data)
+
+            commit_journal(pending)
+            return len(active) + len(closed)
+        except Exception as e:
+            print(f"Attach Telegram ID Error: {e}")
+            db.session.rollback()
+    return 0
+
+# --- Broker Session Persistence ---
+# Kite access tokens expire at 06:00 IST the next morning
+_IST = pytz.timezone('Asia/Kolkata')
+TOKEN_ROLLOVER_HOURS = 6
+
+def _token_day():
+    return (datetime.now(_IST) - timedelta(hours=TOKEN_ROLLOVER_HOURS)).strftime("%Y-%m-%d")
+
+def save_broker_session(access_token, user_id=None):
+    try:
+        rec = BrokerSession.query.get('kite')
+        if not rec:
+            rec = BrokerSession(id='kite')
+            db.session.add(rec)
+        rec.access_token = access_token
+        rec.user_id = user_id
+        rec.token_day = _token_day()
+        rec.created_at = datetime.now(_IST).strftime("%Y-%m-%d %H:%M:%S")
+        db.session.commit()
+    except Exception as e:
+        print(f"Save Broker Session Error: {e}")
+        db.session.rollback()
+
+def load_broker_session():
+    """
+    Returns the stored session dict if it was created for the current token day, else None.
+    """
+    try:
+        rec = BrokerSession.query.get('kite')
+        if rec and rec.token_day == _token_day():
+            return {"access_token": rec.access_token, "user_id": rec.user_id, "created_at": rec.created_at}
+    except Exception as e:
+        print(f"Load Broker Session Error: {e}")
+    return None
+
+def clear_broker_session():
+    try:
+        BrokerSession.query.filter_by(id='kite').delete()
+        db.session.commit()
+    except Exception as e:
+        print(f"Clear Broker Session Error: {e}")
+        db.session.rollback()
+
 # --- Trade History Persistence ---
-def load_history():
-    # Legacy load all (used for History Tab)
+HISTORY_HOT_FIELDS = HOT_FIELDS['trade_history']
+
+def history_record(rec):
+    """The trade dict of a TradeHistory row: its JSON document with the hot columns applied on top."""
+    t = json.loads(rec.data)
+    for key in HISTORY_HOT_FIELDS:
+        value = getattr(rec, key)
+        if value is not None:
+            t[key] = value
+    return t
+
+def write_history_record(rec, trade_data):
+    """Stores the whole trade on its TradeHistory row: document, reporting columns and hot columns."""
+    rec.data = json.dumps(trade_data)
+    rec.symbol = trade_data.get('symbol')
+    rec.mode = trade_data.get('mode')
+    rec.pnl = trade_data.get('pnl')
+    rec.exit_time = trade_data.get('exit_time')
+    for key in HISTORY_HOT_FIELDS:
+        setattr(rec, key, trade_data.get(key))
+    touch_history_day(rec.exit_time)
+
+def load_history(start=None, end=None, strict=False):
+    """
+    Closed trades across the hot table and the monthly archive (newest first).
+    start / end: optional exit dates ('YYYY-MM-DD', inclusive). Without them: everything (History Tab).
+    strict: raise on a DB / archive read error instead of returning what could be read (or []).
+    """
     try:
         db.session.commit()
-        return [json.loads(r.data) for r in TradeHistory.query.order_by(TradeHistory.id.desc()).all()]
+        query = TradeHistory.query
+        if start: query = query.filter(TradeHistory.exit_time >= start)
+        if end: query = query.filter(TradeHistory.exit_time <= f"{end} 23:59:59")
+        trades = [history_record(r) for r in query.order_by(TradeHistory.id.desc()).all()]
+
+        hot_ids = {t['id'] for t in trades}
+        cold = [t for t in history_archive.query(start, end, strict=strict) if t['id'] not in hot_ids]
+        if cold:
+            trades = sorted(trades + cold, key=lambda t: t['id'], reverse=True)
+        return trades
     except Exception as e:
         print(f"Load History Error: {e}")
+        if strict:
+            raise
         return []
 
-def load_todays_history():
+def get_history_trade(trade_id):
+    """One closed trade by id (hot table first, then the archive). None if unknown."""
+    try:
+        rec = TradeHistory.query.get(int(trade_id))
+        if rec is not None:
+            return history_record(rec)
+        return history_archive.find_trade(trade_id)
+    except Exception as e:
+        print(f"Get History Trade Error: {e}")
+        return None
+
+def archive_history(hot_days=None):
+    """
+    Moves closed trades whose exit is older than hot_days (config.HISTORY_HOT_DAYS) into the
+    monthly archive files, then deletes them from TradeHistory. Returns the number archived (None on error).
+    The files are written before the rows are deleted: a crash in between only leaves duplicates,
+    which reads ignore (the hot row wins) and the next run overwrites.
+    """
+    hot_days = config.HISTORY_HOT_DAYS if hot_days is None else hot_days
+    if hot_days <= 0:
+        return 0
+    cutoff = (datetime.now(_IST) - timedelta(days=hot_days)).strftime("%Y-%m-%d")
+    with TRADE_LOCK:
+        try:
+            rows = TradeHistory.query.filter(TradeHistory.exit_time < cutoff).order_by(TradeHistory.id).all()
+            if not rows:
+                return 0
+            by_month = {}
+            for rec in rows:
+                by_month.setdefault(rec.exit_time[:7], []).append(history_record(rec))
+            for month, trades in sorted(by_month.items()):
+                history_archive.write_month(month, trades)
+
+            TradeHistory.query.filter(TradeHistory.id.in_([r.id for r in rows])).delete(synchronize_session=False)
+            db.session.commit()
+            print(f"🗄️ History Archive: moved {len(rows)} trade(s) before {cutoff} into {len(by_month)} month(s)")
+            return len(rows)
+        except Exception as e:
+            print(f"History Archive Error: {e}")
+            db.session.rollback()
+            return None
+
+def load_todays_history(today_str=None):
     """
     [FIX] Optimized loader for Risk Engine. 
     Only loads trades where exit_time matches today's date using SQL filter.
     """
     try:
-        today_str = datetime.now().strftime("%Y-%m-%d")
+        today_str = today_str or datetime.now().strftime("%Y-%m-%d")
         # SQL Filter: exit_time LIKE '2023-10-27%'
         rows = TradeHistory.query.filter(TradeHistory.exit_time.like(f"{today_str}%")).all()
-        return [json.loads(r.data) for r in rows]
+        return [history_record(r) for r in rows]
     except Exception as e:
         print(f"Load Today History Error: {e}")
         return []
@@ -134,8 +719,18 @@ def delete_trade(trade_id):
     with TRADE_LOCK:
         try:
             telegram_bot.delete_trade_messages(trade_id)
-            TradeHistory.query.filter_by(id=int(trade_id)).delete()
+            rec = TradeHistory.query.get(int(trade_id))
+            if rec is not None:
+                touch_history_day(rec.exit_time)
+                db.session.delete(rec)
+            else:
+                cold = history_archive.find_trade(trade_id)
+                if cold is not None:
+                    touch_history_day(cold.get('exit_time'))
+                    history_archive.delete_trade(trade_id)
             db.session.commit()
+            invalidate_realized_pnl()
+            trade_index.drop_closed(int(trade_id))
             return True
         except Exception as e:
             print(f"Delete Trade Error: {e}")
@@ -144,31 +739,19 @@ def delete_trade(trade_id):
 
 def save_to_history_db(trade_data):
     """
-    [FIX] Populates SQL columns (pnl, exit_time) for efficient reporting.
+    [FIX] Populates SQL columns (pnl, exit_time, hot fields) for efficient reporting.
     """
     try:
         t_id = trade_data['id']
-        json_str = json.dumps(trade_data)
         
-        existing = TradeHistory.query.get(t_id)
-        if existing:
-            existing.data = json_str
-            existing.symbol = trade_data.get('symbol')
-            existing.mode = trade_data.get('mode')
-            existing.pnl = trade_data.get('pnl')
-            existing.exit_time = trade_data.get('exit_time')
-        else:
-            rec = TradeHistory(
-                id=t_id, 
-                data=json_str,
-                symbol=trade_data.get('symbol'),
-                mode=trade_data.get('mode'),
-                pnl=trade_data.get('pnl'),
-                exit_time=trade_data.get('exit_time')
-            )
+        rec = TradeHistory.query.get(t_id)
+        if rec is None:
+            rec = TradeHistory(id=t_id)
             db.session.add(rec)
+        write_history_record(rec, trade_data)
             
         db.session.commit()
+        invalidate_realized_pnl()
     except Exception as e:
         print(f"Save History DB Error: {e}")
         db.session.rollback()
@@ -1,9 +1,10 @@
 from datetime import datetime
+from itertools import chain
 import time
 import smart_trader
 import settings
 from managers.common import IST, get_exchange, log_event, get_time_str
-from managers.persistence import TRADE_LOCK, load_trades, save_trades, load_history
+from managers.persistence import TRADE_LOCK, load_trades, save_trades, get_history_trade, count_new_trades
 from managers.broker_ops import move_to_history
 
 def import_past_trade(kite, symbol, entry_dt_str, qty, entry_price, sl_price, targets, trailing_sl, sl_to_entry, exit_multiplier, target_controls, target_channels=['main']):
@@ -58,12 +59,19 @@ def import_past_trade(kite, symbol, entry_dt_str, qty, entry_price, sl_price, ta
         if not token: 
             return {"status": "error", "message": f"Symbol Token not found for {symbol}"}
         
-        # Fetch Data
-        hist_data = smart_trader.fetch_historical_data(kite, token, entry_time, now, "minute")
-        if not hist_data: 
+        # Fetch Data (Streamed: simulation starts as soon as the first chunk arrives)
+        candle_stream = smart_trader.stream_historical_data(kite, token, entry_time, now, "minute")
+        try:
+            first_candle = next(candle_stream, None)
+        except Exception as e:
+            print(f"History Fetch Error: {e}")
+            first_candle = None
+        if not first_candle: 
             return {"status": "error", "message": "No historical data found"}
         
-        first_open = hist_data[0]['open']
+        candles = chain([first_candle], candle_stream)
+        last_candle = first_candle
+        first_open = first_candle['open']
         trigger_dir = "ABOVE" if first_open < entry_price else "BELOW"
 
         status = "PENDING"
@@ -91,7 +99,8 @@ def import_past_trade(kite, symbol, entry_dt_str, qty, entry_price, sl_price, ta
         final_exit_price = 0.0
         
         # 3. Candle-by-Candle Simulation
-        for idx, candle in enumerate(hist_data):
+        for candle in candles:
+            last_candle = candle
             c_date_str = candle['date']
             
             # Universal Time Exit
@@ -219,10 +228,11 @@ def import_past_trade(kite, symbol, entry_dt_str, qty, entry_price, sl_price, ta
             if current_qty == 0:
                 skip_scan = (final_status == "SL_HIT" and len(targets_hit_indices) > 0)
                 if not skip_scan:
-                    remaining_candles = hist_data[idx+1:]
                     virtual_sl_price = float(sl_price)
                     
-                    for c in remaining_candles:
+                    # Continue on the same stream (remaining candles only)
+                    for c in candles:
+                        last_candle = c
                         c_h = float(c['high'])
                         c_l = float(c['low'])
                         c_time = c['date']
@@ -251,6 +261,9 @@ def import_past_trade(kite, symbol, entry_dt_str, qty, entry_price, sl_price, ta
                                 })
                 break 
 
+        # Stop any chunk fetches still in flight
+        candle_stream.close()
+
         # 4. Finalize & Save
         with TRADE_LOCK:
             current_ltp = entry_price
@@ -261,7 +274,7 @@ def import_past_trade(kite, symbol, entry_dt_str, qty, entry_price, sl_price, ta
                     q = kite.quote(f"{exchange}:{symbol}")
                     current_ltp = q[f"{exchange}:{symbol}"]['last_price']
                 except: 
-                    if hist_data: current_ltp = hist_data[-1]['close']
+                    current_ltp = last_candle['close']
                 
                 record = {
                     "id": int(time.time()), 
@@ -277,9 +290,10 @@ def import_past_trade(kite, symbol, entry_dt_str, qty, entry_price, sl_price, ta
                     "sl_order_id": None, "targets_hit_indices": targets_hit_indices, 
                     "highest_ltp": highest_ltp, "made_high": highest_ltp, 
                     "current_ltp": current_ltp, "trigger_dir": trigger_dir, "logs": logs,
-                    "is_replay": True, "last_update_time": hist_data[-1]['date'] if hist_data else get_time_str(),
+                    "is_replay": True, "last_update_time": last_candle.get('date') or get_time_str(),
                     "target_channels": target_channels # Store channels in DB for future reference
                 }
+                count_new_trades([record])
                 trades = load_trades(); trades.append(record); save_trades(trades)
                 
                 return {
@@ -310,6 +324,7 @@ def import_past_trade(kite, symbol, entry_dt_str, qty, entry_price, sl_price, ta
                     "logs": logs, "is_replay": True, "pnl": realized_pnl,
                     "target_channels": target_channels
                 }
+                count_new_trades([record])
                 move_to_history(record, exit_reason, final_exit_price)
                 
                 return {
@@ -322,14 +337,33 @@ def import_past_trade(kite, symbol, entry_dt_str, qty, entry_price, sl_price, ta
     except Exception as e: 
         return {"status": "error", "message": str(e)}
 
+def iter_replay_notifications(trade_ref, notification_queue):
+    """
+    Generator over the replayed events that follow NEW_TRADE.
+    Yields (trade_snapshot, event_type, data) ready for telegram_bot.notify_trade_events.
+    Reply threading is resolved by the Telegram Manager at send time.
+    """
+    for item in notification_queue:
+        evt = item['event']
+        if evt == 'NEW_TRADE':
+            continue
+        
+        t_obj = item.get('trade', trade_ref).copy()
+        
+        # The replay engine often creates snapshot objects without IDs.
+        if 'id' not in t_obj:
+            t_obj['id'] = trade_ref['id']
+        t_obj['telegram_msg_ids'] = dict(trade_ref.get('telegram_msg_ids') or {})
+        
+        yield t_obj, evt, item.get('data')
+
 def simulate_trade_scenario(kite, trade_id, scenario_config):
     """
     Runs a hypothetical simulation on a past trade with modified settings.
     Does NOT affect the database or send notifications.
     """
     try:
-        trades = load_history()
-        original_trade = next((t for t in trades if str(t['id']) == str(trade_id)), None)
+        original_trade = get_history_trade(trade_id)
         if not original_trade: return {"status": "error", "message": "Trade not found"}
 
         symbol = original_trade['symbol']
@@ -386,8 +420,13 @@ def simulate_trade_scenario(kite, trade_id, scenario_config):
         token = smart_trader.get_instrument_token(symbol, exchange)
         if not token: return {"status": "error", "message": "Token not found"}
 
-        hist_data = smart_trader.fetch_historical_data(kite, token, entry_dt, now, "minute")
-        if not hist_data: return {"status": "error", "message": "No Data"}
+        candle_stream = smart_trader.stream_historical_data(kite, token, entry_dt, now, "minute")
+        try: first_candle = next(candle_stream, None)
+        except Exception as e:
+            print(f"History Fetch Error: {e}")
+            first_candle = None
+        if not first_candle: return {"status": "error", "message": "No Data"}
+        last_candle = first_candle
 
         current_qty = qty
         current_sl = sl_price
@@ -399,7 +438,8 @@ def simulate_trade_scenario(kite, trade_id, scenario_config):
         trigger_dir = original_trade.get('trigger_dir')
         status = "PENDING" if trigger_dir else "OPEN"
         
-        for candle in hist_data:
+        for candle in chain([first_candle], candle_stream):
+            last_candle = candle
             O, H, L, C = candle['open'], candle['high'], candle['low'], candle['close']
             ticks = [O, L, H, C] if C >= O else [O, H, L, C]
             c_time = candle['date'].split(' ')[1][:5]
@@ -441,9 +481,10 @@ def simulate_trade_scenario(kite, trade_id, scenario_config):
                                     current_qty -= exit_qty
                                     sim_logs.append(f"[{c_time}] 🎯 <b>Target {i+1} Partial</b> @ {tgt} | Qty: {exit_qty} | P/L: <span class='text-success'>+{pnl_gain:.2f}</span>")
             if status == "CLOSED": break
+        candle_stream.close()
             
         if current_qty > 0 and status == "OPEN":
-            last_price = hist_data[-1]['close']
+            last_price = last_candle['close']
             pnl_run = (last_price - entry_price) * current_qty
             sim_pnl += pnl_run
             sim_logs.append(f"[End] ⏱️ <b>Market Close/End</b> @ {last_price} | Rem Qty: {current_qty} | P/L: {pnl_run:.2f}")
@@ -1,12 +1,15 @@
-import json
 import smart_trader
 import settings
 from datetime import datetime
 from database import db, TradeHistory
-from managers.persistence import TRADE_LOCK, load_trades, save_trades, load_history, get_risk_state, save_risk_state
+from managers.persistence import TRADE_LOCK, load_trades, save_trades, load_todays_history, get_history_trade, history_record, get_todays_realized_pnl, get_risk_state, save_risk_state
 from managers.common import IST, log_event
-from managers.broker_ops import manage_broker_sl, move_to_history
+from managers.broker_ops import manage_broker_sl, move_to_history, sl_sync
 from managers.telegram_manager import bot as telegram_bot
+from managers.session_health import health as session_health
+from managers.order_updates import track_order
+from managers.trade_index import index as trade_index
+from managers.scheduler import scheduler
 
 # --- NEW: End of Day Report Helper (Automated) ---
 def send_eod_report(mode):
@@ -17,7 +20,7 @@ def send_eod_report(mode):
     """
     try:
         today_str = datetime.now(IST).strftime("%Y-%m-%d")
-        history = load_history()
+        history = load_todays_history(today_str)
         
         # Filter for Today's trades in the specific Mode (LIVE/PAPER)
         todays_trades = [t for t in history if t.get('exit_time') and t['exit_time'].startswith(today_str) and t['mode'] == mode]
@@ -149,7 +152,7 @@ def send_manual_trade_status(mode):
     """
     try:
         today_str = datetime.now(IST).strftime("%Y-%m-%d")
-        history = load_history()
+        history = load_todays_history(today_str)
         
         # Filter for Today's trades in the specific Mode
         todays_trades = [t for t in history if t.get('exit_time') and t['exit_time'].startswith(today_str) and t['mode'] == mode]
@@ -230,8 +233,7 @@ def send_manual_trade_report(trade_id):
     """
     try:
         # Look in History first
-        history = load_history()
-        trade = next((t for t in history if str(t['id']) == str(trade_id)), None)
+        trade = get_history_trade(trade_id)
         
         # If not in history, check Active trades
         if not trade:
@@ -312,7 +314,7 @@ def send_manual_summary(mode):
     try:
         # This function reuses the logic to include the new counts
         today_str = datetime.now(IST).strftime("%Y-%m-%d")
-        history = load_history()
+        history = load_todays_history(today_str)
         
         todays_trades = [t for t in history if t.get('exit_time') and t['exit_time'].startswith(today_str) and t['mode'] == mode]
         
@@ -376,78 +378,91 @@ def send_manual_summary(mode):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
-def check_global_exit_conditions(kite, mode, mode_settings):
+def run_square_off(kite, mode):
     """
-    Checks and executes global risk rules:
-    1. Universal Square-off Time (e.g., 15:25) -> NOW SEND REPORT ALWAYS (ONCE)
-    2. Profit Locking (Global PnL Trailing)
+    Scheduled at the mode's Universal Square-off Time (e.g., 15:25), once a day:
+    closes the mode's active trades and ALWAYS sends the EOD report.
+    Returns False if it failed (the scheduler retries within the window).
     """
     with TRADE_LOCK:
         trades = load_trades()
-        now = datetime.now(IST)
-        exit_time_str = mode_settings.get('universal_exit_time', "15:25")
-        today_str = now.strftime("%Y-%m-%d")
+        today_str = datetime.now(IST).strftime("%Y-%m-%d")
         
-        # Load State to check if we already ran EOD today
+        # Load State to check if we already ran EOD today (e.g. before a restart)
         state = get_risk_state(mode)
+        if state.get('last_eod_date') == today_str:
+            return True
         
-        # --- 1. TIME BASED EXIT & REPORT ---
         try:
-            exit_dt = datetime.strptime(exit_time_str, "%H:%M").replace(year=now.year, month=now.month, day=now.day)
-            exit_dt = IST.localize(exit_dt.replace(tzinfo=None))
+            # 1. Close Active Trades (If Any)
+            active_mode = [t for t in trades if t['mode'] == mode]
+            if active_mode:
+                for t in active_mode:
+                    # Determine if it's ACTIVE or PENDING
+                    exit_reason = "TIME_EXIT"
+                    exit_price = t.get('current_ltp', 0)
+                    
+                    if t['status'] == 'PENDING':
+                        exit_reason = "NOT_ACTIVE"
+                        exit_price = t['entry_price']
+                    
+                    if t['mode'] == "LIVE" and t['status'] != 'PENDING':
+                       manage_broker_sl(kite, t, cancel_completely=True)
+                       try: 
+                           # Broker SL already filled: the position is flat, no second sell
+                           if not t.get('sl_filled'):
+                               exit_id = kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_SELL, quantity=t['quantity'], order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS)
+                               track_order(t, exit_id, "EXIT", t['quantity'])
+                       except: pass
+                    
+                    move_to_history(t, exit_reason, exit_price)
+                
+                # Save remaining trades
+                remaining = [t for t in trades if t['mode'] != mode]
+                save_trades(remaining)
             
-            # Trigger within 2 minutes of the time
-            if now >= exit_dt and (now - exit_dt).seconds < 120:
-                 
-                 # Check if already done for today to prevent spam
-                 if state.get('last_eod_date') != today_str:
-                     
-                     # 1. Close Active Trades (If Any)
-                     active_mode = [t for t in trades if t['mode'] == mode]
-                     if active_mode:
-                         for t in active_mode:
-                             # Determine if it's ACTIVE or PENDING
-                             exit_reason = "TIME_EXIT"
-                             exit_price = t.get('current_ltp', 0)
-                             
-                             if t['status'] == 'PENDING':
-                                 exit_reason = "NOT_ACTIVE"
-                                 exit_price = t['entry_price']
-                             
-                             if t['mode'] == "LIVE" and t['status'] != 'PENDING':
-                                manage_broker_sl(kite, t, cancel_completely=True)
-                                try: 
-                                    kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_SELL, quantity=t['quantity'], order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS)
-                                except: pass
-                             
-                             move_to_history(t, exit_reason, exit_price)
-                         
-                         # Save remaining trades
-                         remaining = [t for t in trades if t['mode'] != mode]
-                         save_trades(remaining)
-                     
-                     # 2. Send EOD Report (ALWAYS, triggers once)
-                     send_eod_report(mode)
-                     
-                     # 3. Mark as Done
-                     state['last_eod_date'] = today_str
-                     save_risk_state(mode, state)
-                     
-                     return
+            # 2. Send EOD Report (ALWAYS, triggers once)
+            send_eod_report(mode)
+            
+            # 3. Mark as Done
+            state['last_eod_date'] = today_str
+            save_risk_state(mode, state)
+            return True
         except Exception as e: 
             print(f"Time Check Error: {e}")
+            return False
 
-        # --- 2. PROFIT LOCKING (Global Trailing) ---
+def schedule_time_rules(kite, is_active=lambda: True):
+    """
+    (Re)registers the time-based rules with the scheduler. Called at startup and after settings are saved.
+    The square-off fires within 2 minutes of its time, while the bot is connected.
+    """
+    current_settings = settings.load_settings()
+    for mode in ["PAPER", "LIVE"]:
+        exit_time = current_settings['modes'][mode].get('universal_exit_time', "15:25")
+        try:
+            scheduler.daily(f"square_off_{mode}", exit_time, lambda mode=mode: is_active() and run_square_off(kite, mode), grace=120)
+        except Exception as e:
+            print(f"Time Check Error ({mode} '{exit_time}'): {e}")
+
+def check_global_exit_conditions(kite, mode, mode_settings):
+    """
+    Checks and executes global risk rules:
+    - Profit Locking (Global PnL Trailing)
+    (The Universal Square-off Time is a scheduled job: see schedule_time_rules)
+    """
+    with TRADE_LOCK:
+        trades = load_trades()
+
+        # --- PROFIT LOCKING (Global Trailing) ---
         pnl_start = float(mode_settings.get('profit_lock', 0))
         if pnl_start > 0:
+            state = get_risk_state(mode)
             current_total_pnl = 0.0
             
             # Calculate PnL consistency (Realized + Unrealized)
-            today_str = datetime.now(IST).strftime("%Y-%m-%d")
-            history = load_history()
-            for t in history:
-                if t.get('exit_time') and t['exit_time'].startswith(today_str) and t['mode'] == mode: 
-                    current_total_pnl += t.get('pnl', 0)
+            # Realized is cached until the history changes (no DB read per pass)
+            current_total_pnl += get_todays_realized_pnl(mode)
             
             active = [t for t in trades if t['mode'] == mode]
             for t in active:
@@ -480,7 +495,10 @@ def check_global_exit_conditions(kite, mode, mode_settings):
                          if t['mode'] == "LIVE" and t['status'] != 'PENDING':
                             manage_broker_sl(kite, t, cancel_completely=True)
                             try: 
-                                kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_SELL, quantity=t['quantity'], order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS)
+                                # Broker SL already filled: the position is flat, no second sell
+                                if not t.get('sl_filled'):
+                                    exit_id = kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_SELL, quantity=t['quantity'], order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS)
+                                    track_order(t, exit_id, "EXIT", t['quantity'])
                             except: pass
                          
                          move_to_history(t, "PROFIT_LOCK", t.get('current_ltp', 0))
@@ -502,48 +520,62 @@ def update_risk_engine(kite):
     check_global_exit_conditions(kite, "PAPER", current_settings['modes']['PAPER'])
     check_global_exit_conditions(kite, "LIVE", current_settings['modes']['LIVE'])
 
+    # Send HIGH_MADE alerts whose coalescing window has elapsed
+    telegram_bot.flush_high_made()
+
     with TRADE_LOCK:
         active_trades = load_trades()
+
+        # Broker SL triggers (incl. SL edits made in other workers) are only sent from here
+        sl_sync.reconcile(kite, active_trades)
         
-        # Load Today's Closed Trades for Missed Opportunity Tracking
-        history = load_history()
+        # Today's Closed Trades for Missed Opportunity Tracking: loaded once a day,
+        # then kept up to date by move_to_history()
         today_str = datetime.now(IST).strftime("%Y-%m-%d")
-        todays_closed = [t for t in history if t.get('exit_time') and t['exit_time'].startswith(today_str)]
+        if trade_index.day != today_str:
+            trade_index.reset_closed(today_str, load_todays_history(today_str))
 
-        # Combine Active Symbols AND Closed Symbols for Data Fetching
-        active_symbols = [f"{t['exchange']}:{t['symbol']}" for t in active_trades]
-        closed_symbols = [f"{t['exchange']}:{t['symbol']}" for t in todays_closed]
-        
-        all_instruments = list(set(active_symbols + closed_symbols))
+        # Active Symbols AND Closed Symbols for Data Fetching (cached by the index)
+        all_instruments = trade_index.instruments()
 
         if not all_instruments: 
             return
 
-        # Fetch Live Prices
+        # Fetch Live Prices (a good quote doubles as the session liveness signal)
         try: 
             live_prices = kite.quote(all_instruments)
-        except: 
+            session_health.mark_ok("quote")
+        except Exception as e: 
+            session_health.mark_error(e, "quote")
             return
 
+        # Only symbols whose price moved (or whose trades changed) are evaluated
+        moved = trade_index.moved(live_prices)
+
         # --- 1. Process ACTIVE TRADES ---
-        active_list = []
+        exited = set()
         updated = False
+        due = []
         
-        for t in active_trades:
+        for inst_key in moved:
+            ltp = live_prices[inst_key]['last_price']
+            
+            # CRITICAL: Always update LTP first, before any logic that might fail
+            for t in trade_index.active_on([inst_key]):
+                if t.get('current_ltp') != ltp:
+                    t['current_ltp'] = ltp
+                    updated = True
+            
+            # Only trades whose trigger levels (entry / SL / target / new high / trail step) were crossed
+            due.extend(trade_index.due(inst_key, ltp))
+        
+        for t in due:
+            updated = True
             # SAFETY BLOCK: Prevent one trade error from crashing the whole loop
             try:
                 inst_key = f"{t['exchange']}:{t['symbol']}"
-                if inst_key not in live_prices:
-                     active_list.append(t)
-                     continue
-                     
                 ltp = live_prices[inst_key]['last_price']
                 
-                # CRITICAL: Always update LTP first, before any logic that might fail
-                if t.get('current_ltp') != ltp:
-                    t['current_ltp'] = ltp
-                    updated = True
-                
                 # A. PENDING ORDERS (Activation Logic)
                 if t['status'] == "PENDING":
                     condition_met = False
@@ -563,20 +595,19 @@ def update_risk_engine(kite):
                         if t['mode'] == 'LIVE':
                             try: 
                                 # Place Market Buy
-                                kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_BUY, quantity=t['quantity'], order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS)
+                                entry_id = kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_BUY, quantity=t['quantity'], order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS)
+                                track_order(t, entry_id, "ENTRY", t['quantity'])
                                 
                                 # Place SL-M
                                 try:
-                                    sl_id = kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_SELL, quantity=t['quantity'], order_type=kite.ORDER_TYPE_SL_M, product=kite.PRODUCT_MIS, trigger_price=t['sl'])
+                                    sl_id = kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_SELL, quantity=t['quantity'], order_type=kite.ORDER_TYPE_SLM, product=kite.PRODUCT_MIS, trigger_price=t['sl'])
                                     t['sl_order_id'] = sl_id
+                                    track_order(t, sl_id, "SL", t['quantity'])
                                 except: 
                                     log_event(t, "Broker SL Fail")
                             except Exception as e: 
                                 log_event(t, f"Broker Fail: {e}")
                         
-                        active_list.append(t)
-                    else: 
-                        active_list.append(t)
                     continue
 
                 # B. ACTIVE ORDERS
@@ -597,7 +628,8 @@ def update_risk_engine(kite):
                             has_crossed_t3 = True
 
                         if has_crossed_t3:
-                             telegram_bot.notify_trade_event(t, "HIGH_MADE", ltp)
+                             # Coalesced: only the latest high per window is sent
+                             telegram_bot.notify_high_made(t, ltp)
                     
                     # --- Step Trailing Logic ---
                     if t.get('trailing_sl', 0) > 0:
@@ -621,18 +653,16 @@ def update_risk_engine(kite):
                             
                             if new_sl > t['sl']:
                                 t['sl'] = new_sl
-                                # Sync Broker
+                                # Sync Broker (coalesced, never blocks the loop)
                                 if t['mode'] == 'LIVE' and t.get('sl_order_id'):
-                                    try: 
-                                        kite.modify_order(variety=kite.VARIETY_REGULAR, order_id=t['sl_order_id'], trigger_price=new_sl)
-                                    except: pass
+                                    sl_sync.request_trigger(kite, t, new_sl)
                                 log_event(t, f"Step Trailing: SL Moved to {t['sl']:.2f} (LTP {ltp})")
 
                     exit_triggered = False
                     exit_reason = ""
                     
-                    # --- Check SL Hit ---
-                    if ltp <= t['sl']:
+                    # --- Check SL Hit (or Broker SL already executed) ---
+                    if ltp <= t['sl'] or t.get('sl_filled'):
                         exit_triggered = True
                         exit_reason = "SL_HIT"
                         
@@ -653,9 +683,7 @@ def update_risk_engine(kite):
                                     t['sl'] = t['entry_price']
                                     log_event(t, f"Target {i+1} Hit: SL Trailed to Entry ({t['sl']})")
                                     if t['mode'] == 'LIVE' and t.get('sl_order_id'):
-                                        try: 
-                                            kite.modify_order(variety=kite.VARIETY_REGULAR, order_id=t['sl_order_id'], trigger_price=t['sl'])
-                                        except: pass
+                                        sl_sync.request_trigger(kite, t, t['sl'])
 
                                 if not conf['enabled']: 
                                     continue
@@ -678,7 +706,8 @@ def update_risk_engine(kite):
                                      
                                      if t['mode'] == 'LIVE':
                                         try: 
-                                            kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_SELL, quantity=qty_to_exit, order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS)
+                                            exit_id = kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_SELL, quantity=qty_to_exit, order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS)
+                                            track_order(t, exit_id, "EXIT", qty_to_exit)
                                         except: pass
 
                     # --- Execute Exit ---
@@ -686,7 +715,10 @@ def update_risk_engine(kite):
                         if t['mode'] == "LIVE":
                             manage_broker_sl(kite, t, cancel_completely=True)
                             try: 
-                                kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_SELL, quantity=t['quantity'], order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS)
+                                # Broker SL already filled: the position is flat, no second sell
+                                if not t.get('sl_filled'):
+                                    exit_id = kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol=t['symbol'], exchange=t['exchange'], transaction_type=kite.TRANSACTION_TYPE_SELL, quantity=t['quantity'], order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS)
+                                    track_order(t, exit_id, "EXIT", t['quantity'])
                             except: pass
                         
                         final_price = t['sl'] if exit_reason=="SL_HIT" else (t['targets'][-1] if exit_reason=="TARGET_HIT" else ltp)
@@ -699,58 +731,69 @@ def update_risk_engine(kite):
                             telegram_bot.notify_trade_event(trade_snap, "SL_HIT", pnl_realized)
                         
                         move_to_history(t, exit_reason, final_price)
-                    else:
-                        active_list.append(t)
+                        exited.add(t['id'])
             except Exception as e:
                 # SAFETY CATCH
                 print(f"Error processing trade {t.get('symbol', 'UNKNOWN')}: {e}")
-                active_list.append(t)
+            
+            # Re-file the trade's trigger levels (SL trailed, target hit, new high, activated)
+            if t['id'] not in exited:
+                trade_index.rebook(t)
         
-        # Save Active Trades if updated
-        if updated: 
-            save_trades(active_list)
+        # Save Active Trades if updated (or closed)
+        if exited:
+            save_trades([t for t in active_trades if t['id'] not in exited])
+        elif updated: 
+            save_trades(active_trades)
 
         # --- 2. Process CLOSED TRADES (Missed Opportunity Tracker) ---
         history_updated = False
         try:
-            for t in todays_closed:
+            # Fresh hot columns only: the JSON documents are neither parsed nor rewritten here
+            closed_keys = trade_index.closed_on(moved)
+            rows = db.session.query(
+                TradeHistory.id, TradeHistory.entry_price, TradeHistory.sl, TradeHistory.made_high, TradeHistory.virtual_sl_hit
+            ).filter(TradeHistory.id.in_(list(closed_keys))).all() if closed_keys else []
+            for t_id, entry, sl, made_high, virtual_sl_hit in rows:
                 # 1. Skip if already marked as Virtual SL Hit
-                if t.get('virtual_sl_hit', False):
+                if virtual_sl_hit:
+                    trade_index.drop_closed(t_id)
+                    continue
+                if entry is None or sl is None:
                     continue
 
-                inst_key = f"{t['exchange']}:{t['symbol']}"
+                inst_key = closed_keys[t_id]
                 if inst_key in live_prices:
                     ltp = live_prices[inst_key]['last_price']
                     
                     # Update LTP for visibility
-                    t['current_ltp'] = ltp
+                    hot = {'current_ltp': ltp}
 
                     # 2. Check Virtual SL (If LTP touches SL, stop tracking)
                     # Handle Direction: BUY (Entry > SL) vs SELL (Entry < SL)
                     is_dead = False
-                    if t['entry_price'] > t['sl']: # BUY
-                         if ltp <= t['sl']: is_dead = True
+                    if entry > sl: # BUY
+                         if ltp <= sl: is_dead = True
                     else: # SELL
-                         if ltp >= t['sl']: is_dead = True
+                         if ltp >= sl: is_dead = True
                     
                     if is_dead:
-                        t['virtual_sl_hit'] = True
-                        db.session.merge(TradeHistory(id=t['id'], data=json.dumps(t)))
-                        history_updated = True
-                        continue
+                        hot['virtual_sl_hit'] = True
+                        trade_index.drop_closed(t_id)
 
                     # 3. Check High Made (Only if alive)
-                    current_high = t.get('made_high', t['entry_price'])
-                    if ltp > current_high:
-                        t['made_high'] = ltp
+                    elif ltp > (made_high if made_high is not None else entry):
+                        hot['made_high'] = ltp
                         
-                        # --- NOTIFICATION: High Made on Closed Trade ---
+                        # --- NOTIFICATION: High Made on Closed Trade (Coalesced) ---
                         try:
-                            telegram_bot.notify_trade_event(t, "HIGH_MADE", ltp)
+                            t = history_record(TradeHistory.query.get(t_id))
+                            t.update(hot)
+                            telegram_bot.notify_high_made(t, ltp)
                         except: pass
                         
-                    # Direct DB merge for efficiency (updating historical record)
-                    db.session.merge(TradeHistory(id=t['id'], data=json.dumps(t)))
+                    # Column-only update (historical record document untouched)
+                    TradeHistory.query.filter_by(id=t_id).update(hot, synchronize_session=False)
                     history_updated = True
                     
         except Exception as e:
@@ -0,0 +1,114 @@
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from database import db
+from managers.common import IST, get_flask_app
+
+RETRY_INTERVAL = 5   # seconds between retries of a job that could not run yet (e.g. bot offline)
+
+def next_daily(hhmm, grace=0, now=None):
+    """
+    Epoch time of the next HH:MM (IST). Today's slot still counts while inside its grace window.
+    """
+    now = now or datetime.now(IST)
+    hour, minute = map(int, str(hhmm).split(":"))
+    due = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if now >= due + timedelta(seconds=grace):
+        due += timedelta(days=1)
+    return due.timestamp()
+
+class Scheduler:
+    """
+    Time-based rules (square-off, EOD report, instrument refresh) on a heap, run by one
+    background thread that sleeps until the next due job. Nothing in the risk loop checks the clock.
+    - daily(name, "HH:MM", action, grace): once a day. If action() returns a falsy value it is
+      retried every RETRY_INTERVAL seconds until 'grace' seconds after the slot, then skipped for the day.
+    - Registering a name again replaces the job (e.g. after a settings change).
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []           # (due, seq, name, generation, slot)
+        self._jobs = {}
+        self._seq = 0
+        self._thread = None
+        self._app = None
+
+    def daily(self, name, hhmm, action, grace=120):
+        with self._cond:
+            gen = self._jobs.get(name, {}).get('gen', 0) + 1
+            self._jobs[name] = {"hhmm": hhmm, "action": action, "grace": grace, "gen": gen, "last_run": None, "last_result": None}
+            due = next_daily(hhmm, grace)
+            self._push(name, due, due)
+            self._cond.notify()
+
+    def cancel(self, name):
+        with self._cond:
+            self._jobs.pop(name, None)
+
+    def _push(self, name, due, slot):
+        job = self._jobs[name]
+        job['due'] = due
+        heapq.heappush(self._heap, (due, self._seq, name, job['gen'], slot))
+        self._seq += 1
+
+    def start(self, app=None):
+        if self._thread is None or not self._thread.is_alive():
+            self._app = app
+            self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    self._cond.wait(timeout=(self._heap[0][0] - time.time()) if self._heap else None)
+                due, _, name, gen, slot = heapq.heappop(self._heap)
+                job = self._jobs.get(name)
+                # Stale entry: job replaced or cancelled since it was queued
+                if job is None or job['gen'] != gen:
+                    continue
+
+            done = self._run(name, job)
+
+            with self._cond:
+                if self._jobs.get(name) is not job:
+                    continue
+                retry_at = time.time() + RETRY_INTERVAL
+                if not done and retry_at < slot + job['grace']:
+                    self._push(name, retry_at, slot)
+                else:
+                    nxt = next_daily(job['hhmm'])
+                    self._push(name, nxt, nxt)
+
+    def _run(self, name, job):
+        app = self._app or get_flask_app()
+        try:
+            if app is not None:
+                with app.app_context():
+                    try:
+                        result = job['action']()
+                    finally:
+                        db.session.remove()
+            else:
+                result = job['action']()
+        except Exception as e:
+            print(f"❌ Scheduled Job '{name}' Error: {e}")
+            result = False
+        job['last_run'] = datetime.now(IST).strftime("%Y-%m-%d %H:%M:%S")
+        job['last_result'] = bool(result)
+        return result
+
+    def status(self):
+        with self._cond:
+            return {
+                name: {
+                    "at": job['hhmm'],
+                    "next": datetime.fromtimestamp(job['due'], IST).strftime("%Y-%m-%d %H:%M:%S"),
+                    "last_run": job['last_run'],
+                    "last_result": job['last_result']
+                } for name, job in self._jobs.items()
+            }
+
+# Singleton Instance
+scheduler = Scheduler()
@@ -0,0 +1,115 @@
+import time
+import threading
+
+# Error texts that mean the access token is dead (Kite TokenException / missing token)
+AUTH_ERROR_MARKERS = ["Token is invalid", "access_token", "TokenException", "No Access Token", "api_key"]
+
+SILENCE_PROBE_AFTER = 30   # seconds without any successful broker response before probing
+PROBE_BACKOFF_BASE = 2     # seconds, doubled after every failed probe
+PROBE_BACKOFF_CAP = 60
+OFFLINE_AFTER = 300        # seconds without any success (probes failing) -> treat as lost
+
+def is_auth_error(err):
+    text = str(err)
+    return any(marker in text for marker in AUTH_ERROR_MARKERS)
+
+class SessionHealth:
+    """
+    Tracks broker session liveness without polling kite.profile() every loop.
+    - Successful quote / order / tick responses mark the session alive (mark_ok).
+    - An explicit profile() probe only runs after SILENCE_PROBE_AFTER seconds of silence
+      or right after an auth-type error, in a background thread with exponential backoff.
+    - check() is non-blocking: the risk loop reads the verdict, it never waits on a probe.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Called after a (re)login: fresh session, nothing suspicious yet."""
+        with self._lock:
+            self.last_ok = time.time()
+            self.last_ok_source = "login"
+            self.last_error = None
+            self.lost_reason = None
+            self._probe_requested = False
+            self._probe_running = False
+            self._probe_failures = 0
+            self._next_probe_at = 0
+            self.probes = 0
+
+    def mark_ok(self, source="quote"):
+        with self._lock:
+            self.last_ok = time.time()
+            self.last_ok_source = source
+            self._probe_failures = 0
+            self._next_probe_at = 0
+
+    def mark_error(self, err, source="quote"):
+        """
+        Records a failed broker call. Auth-type errors request an immediate probe.
+        Returns True if the error looks like an auth failure.
+        """
+        auth = is_auth_error(err)
+        with self._lock:
+            self.last_error = f"{source}: {err}"
+            if auth:
+                self._probe_requested = True
+        return auth
+
+    def check(self, kite):
+        """
+        Non-blocking. Starts a probe if one is due and returns the reason the session
+        is considered lost (None while healthy or undecided).
+        """
+        now = time.time()
+        with self._lock:
+            if self.lost_reason:
+                return self.lost_reason
+
+            if now - self.last_ok > OFFLINE_AFTER and self._probe_failures > 0:
+                self.lost_reason = f"Network: no broker response for {int(now - self.last_ok)}s ({self.last_error})"
+                return self.lost_reason
+
+            due = self._probe_requested or (now - self.last_ok > SILENCE_PROBE_AFTER)
+            if not due or self._probe_running or now < self._next_probe_at:
+                return None
+
+            self._probe_running = True
+            self._probe_requested = False
+
+        threading.Thread(target=self._probe, args=(kite,), daemon=True).start()
+        return None
+
+    def _probe(self, kite):
+        try:
+            kite.profile()
+            self.mark_ok("probe")
+        except Exception as e:
+            with self._lock:
+                self.last_error = f"probe: {e}"
+                if is_auth_error(e):
+                    self.lost_reason = str(e)
+                else:
+                    self._probe_failures += 1
+                    delay = min(PROBE_BACKOFF_CAP, PROBE_BACKOFF_BASE * 2 ** (self._probe_failures - 1))
+                    self._next_probe_at = time.time() + delay
+                    print(f"⚠️ Session Probe Failed ({self._probe_failures}x), next in {delay}s: {e}")
+        finally:
+            with self._lock:
+                self._probe_running = False
+                self.probes += 1
+
+    def status(self):
+        with self._lock:
+            return {
+                "last_ok_age": round(time.time() - self.last_ok, 1),
+                "last_ok_source": self.last_ok_source,
+                "last_error": self.last_error,
+                "lost": self.lost_reason,
+                "probes": self.probes,
+                "probe_failures": self._probe_failures
+            }
+
+# Singleton Instance
+health = SessionHealth()
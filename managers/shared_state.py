@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import threading
+import config
+from database import db, SharedState
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None   # no flock (Windows dev box): locks are per process, every process is the leader
+
+def _run_path(name):
+    os.makedirs(config.RUN_DIR, exist_ok=True)
+    return os.path.join(config.RUN_DIR, name)
+
+class ProcessLock:
+    """
+    Non-reentrant lock shared by the threads of this process AND the other gunicorn workers
+    (thread lock + exclusive flock on a lock file). Drop-in for threading.Lock in 'with' blocks.
+    """
+    def __init__(self, name):
+        self._thread_lock = threading.Lock()
+        self._path = _run_path(name)
+        self._fd = None
+        self._owner = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        if not self._thread_lock.acquire(blocking, timeout):
+            return False
+        if fcntl is not None:
+            try:
+                if self._fd is None:
+                    self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._thread_lock.release()
+                if not blocking:
+                    return False
+                raise
+        self._owner = threading.get_ident()
+        return True
+
+    def owned(self):
+        """True if the calling thread holds the lock."""
+        return self._owner == threading.get_ident()
+
+    def release(self):
+        self._owner = None
+        if fcntl is not None and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class LeaderElection:
+    """
+    Exactly one process runs the background services (risk loop, login, scheduler, Telegram
+    dispatcher, order updates): whoever holds the leader flock. The OS releases it when the
+    leader dies, and a waiting worker takes over within 'interval' seconds.
+    """
+    def __init__(self, name="leader.lock"):
+        self._path = _run_path(name)
+        self._fd = None
+        self.is_leader = False
+        self.since = None
+
+    def try_acquire(self):
+        if self.is_leader:
+            return True
+        if fcntl is None:
+            self.is_leader = True
+        else:
+            fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode())
+            self.is_leader = True
+        self.since = time.strftime("%Y-%m-%d %H:%M:%S")
+        print(f"👑 Worker {os.getpid()} is the leader (background services run here)")
+        return True
+
+    def campaign(self, on_elected, interval=2.0):
+        """Calls on_elected() once this process becomes the leader (immediately if the lock is free)."""
+        if self.try_acquire():
+            on_elected()
+            return
+        def loop():
+            while not self.try_acquire():
+                time.sleep(interval)
+            on_elected()
+        threading.Thread(target=loop, name="leader-campaign", daemon=True).start()
+
+    def status(self):
+        return {"pid": os.getpid(), "leader": self.is_leader, "since": self.since}
+
+class SharedStore:
+    """
+    Small JSON key-value store shared by all workers (SharedState table). Reads are cached per
+    process for max_age seconds so request handlers do not hit the DB every time.
+    """
+    def __init__(self, max_age=1.0):
+        self.max_age = max_age
+        self._cache = {}    # key -> (read_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, max_age=None):
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and time.time() - cached[0] < max_age:
+            return cached[1]
+        try:
+            rec = db.session.get(SharedState, key)
+            value = json.loads(rec.data) if rec else default
+        except Exception as e:
+            print(f"Shared State Read Error ({key}): {e}")
+            db.session.rollback()
+            return cached[1] if cached else default
+        with self._lock:
+            self._cache[key] = (time.time(), value)
+        return value
+
+    def set(self, key, value):
+        try:
+            rec = db.session.get(SharedState, key)
+            if rec is None:
+                rec = SharedState(key=key)
+                db.session.add(rec)
+            rec.data = json.dumps(value)
+            rec.updated_at = time.time()
+            db.session.commit()
+            with self._lock:
+                self._cache[key] = (time.time(), value)
+            return True
+        except Exception as e:
+            print(f"Shared State Write Error ({key}): {e}")
+            db.session.rollback()
+            return False
+
+# Singleton Instances
+leader = LeaderElection()
+shared = SharedStore()
@@ -1,21 +1,51 @@
-import requests
 import json
 import time
+import hashlib
 import threading
-import queue
-import sys
+from collections import deque
+import config
 import settings
 import smart_trader
-from managers.common import get_time_str
-from database import db, TelegramMessage, ActiveTrade
+from managers.common import get_time_str, get_flask_app
+from managers.telegram_sender import TelegramSenderPool, TelegramRetryAfter, call_api
+from database import db, TelegramMessage, TelegramOutbox
+
+# --- Outbox Dispatcher ---
+OUTBOX_POLL = 0.5            # seconds between dispatcher passes (woken early on enqueue)
+OUTBOX_BATCH = 100           # rows claimed per pass
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_BACKOFF_BASE = 2      # seconds, doubled per failed attempt
+OUTBOX_BACKOFF_CAP = 300
+OUTBOX_RETENTION = 3 * 86400 # SENT / FAILED rows kept for dedupe, then pruned
 
 class TelegramManager:
     def __init__(self):
-        self.base_url = "https://api.telegram.org/bot"
-        # Initialize Async Queue and Worker
-        self.msg_queue = queue.Queue()
-        self.worker_thread = threading.Thread(target=self._worker, daemon=True)
-        self.worker_thread.start()
+        self.base_url = f"{config.TELEGRAM_API_URL}/bot"
+        
+        # Thread Tracking: latest sent message per (trade_id, channel key) and
+        # count of queued messages per thread, so replies resolve at send time.
+        self._thread_tips = {}
+        self._thread_inflight = {}
+        self._thread_lock = threading.Lock()
+        
+        # HIGH_MADE Coalescing: trade_id -> latest unsent high + last sent high
+        self._highs = {}
+
+        # Sender Pool: FIFO lane per chat, global + per-chat rate limits, 429 handling
+        self.pool = TelegramSenderPool(self._send_task, self._on_task_done)
+
+        # Durable Outbox: rows survive restarts. Every process writes its alerts to the outbox;
+        # only the leader's dispatcher claims and sends them (start_dispatcher)
+        self._app = None
+        self._dispatcher = None
+        self._sending = False
+        self._dispatch_lock = threading.Lock()
+        self._outbox_wake = threading.Event()
+        self._outbox_inflight = {}      # row ID -> chat ID, handed to the pool and not yet committed
+        self._outbox_results = deque()  # (row_id, msg_id) waiting for the batched commit
+        self._outbox_queue = deque()    # new messages waiting for the batched outbox write
+        self._handed_off = set()        # thread keys this (non-sending) process wrote for the leader
+        self._last_prune = 0
 
     def _get_config(self):
         s = settings.load_settings()
@@ -26,78 +56,346 @@ class TelegramManager:
         Helper to locate the Flask app instance to establish a context 
         for database operations within the background thread.
         """
-        # 1. Try finding 'app' in __main__ (Run as script)
-        if '__main__' in sys.modules and hasattr(sys.modules['__main__'], 'app'):
-            return sys.modules['__main__'].app
-        
-        # 2. Try importing 'main' (Run as module/gunicorn)
-        try:
-            import main
-            if hasattr(main, 'app'):
-                return main.app
-        except ImportError:
-            pass
-        
-        return None
+        return get_flask_app()
+
+    def _thread_enqueued(self, thread_key):
+        with self._thread_lock:
+            self._thread_inflight[thread_key] = self._thread_inflight.get(thread_key, 0) + 1
+
+    def _thread_done(self, thread_key, msg_id):
+        with self._thread_lock:
+            if msg_id:
+                self._thread_tips[thread_key] = msg_id
+            left = self._thread_inflight.get(thread_key, 0) - 1
+            if left > 0:
+                self._thread_inflight[thread_key] = left
+            else:
+                self._thread_inflight.pop(thread_key, None)
 
-    def _worker(self):
+    def _send_task(self, task):
         """
-        Background worker that consumes messages from the queue and sends them.
+        Runs inside a pool worker. Raises TelegramRetryAfter on 429.
         """
-        while True:
-            try:
-                task = self.msg_queue.get()
-                # Unpack: function, args, kwargs, callback_data
-                func, args, kwargs, cb_data = task
-                
-                # Execute Synchronously (in background thread)
-                msg_id = func(*args, **kwargs)
-                
-                # Handle Callback (Save to DB) if successful
-                if msg_id and cb_data:
-                    self._handle_callback(msg_id, cb_data)
-                    
-            except Exception as e:
-                print(f"❌ Telegram Worker Error: {e}")
-            finally:
-                self.msg_queue.task_done()
+        if task.get('method') == 'deleteMessage':
+            if task.get('token'):
+                call_api(f"{self.base_url}{task['token']}/deleteMessage", task['payload'])
+            return None
 
-    def _handle_callback(self, msg_id, data):
+        reply_to = task.get('reply_to')
+        cb_data = task.get('callback')
+        thread_key = cb_data.get('thread_key') if cb_data else None
+        # Deferred Reply: resolve against the thread's latest sent message
+        if task.get('resolve_reply') and thread_key:
+            reply_to = self._thread_tips.get(thread_key, reply_to)
+        
+        return self._send_raw_sync(task['text'], task['chat_id'], reply_to, task.get('token'))
+
+    def _on_task_done(self, task, msg_id):
+        """
+        Runs in the pool worker before the chat's next message is picked.
+        Only in-memory work here; the DB side is committed in batches by the dispatcher.
+        """
+        cb_data = task.get('callback') or {}
+        thread_key = cb_data.get('thread_key')
+        outbox_id = task.get('outbox_id')
+
+        if outbox_id is not None:
+            self._outbox_results.append((outbox_id, msg_id))
+            self._outbox_wake.set()
+            # A failed send stays in flight until its last retry
+            if thread_key and (msg_id or task.get('attempts', 0) + 1 >= OUTBOX_MAX_ATTEMPTS):
+                self._thread_done(thread_key, msg_id)
+        elif thread_key:
+            self._thread_done(thread_key, msg_id)
+
+    def _enqueue(self, text, chat_id, reply_to=None, callback=None, resolve_reply=False, token=None):
+        self._enqueue_many([{
+            'text': text,
+            'chat_id': chat_id,
+            'reply_to': reply_to,
+            'callback': callback,
+            'resolve_reply': resolve_reply,
+            'token': token
+        }])
+
+    def _enqueue_many(self, items):
         """
-        Updates the database with the sent message ID safely using a fresh app context.
+        Queues messages in memory and wakes the outbox thread, which writes them to the outbox
+        in batches (no DB work on the caller's thread, e.g. the risk loop under TRADE_LOCK).
+        Sending is left to the leader's dispatcher. Without a Flask app (scripts) they go straight to the pool.
         """
-        app = self._get_flask_app()
+        if not items: return
+        for item in items:
+            thread_key = (item.get('callback') or {}).get('thread_key')
+            if thread_key: self._thread_enqueued(thread_key)
+
+        app = self._app or self._get_flask_app()
         if not app:
-            print("⚠️ Telegram Worker: Could not find Flask App context for DB save.")
+            for item in items:
+                self.pool.submit(dict(item, method='sendMessage'))
             return
 
+        self._outbox_queue.extend(items)
+        self._start_outbox_thread(app)
+        self._outbox_wake.set()
+
+    def notify_high_made(self, trade, price):
+        """
+        Records a new high instead of sending it right away. Only the latest high per
+        trade is kept; flush_high_made() sends it once the trade's window has elapsed,
+        so a trending market cannot flood the outbox (one pending entry per trade).
+        """
+        if trade.get('id') is None: return
+        with self._thread_lock:
+            entry = self._highs.setdefault(str(trade['id']), {'sent_price': None, 'sent_at': 0})
+            entry['trade'] = dict(trade)
+            entry['price'] = price
+            entry['time'] = get_time_str()
+            entry['seen_at'] = time.time()
+            entry['pending'] = True
+
+    def flush_high_made(self, force=False, trade_id=None):
+        """
+        Sends the newest pending high of every trade whose window has elapsed and
+        whose price moved at least 'high_made_min_step' since the last alert.
+        Called once per risk loop pass. Returns the number of alerts sent.
+        force/trade_id: flush one trade now (before its exit alert).
+        """
+        if not self._highs: return 0
+        conf = self._get_config()
+        try: window = float(conf.get('high_made_window', 60) or 0)
+        except: window = 60
+        try: min_step = float(conf.get('high_made_min_step', 0) or 0)
+        except: min_step = 0
+
+        now = time.time()
+        due = []
+        with self._thread_lock:
+            for key, entry in list(self._highs.items()):
+                if trade_id is not None and key != str(trade_id): continue
+                if not entry.get('pending'):
+                    # Forget trades that stopped making highs
+                    if now - entry['seen_at'] > 6 * 3600:
+                        del self._highs[key]
+                    continue
+                if not force and now - entry['sent_at'] < window: continue
+                if entry['sent_price'] is not None and float(entry['price']) - float(entry['sent_price']) < min_step: continue
+
+                entry['pending'] = False
+                entry['sent_at'] = now
+                entry['sent_price'] = entry['price']
+                due.append((entry['trade'], entry['price'], entry['time']))
+
+        for trade, price, high_time in due:
+            self.notify_trade_event(trade, "HIGH_MADE", {'price': price, 'time': high_time})
+        return len(due)
+
+    def _idempotency_key(self, item):
+        cb = item.get('callback') or {}
+        raw = f"{cb.get('trade_id')}|{cb.get('key')}|{item['chat_id']}|{item.get('dedupe', '')}|{item['text']}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _write_outbox(self):
+        """Outbox thread: writes the queued messages to the outbox in one commit (deduped by idempotency key)."""
+        items = []
+        while self._outbox_queue:
+            items.append(self._outbox_queue.popleft())
+        if not items: return
+        try:
+            keyed = {}
+            duplicates = []
+            for item in items:
+                key = self._idempotency_key(item)
+                if key in keyed: duplicates.append(item)
+                else: keyed[key] = item
+
+            existing = {r.idempotency_key for r in TelegramOutbox.query.filter(TelegramOutbox.idempotency_key.in_(list(keyed))).all()}
+            now = time.time()
+            written = []
+            for key, item in keyed.items():
+                if key in existing:
+                    duplicates.append(item)
+                    continue
+                written.append(item)
+                cb = item.get('callback') or {}
+                db.session.add(TelegramOutbox(
+                    idempotency_key=key,
+                    trade_id=str(cb['trade_id']) if cb.get('trade_id') is not None else None,
+                    channel_key=cb.get('key'),
+                    chat_id=str(item['chat_id']),
+                    text=item['text'],
+                    reply_to=item.get('reply_to'),
+                    resolve_reply=bool(item.get('resolve_reply')),
+                    status='PENDING',
+                    attempts=0,
+                    next_attempt_at=now,
+                    created_at=now
+                ))
+            db.session.commit()
+
+            # Deduped messages are never sent: release their thread slot. Without the dispatcher the
+            # leader sends the rest (and resolves their replies), so this process only remembers the thread
+            for item in duplicates if self._sending else items:
+                thread_key = (item.get('callback') or {}).get('thread_key')
+                if not thread_key: continue
+                if not self._sending and item in written:
+                    self._handed_off.add(thread_key)
+                self._thread_done(thread_key, None)
+        except Exception as e:
+            print(f"❌ Telegram Outbox Write Error: {e}")
+            db.session.rollback()
+            self._outbox_queue.extendleft(reversed(items))   # retried on the next pass
+
+    def start_dispatcher(self, app):
+        """
+        Leader only: claims and sends outbox rows. Rows left PENDING / SENDING by a previous
+        leader (crash / restart / takeover) are picked up on the first pass.
+        """
         with app.app_context():
             try:
-                trade_id = data.get('trade_id')
-                chat_id = data.get('chat_id')
-                key = data.get('key')
-                
-                # 1. Save to TelegramMessage Table
-                self._save_msg_to_db(trade_id, msg_id, chat_id)
-                
-                # 2. Update ActiveTrade JSON (Best effort sync)
-                if key and trade_id:
-                    trade_row = ActiveTrade.query.get(trade_id)
-                    if trade_row:
-                        t_data = json.loads(trade_row.data)
-                        if 'telegram_msg_ids' not in t_data: 
-                            t_data['telegram_msg_ids'] = {}
-                        
-                        t_data['telegram_msg_ids'][key] = msg_id
-                        # Legacy fallback for single channel support
-                        if key == 'main': 
-                            t_data['telegram_msg_id'] = msg_id
-                        
-                        trade_row.data = json.dumps(t_data)
-                        db.session.commit()
+                TelegramOutbox.query.filter_by(status='SENDING') \
+                    .update({'status': 'PENDING'}, synchronize_session=False)
+                db.session.commit()
             except Exception as e:
-                print(f"⚠️ Telegram DB Callback Error: {e}")
+                print(f"⚠️ Telegram Outbox Recovery Error: {e}")
                 db.session.rollback()
+        self._sending = True
+        self._start_outbox_thread(app)
+        self._outbox_wake.set()
+
+    def _start_outbox_thread(self, app):
+        with self._dispatch_lock:
+            if self._dispatcher and self._dispatcher.is_alive():
+                return
+            self._app = app
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="tg-outbox", daemon=True)
+            self._dispatcher.start()
+
+    def _dispatch_loop(self):
+        while True:
+            self._outbox_wake.wait(OUTBOX_POLL)
+            self._outbox_wake.clear()
+            with self._app.app_context():
+                try:
+                    self._write_outbox()
+                    if not self._sending:
+                        continue
+                    self._flush_results()
+                    self._claim_pending()
+                    if time.time() - self._last_prune > 3600:
+                        self._prune_outbox()
+                except Exception as e:
+                    print(f"❌ Telegram Outbox Dispatcher Error: {e}")
+                    db.session.rollback()
+
+    def _flush_results(self):
+        """
+        Applies finished sends in one commit: outbox status, TelegramMessage rows,
+        then the trades' message IDs (one more batched commit).
+        """
+        results = {}
+        while self._outbox_results:
+            row_id, msg_id = self._outbox_results.popleft()
+            results[row_id] = msg_id
+        if not results: return
+
+        now = time.time()
+        attach = []
+        try:
+            for row in TelegramOutbox.query.filter(TelegramOutbox.id.in_(list(results))).all():
+                msg_id = results[row.id]
+                row.attempts = (row.attempts or 0) + 1
+                if msg_id:
+                    row.status = 'SENT'
+                    row.message_id = msg_id
+                    if row.trade_id:
+                        db.session.add(TelegramMessage(trade_id=row.trade_id, message_id=msg_id, chat_id=row.chat_id))
+                        if row.channel_key:
+                            attach.append((row.trade_id, row.channel_key, msg_id))
+                elif row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    row.status = 'FAILED'
+                    row.last_error = "Send failed, retries exhausted"
+                    print(f"❌ Telegram Outbox: giving up on message {row.id} (Chat {row.chat_id})")
+                else:
+                    row.status = 'PENDING'
+                    row.next_attempt_at = now + min(OUTBOX_BACKOFF_CAP, OUTBOX_BACKOFF_BASE * 2 ** (row.attempts - 1))
+                    row.last_error = "Send failed"
+            db.session.commit()
+        except Exception as e:
+            print(f"⚠️ Telegram Outbox Commit Error: {e}")
+            db.session.rollback()
+            # Rows stay SENDING (never resent): the results are applied on a later pass
+            self._outbox_results.extend(results.items())
+            return
+        for row_id in results:
+            self._outbox_inflight.pop(row_id, None)
+
+        if attach:
+            from managers.persistence import attach_telegram_msg_ids
+            attach_telegram_msg_ids(attach)
+
+    def _claim_pending(self):
+        """
+        Hands due PENDING rows to the sender pool in ID order, at most one in flight per chat:
+        the next row of a chat is claimed only once the previous send is committed (a failed row
+        backs off before the rows behind it), so messages and reply threads stay in order.
+        Rows are claimed with a conditional PENDING -> SENDING update, so a row is sent once.
+        """
+        token = self._get_config().get('bot_token')
+        if not token:
+            return   # rows stay PENDING until a bot token is configured
+
+        # Only each chat's oldest pending row can be claimed
+        oldest = db.session.query(db.func.min(TelegramOutbox.id)).filter_by(status='PENDING').group_by(TelegramOutbox.chat_id)
+        rows = TelegramOutbox.query.filter(TelegramOutbox.id.in_(oldest)).order_by(TelegramOutbox.id).limit(OUTBOX_BATCH).all()
+        if not rows: return
+
+        now = time.time()
+        held = set(self._outbox_inflight.values())
+        held.update(c for (c,) in db.session.query(TelegramOutbox.chat_id).filter_by(status='SENDING').distinct())
+        tasks = []
+        for row in rows:
+            if row.chat_id in held: continue
+            held.add(row.chat_id)
+            if (row.next_attempt_at or 0) > now:
+                continue
+
+            thread_key = (row.trade_id, row.channel_key) if row.trade_id else None
+            reply_to = row.reply_to
+            if row.resolve_reply and thread_key and thread_key not in self._thread_tips:
+                # Restarted with the thread's earlier message already sent
+                prev = TelegramOutbox.query.filter_by(trade_id=row.trade_id, channel_key=row.channel_key, status='SENT') \
+                    .order_by(TelegramOutbox.id.desc()).first()
+                if prev: reply_to = prev.message_id
+
+            claimed = TelegramOutbox.query.filter_by(id=row.id, status='PENDING') \
+                .update({'status': 'SENDING'}, synchronize_session=False)
+            if not claimed: continue
+            tasks.append({
+                'method': 'sendMessage',
+                'outbox_id': row.id,
+                'attempts': row.attempts or 0,
+                'token': token,
+                'text': row.text,
+                'chat_id': row.chat_id,
+                'reply_to': reply_to,
+                'resolve_reply': bool(row.resolve_reply),
+                'callback': {'trade_id': row.trade_id, 'key': row.channel_key, 'chat_id': row.chat_id, 'thread_key': thread_key}
+            })
+        if not tasks: return
+        db.session.commit()
+
+        for task in tasks:
+            self._outbox_inflight[task['outbox_id']] = task['chat_id']
+            self.pool.submit(task)
+
+    def _prune_outbox(self):
+        self._last_prune = time.time()
+        TelegramOutbox.query.filter(
+            TelegramOutbox.status.in_(['SENT', 'FAILED']),
+            TelegramOutbox.created_at < self._last_prune - OUTBOX_RETENTION
+        ).delete(synchronize_session=False)
+        db.session.commit()
 
     def _format_msg(self, template_key, trade, extra_data=None, action_time=None):
         """
@@ -159,14 +457,14 @@ class TelegramManager:
             print(f"Template Error ({template_key}): {e}")
             return f"Template Error: {template_key}"
 
-    def _send_raw_sync(self, text, chat_id, reply_to_id=None):
+    def _send_raw_sync(self, text, chat_id, reply_to_id=None, token=None):
         """
         Internal synchronous method to execute the network request.
-        Running inside the worker thread.
+        Running inside a sender pool worker. Raises TelegramRetryAfter on 429.
         """
         if not chat_id: return None
-        conf = self._get_config()
-        token = conf.get('bot_token')
+        if not token:
+            token = self._get_config().get('bot_token')
         if not token: return None
 
         url = f"{self.base_url}{token}/sendMessage"
@@ -179,11 +477,11 @@ class TelegramManager:
             payload["reply_to_message_id"] = reply_to_id
 
         try:
-            resp = requests.post(url, json=payload, timeout=5)
-            if resp.status_code == 200:
-                return resp.json().get('result', {}).get('message_id')
-            else:
-                print(f"❌ Telegram Error (Chat {chat_id}): {resp.text}")
+            result = call_api(url, payload)
+            if result:
+                return result.get('message_id')
+        except TelegramRetryAfter:
+            raise
         except Exception as e:
             print(f"❌ Telegram Request Failed: {e}")
         return None
@@ -199,13 +497,8 @@ class TelegramManager:
         
         chat_id = override_chat_id if override_chat_id else conf.get('channel_id')
         
-        # Enqueue the task
-        self.msg_queue.put((
-            self._send_raw_sync,       # Function
-            [text, chat_id, reply_to_id], # Args
-            {},                        # Kwargs
-            None                       # No Callback needed for generic messages
-        ))
+        # Enqueue the task (No Callback needed for generic messages)
+        self._enqueue(text, chat_id, reply_to_id, token=conf.get('bot_token'))
 
     def notify_system_event(self, event_type, message=""):
         conf = self._get_config()
@@ -232,6 +525,10 @@ class TelegramManager:
         if not conf.get('enable_notifications', False):
             return {}
 
+        # A coalesced high still waiting must go out before the exit alert
+        if event_type in ['SL_HIT', 'EXIT'] and str(trade.get('id')) in self._highs:
+            self.flush_high_made(force=True, trade_id=trade.get('id'))
+
         toggles = conf.get('event_toggles', {})
         if not toggles.get(event_type, True): 
             return {}
@@ -253,6 +550,7 @@ class TelegramManager:
             {'key': 'z2h', 'id': conf.get('z2h_channel_id'), 'custom_name': conf.get('z2h_channel_name')}
         ]
         
+        outgoing = []
         early_events = ['NEW_TRADE', 'ACTIVE', 'UPDATE']
         result_events = ['TARGET_HIT', 'HIGH_MADE', 'SL_HIT']
         target_list = trade.get('target_channels') 
@@ -280,16 +578,23 @@ class TelegramManager:
             elif key == 'free' and event_type not in ['NEW_TRADE', 'ACTIVE', 'UPDATE', 'TARGET_HIT', 'HIGH_MADE']: continue
             
             # --- THREAD LOGIC ---
+            thread_key = (str(trade.get('id')), key) if trade.get('id') is not None else None
             reply_to = stored_ids.get(key)
+            if thread_key:
+                reply_to = self._thread_tips.get(thread_key, reply_to)
             is_new_thread_start = False
 
+            # Earlier messages of this thread still queued -> resolve reply at send time
+            resolve_reply = bool(thread_key) and (self._thread_inflight.get(thread_key, 0) > 0 or thread_key in self._handed_off)
+
             if event_type == "NEW_TRADE":
                 reply_to = None 
+                resolve_reply = False
 
-            if key == 'free' and not reply_to:
+            if key == 'free' and not reply_to and not resolve_reply:
                 is_new_thread_start = True
 
-            if event_type != "NEW_TRADE" and not reply_to and not is_new_thread_start:
+            if event_type != "NEW_TRADE" and not reply_to and not is_new_thread_start and not resolve_reply:
                 continue
 
             # --- MESSAGE FORMATTING ---
@@ -308,38 +613,48 @@ class TelegramManager:
             callback_data = {
                 "trade_id": trade.get('id'),
                 "key": key,
-                "chat_id": chat_id
+                "chat_id": chat_id,
+                "thread_key": thread_key
             }
             
-            self.msg_queue.put((
-                self._send_raw_sync,
-                [msg, chat_id, reply_to],
-                {},
-                callback_data
-            ))
+            outgoing.append({
+                'text': msg,
+                'chat_id': chat_id,
+                'reply_to': reply_to,
+                'callback': callback_data,
+                'resolve_reply': resolve_reply,
+                'token': conf.get('bot_token'),
+                'dedupe': f"{event_type}|{action_time}"
+            })
+
+        # All channels of one event share a single outbox commit
+        self._enqueue_many(outgoing)
 
         # Returns empty because IDs are updated asynchronously via callback
         return {}
 
-    def _save_msg_to_db(self, trade_id, msg_id, chat_id):
-        """Helper to safely save message ID to database table"""
-        if not trade_id or not msg_id or not chat_id:
-            return
-            
-        try:
-            rec = TelegramMessage(trade_id=str(trade_id), message_id=msg_id, chat_id=str(chat_id))
-            db.session.add(rec)
-            db.session.commit()
-        except Exception as e:
-            # print(f"⚠️ Failed to save Telegram Msg ID: {e}")
-            pass
+    def notify_trade_events(self, events):
+        """
+        Enqueues a stream of (trade, event_type, extra_data) in order.
+        Per-chat ordering and reply threading are kept by the worker.
+        """
+        count = 0
+        for trade, event_type, extra_data in events:
+            self.notify_trade_event(trade, event_type, extra_data)
+            count += 1
+        return count
 
     def delete_trade_messages(self, trade_id):
         """
         Deletes messages associated with a trade.
-        Uses a separate thread for logic to avoid blocking, reusing the original robust pattern.
+        The API calls are queued on the sender pool, so this never blocks.
         """
         try:
+            # Drop alerts for this trade that are still waiting in the outbox
+            TelegramOutbox.query.filter_by(trade_id=str(trade_id), status='PENDING') \
+                .update({'status': 'FAILED', 'last_error': 'Trade deleted'}, synchronize_session=False)
+            db.session.commit()
+
             # Fetch messages
             messages = TelegramMessage.query.filter_by(trade_id=str(trade_id)).all()
             if not messages: return
@@ -352,22 +667,15 @@ class TelegramManager:
             db.session.commit()
             print(f"🗑️ Deleted {len(messages)} Telegram messages from DB for Trade {trade_id}")
 
-            def bg_cleanup(token, items):
-                delete_url = f"{self.base_url}{token}/deleteMessage"
-                for item in items:
-                    try:
-                        requests.post(delete_url, json=item, timeout=5)
-                        time.sleep(0.1) 
-                    except Exception as req_err:
-                        print(f"BG Delete Request Error: {req_err}")
-
-            conf = self._get_config()
-            token = conf.get('bot_token')
-            
-            if token and msg_data_list:
-                t = threading.Thread(target=bg_cleanup, args=(token, msg_data_list))
-                t.daemon = True 
-                t.start()
+            # Deletions share the chat lanes and rate limits with normal sends
+            token = self._get_config().get('bot_token')
+            for item in msg_data_list if token else []:
+                self.pool.submit({
+                    'method': 'deleteMessage',
+                    'token': token,
+                    'chat_id': item['chat_id'],
+                    'payload': item
+                })
 
         except Exception as e:
             print(f"❌ Error deleting Telegram messages: {e}")
@@ -0,0 +1,176 @@
+import time
+import threading
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+from managers.rate_limit import TokenBucket
+
+# Telegram Bot API limits (approximate, per official FAQ)
+GLOBAL_RATE = 30      # msgs / sec across all chats
+CHAT_RATE = 1.0       # msgs / sec inside one chat
+CHAT_BURST = 3        # short bursts tolerated per chat
+POOL_WORKERS = 4
+
+class TelegramRetryAfter(Exception):
+    """
+    Raised when Telegram answers 429 with 'retry_after' (seconds).
+    """
+    def __init__(self, retry_after):
+        super().__init__(f"Retry after {retry_after}s")
+        self.retry_after = float(retry_after)
+
+_local = threading.local()
+
+def get_session():
+    """
+    Keep-alive HTTP session, one per thread (requests.Session is not thread-safe).
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+    return session
+
+def call_api(url, payload, timeout=5):
+    """
+    POSTs a Bot API call. Returns the decoded 'result' on success, None on API error.
+    Raises TelegramRetryAfter on 429 and requests exceptions on network errors.
+    """
+    resp = get_session().post(url, json=payload, timeout=timeout)
+    if resp.status_code == 200:
+        return resp.json().get('result', {})
+
+    if resp.status_code == 429:
+        retry_after = 1
+        try: retry_after = resp.json().get('parameters', {}).get('retry_after', 1)
+        except: pass
+        raise TelegramRetryAfter(retry_after)
+
+    print(f"❌ Telegram Error (Chat {payload.get('chat_id')}): {resp.text}")
+    return None
+
+class TelegramSenderPool:
+    """
+    Worker pool for Telegram sends.
+    - One FIFO lane per chat ID; a chat is served by at most one worker at a time,
+      so messages to the same chat keep their order.
+    - Global and per-chat token buckets; a slow or rate-limited chat only delays itself.
+    - On 429 the same message is retried after 'retry_after' (only that chat pauses).
+
+    send_func(task) performs the request and returns a result (e.g. message_id).
+    on_result(task, result) runs before the next message of the same chat is picked.
+    """
+    def __init__(self, send_func, on_result=None, workers=POOL_WORKERS, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST):
+        self.send_func = send_func
+        self.on_result = on_result
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(global_rate, global_rate)
+        self._lanes = {}
+        self._busy = set()
+        self._paused_until = {}
+        self._chat_buckets = {}
+        self._cond = threading.Condition()
+        self._threads = []
+        for i in range(workers):
+            th = threading.Thread(target=self._worker, name=f"tg-sender-{i}", daemon=True)
+            th.start()
+            self._threads.append(th)
+
+    def submit(self, task):
+        """
+        Queues a task dict (must contain 'chat_id'). Non-blocking.
+        """
+        chat = str(task['chat_id'])
+        with self._cond:
+            self._lanes.setdefault(chat, deque()).append(task)
+            self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return sum(len(l) for l in self._lanes.values()) + len(self._busy)
+
+    def join(self, timeout=None):
+        """
+        Waits until every lane is drained. Returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while any(self._lanes.values()) or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+        return True
+
+    def _chat_bucket(self, chat):
+        bucket = self._chat_buckets.get(chat)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat] = bucket
+        return bucket
+
+    def _pick(self):
+        """
+        Called with the condition held. Returns (chat, task, wait_seconds).
+        """
+        now = time.monotonic()
+        wait = None
+        for chat in list(self._lanes):
+            lane = self._lanes[chat]
+            if not lane:
+                if chat not in self._busy:
+                    del self._lanes[chat]
+                continue
+            if chat in self._busy:
+                continue
+
+            paused = self._paused_until.get(chat, 0) - now
+            if paused > 0:
+                wait = paused if wait is None else min(wait, paused)
+                continue
+
+            bucket = self._chat_bucket(chat)
+            if bucket.try_acquire():
+                self._busy.add(chat)
+                # Round-robin: move served chat to the back
+                self._lanes[chat] = self._lanes.pop(chat)
+                return chat, lane.popleft(), None
+
+            delay = bucket.wait_time()
+            wait = delay if wait is None else min(wait, delay)
+        return None, None, wait
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    chat, task, wait = self._pick()
+                    if task is not None:
+                        break
+                    self._cond.wait(timeout=wait)
+
+            self._global.acquire()
+            result = None
+            retry_after = None
+            try:
+                result = self.send_func(task)
+            except TelegramRetryAfter as r:
+                retry_after = r.retry_after
+                print(f"⏳ Telegram 429 (Chat {chat}): retry after {retry_after}s")
+            except Exception as e:
+                print(f"❌ Telegram Request Failed: {e}")
+
+            if retry_after is None and self.on_result:
+                try: self.on_result(task, result)
+                except Exception as e: print(f"❌ Telegram Result Handler Error: {e}")
+
+            with self._cond:
+                if retry_after is not None:
+                    self._paused_until[chat] = time.monotonic() + retry_after
+                    self._lanes.setdefault(chat, deque()).appendleft(task)
+                self._busy.discard(chat)
+                self._cond.notify_all()
@@ -0,0 +1,227 @@
+import math
+import threading
+from bisect import bisect_left, bisect_right
+
+def inst_key(trade):
+    return f"{trade['exchange']}:{trade['symbol']}"
+
+def trigger_levels(trade):
+    """
+    (lower, upper): the risk engine only needs to evaluate the trade once LTP <= lower or
+    LTP >= upper. None means no trigger on that side.
+    - PENDING: the entry price, in its trigger direction.
+    - OPEN: lower = SL; upper = the nearest of the next unhit target, a new high
+      (HIGH_MADE / made_high) and the next step-trailing move.
+    """
+    status = trade.get('status')
+    if status == "PENDING":
+        if trade.get('trigger_dir') == 'BELOW': return trade['entry_price'], None
+        if trade.get('trigger_dir') == 'ABOVE': return None, trade['entry_price']
+        return None, None
+
+    if status not in ['OPEN', 'PROMOTED_LIVE']:
+        return None, None
+
+    hit = trade.get('targets_hit_indices', [])
+    uppers = [tgt for i, tgt in enumerate(trade.get('targets') or []) if i not in hit]
+    uppers.append(math.nextafter(trade.get('highest_ltp', 0), math.inf))
+    step = trade.get('trailing_sl', 0)
+    if step > 0:
+        uppers.append(trade['sl'] + 2 * step)
+    return trade['sl'], min(uppers)
+
+class _Book:
+    """Sorted (level, trade_id) pairs (bisect arrays) of one side of a symbol."""
+    def __init__(self):
+        self.levels = []
+        self.ids = []
+
+    def add(self, level, t_id):
+        i = bisect_right(self.levels, level)
+        self.levels.insert(i, level)
+        self.ids.insert(i, t_id)
+
+    def remove(self, level, t_id):
+        i = bisect_left(self.levels, level)
+        while i < len(self.levels) and self.levels[i] == level:
+            if self.ids[i] == t_id:
+                del self.levels[i], self.ids[i]
+                return
+            i += 1
+
+    def at_or_above(self, price):
+        return self.ids[bisect_left(self.levels, price):]
+
+    def at_or_below(self, price):
+        return self.ids[:bisect_right(self.levels, price)]
+
+class TradeIndex:
+    """
+    Symbol -> trades index for the risk engine, so a pass only evaluates what moved.
+    - Active / pending trades: kept in sync by save_trades() (every create / close goes through it).
+    - Closed trades tracked today (missed-opportunity tracker): ids only, added by move_to_history(),
+      dropped once their virtual SL is hit. Their rows are read fresh when their symbol moves.
+    - moved(prices) returns the instruments whose price changed since the last pass, plus the ones
+      touched in between (new trade, edited SL / targets, broker fill).
+    - Trigger books: per symbol, sorted arrays of every active trade's lower / upper trigger level,
+      so due(key, ltp) finds the trades whose levels were crossed in O(log n + k).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}        # inst_key -> {trade_id: trade}
+        self._active_ids = {}    # trade_id -> (inst_key, trade)
+        self._closed = {}        # inst_key -> set(trade_id)
+        self._closed_ids = {}    # trade_id -> inst_key
+        self._last_price = {}    # inst_key -> last evaluated price
+        self._dirty = set()
+        self._forced = set()     # touched instruments of the current pass: every trade is due
+        self._books = {}         # inst_key -> (lower book, upper book)
+        self._booked = {}        # trade_id -> (inst_key, lower, upper)
+        self._instruments = None
+        self.day = None
+
+    # --- Active Trades ---
+    def set_active(self, trades):
+        """Diffs the active book against the index (by id and object identity)."""
+        with self._lock:
+            seen = set()
+            for t in trades:
+                t_id = t['id']
+                seen.add(t_id)
+                known = self._active_ids.get(t_id)
+                if known is not None and known[1] is t:
+                    continue
+                if known is not None:
+                    self._remove_active(t_id)
+                key = inst_key(t)
+                self._active.setdefault(key, {})[t_id] = t
+                self._active_ids[t_id] = (key, t)
+                self._book(t)
+                self._dirty.add(key)
+                self._instruments = None
+            for t_id in [i for i in self._active_ids if i not in seen]:
+                self._remove_active(t_id)
+
+    def _remove_active(self, t_id):
+        key, _ = self._active_ids.pop(t_id)
+        self._unbook(t_id)
+        bucket = self._active.get(key, {})
+        bucket.pop(t_id, None)
+        if not bucket:
+            self._active.pop(key, None)
+        self._instruments = None
+
+    def touch(self, trade):
+        """Forces the trade's symbol to be evaluated on the next pass (state changed, price did not)."""
+        with self._lock:
+            self._dirty.add(inst_key(trade))
+            if trade['id'] in self._active_ids:
+                self._book(trade)
+
+    # --- Trigger Books ---
+    def _unbook(self, t_id):
+        booked = self._booked.pop(t_id, None)
+        if booked is None: return
+        key, lower, upper = booked
+        books = self._books[key]
+        if lower is not None: books[0].remove(lower, t_id)
+        if upper is not None: books[1].remove(upper, t_id)
+
+    def _book(self, trade):
+        t_id = trade['id']
+        key = inst_key(trade)
+        lower, upper = trigger_levels(trade)
+        if self._booked.get(t_id) == (key, lower, upper):
+            return
+        self._unbook(t_id)
+        books = self._books.setdefault(key, (_Book(), _Book()))
+        if lower is not None: books[0].add(lower, t_id)
+        if upper is not None: books[1].add(upper, t_id)
+        self._booked[t_id] = (key, lower, upper)
+
+    def rebook(self, trade):
+        """Re-files the trade's trigger levels after the engine changed it (SL moved, target hit, ...)."""
+        with self._lock:
+            if trade['id'] in self._active_ids:
+                self._book(trade)
+
+    def due(self, key, ltp):
+        """Active trades on 'key' that must be evaluated at 'ltp' (crossed levels, or all if touched)."""
+        with self._lock:
+            trades = self._active.get(key, {})
+            if key in self._forced:
+                return list(trades.values())
+            books = self._books.get(key)
+            if not books: return []
+            ids = set(books[0].at_or_above(ltp)) | set(books[1].at_or_below(ltp))
+            return [trades[i] for i in sorted(ids) if i in trades]
+
+    def active_on(self, keys):
+        with self._lock:
+            return [t for k in keys for t in self._active.get(k, {}).values()]
+
+    # --- Closed Trades (tracked for the day) ---
+    def reset_closed(self, day, trades):
+        with self._lock:
+            self.day = day
+            self._closed, self._closed_ids = {}, {}
+            self._last_price = {}
+            for t in trades:
+                self._add_closed(t)
+            self._instruments = None
+
+    def add_closed(self, trade):
+        if not self.day or not str(trade.get('exit_time', '')).startswith(self.day):
+            return
+        with self._lock:
+            self._add_closed(trade)
+            self._instruments = None
+
+    def _add_closed(self, trade):
+        if trade.get('virtual_sl_hit'): return
+        key = inst_key(trade)
+        self._closed.setdefault(key, set()).add(trade['id'])
+        self._closed_ids[trade['id']] = key
+
+    def drop_closed(self, trade_id):
+        with self._lock:
+            key = self._closed_ids.pop(trade_id, None)
+            if key is None: return
+            ids = self._closed.get(key, set())
+            ids.discard(trade_id)
+            if not ids:
+                self._closed.pop(key, None)
+            self._instruments = None
+
+    def closed_on(self, keys):
+        """{trade_id: inst_key} for the tracked closed trades on 'keys'."""
+        with self._lock:
+            return {t_id: k for k in keys for t_id in self._closed.get(k, ())}
+
+    # --- Prices ---
+    def instruments(self):
+        """Instruments to quote (active + tracked closed), rebuilt only when the index changes."""
+        with self._lock:
+            if self._instruments is None:
+                self._instruments = sorted(set(self._active) | set(self._closed))
+            return self._instruments
+
+    def moved(self, prices):
+        """Instruments whose last_price changed since the previous call, or that were touched."""
+        with self._lock:
+            keys = self._dirty
+            self._forced = set(keys)
+            self._dirty = set()
+            for key, quote in prices.items():
+                ltp = quote.get('last_price')
+                if self._last_price.get(key) != ltp:
+                    self._last_price[key] = ltp
+                    keys.add(key)
+            return [k for k in keys if k in prices]
+
+    def stats(self):
+        with self._lock:
+            return {"active": len(self._active_ids), "closed_tracked": len(self._closed_ids), "instruments": len(set(self._active) | set(self._closed))}
+
+# Singleton Instance
+index = TradeIndex()
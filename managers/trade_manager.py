@@ -1,9 +1,12 @@
 import time
 import copy
+from concurrent.futures import ThreadPoolExecutor
 import smart_trader
-from managers.persistence import TRADE_LOCK, load_trades, save_trades
+from managers.persistence import TRADE_LOCK, load_trades, save_trades, count_new_trades
 from managers.common import get_time_str, log_event
 from managers import broker_ops
+from managers.order_updates import track_order
+from managers.trade_index import index as trade_index
 from managers.telegram_manager import bot as telegram_bot
 
 def create_trade_direct(kite, mode, specific_symbol, quantity, sl_points, custom_targets, order_type, limit_price=0, target_controls=None, trailing_sl=0, sl_to_entry=0, exit_multiplier=1, target_channels=None, risk_ratios=None):
@@ -12,47 +15,97 @@ def create_trade_direct(kite, mode, specific_symbol, quantity, sl_points, custom
     Handles initial broker orders (if Live), calculates targets, and saves the trade to the DB.
     Accepts 'target_channels' list (e.g., ['main', 'vip']) to filter notifications.
     Now accepts 'risk_ratios' (list of 3 floats) to override default [0.5, 1, 2] target calculation.
-    INCLUDES DEBUG LOGGING.
+    Single-leg case of create_trades_multi.
     """
-    print(f"\n[DEBUG] --- START CREATE TRADE ({mode}) ---")
-    print(f"[DEBUG] Symbol: {specific_symbol}, Qty: {quantity}")
+    leg = {
+        "mode": mode, "quantity": quantity, "sl_points": sl_points, "custom_targets": custom_targets,
+        "target_controls": target_controls, "trailing_sl": trailing_sl, "sl_to_entry": sl_to_entry,
+        "exit_multiplier": exit_multiplier, "target_channels": target_channels, "risk_ratios": risk_ratios
+    }
+    return create_trades_multi(kite, specific_symbol, order_type, limit_price, [leg])[0]
+
+def _place_entry_orders(kite, symbol, exchange, quantity, sl_trigger):
+    """
+    Broker side of one LIVE leg: Market entry, then the SL-M order.
+    Returns (order_id, sl_order_id, logs). Raises if the entry is rejected.
+    """
+    logs = []
+    sl_order_id = None
+
+    # 1. Place Entry Order (Using wrapper)
+    order_id = broker_ops.place_order(
+        kite,
+        symbol=symbol,
+        exchange=exchange, 
+        transaction_type=kite.TRANSACTION_TYPE_BUY, 
+        quantity=quantity, 
+        order_type=kite.ORDER_TYPE_MARKET, 
+        product=kite.PRODUCT_MIS,
+        tag="RD_ENTRY"
+    )
     
+    if not order_id:
+        raise Exception("Broker Rejected Entry Order")
+
+    # 2. Place Broker SL-M Order (Using wrapper)
+    try:
+        sl_order_id = broker_ops.place_order(
+            kite, 
+            symbol=symbol, 
+            exchange=exchange, 
+            transaction_type=kite.TRANSACTION_TYPE_SELL, 
+            quantity=quantity, 
+            order_type=kite.ORDER_TYPE_SLM, 
+            product=kite.PRODUCT_MIS, 
+            trigger_price=sl_trigger,
+            tag="RD_SL"
+        )
+        logs.append(f"[{get_time_str()}] Broker SL Placed: ID {sl_order_id}")
+    except Exception as sl_e: 
+        logs.append(f"[{get_time_str()}] Broker SL FAILED: {sl_e}")
+    return order_id, sl_order_id, logs
+
+def create_trades_multi(kite, specific_symbol, order_type, limit_price, legs):
+    """
+    Creates one trade per leg on the same symbol from a single entry snapshot (e.g. SHADOW: LIVE + PAPER).
+    - The LTP is fetched once and shared by every leg.
+    - The broker orders of all LIVE legs are placed concurrently (about one round-trip in total).
+    - All records are saved in one persistence transaction.
+    Each leg is a dict of create_trade_direct's per-trade arguments (mode, quantity, sl_points, ...).
+    A leg with 'required': True that fails aborts every leg (nothing is saved).
+    Returns one result per leg: {"status": "success", "trade": record} or {"status": "error", "message": ...}.
+    """
+    print(f"\n[DEBUG] --- START CREATE TRADE ({', '.join(l['mode'] for l in legs)}) ---")
+    print(f"[DEBUG] Symbol: {specific_symbol}, Qty: {[l['quantity'] for l in legs]}")
+    
+    results = [None] * len(legs)
     try:
         with TRADE_LOCK:
             trades = load_trades()
             current_ts = int(time.time())
             
             # --- FIX: ROBUST DUPLICATE CHECK ---
-            for t in trades:
-                # 1. If Modes are different (e.g. Paper vs Live), it is NOT a duplicate. Skip check.
-                if t.get('mode') != mode:
-                    continue
-                
-                # 2. Check strict duplicates within the same mode
-                if t['symbol'] == specific_symbol and t['quantity'] == quantity and (current_ts - t['id']) < 5:
-                     print(f"[DEBUG] Duplicate Blocked: {specific_symbol}")
-                     return {"status": "error", "message": "Duplicate Trade Blocked"}
-
-            # --- FIX: UNIQUE ID GENERATION ---
-            # Ensure new_id is always greater than the max existing ID to prevent overwrites
-            new_id = current_ts
-            existing_ids = [t['id'] for t in trades]
-            if existing_ids:
-                max_id = max(existing_ids)
-                if new_id <= max_id:
-                    new_id = max_id + 1
-            
-            print(f"[DEBUG] Generated New ID: {new_id}")
+            for i, leg in enumerate(legs):
+                for t in trades:
+                    # 1. If Modes are different (e.g. Paper vs Live), it is NOT a duplicate. Skip check.
+                    if t.get('mode') != leg['mode']:
+                        continue
+                    
+                    # 2. Check strict duplicates within the same mode
+                    if t['symbol'] == specific_symbol and t['quantity'] == leg['quantity'] and (current_ts - t['id']) < 5:
+                         print(f"[DEBUG] Duplicate Blocked: {specific_symbol}")
+                         results[i] = {"status": "error", "message": "Duplicate Trade Blocked"}
+                         break
 
             # 1. Detect Exchange (e.g., NSE, NFO)
             exchange = smart_trader.get_exchange_name(specific_symbol)
             
-            # 2. Fetch LTP using the safe function
+            # 2. Fetch LTP using the safe function (once for every leg)
             current_ltp = smart_trader.get_ltp(kite, specific_symbol)
             
             if current_ltp == 0:
                 print(f"[DEBUG] Error: LTP 0")
-                return {"status": "error", "message": f"Could not fetch LTP for Symbol: {specific_symbol}"}
+                return [{"status": "error", "message": f"Could not fetch LTP for Symbol: {specific_symbol}"} for _ in legs]
 
             # Determine Entry Status
             status = "OPEN"
@@ -64,146 +117,157 @@ def create_trade_direct(kite, mode, specific_symbol, quantity, sl_points, custom
                 status = "PENDING"
                 trigger_dir = "ABOVE" if entry_price >= current_ltp else "BELOW"
 
-            logs = []
-            sl_order_id = None
-            
-            # Execute Live Order if Mode is LIVE and Status is OPEN (Market Order)
-            if mode == "LIVE" and status == "OPEN":
-                try:
-                    # 1. Place Entry Order (Using wrapper)
-                    order_id = broker_ops.place_order(
-                        kite,
-                        symbol=specific_symbol,
-                        exchange=exchange, 
-                        transaction_type=kite.TRANSACTION_TYPE_BUY, 
-                        quantity=quantity, 
-                        order_type=kite.ORDER_TYPE_MARKET, 
-                        product=kite.PRODUCT_MIS,
-                        tag="RD_ENTRY"
-                    )
-                    
-                    if not order_id:
-                         return {"status": "error", "message": "Broker Rejected Entry Order"}
-
-                    # 2. Place Broker SL-M Order (Using wrapper)
-                    sl_trigger = entry_price - sl_points 
+            # Execute Live Orders if Mode is LIVE and Status is OPEN (Market Order), all legs concurrently
+            placed = {}
+            live_legs = [i for i, leg in enumerate(legs) if results[i] is None and leg['mode'] == "LIVE" and status == "OPEN"]
+            if live_legs:
+                with ThreadPoolExecutor(max_workers=len(live_legs)) as pool:
+                    futures = {i: pool.submit(_place_entry_orders, kite, specific_symbol, exchange, legs[i]['quantity'], entry_price - legs[i]['sl_points'])
+                               for i in live_legs}
+                for i, future in futures.items():
                     try:
-                        sl_order_id = broker_ops.place_order(
-                            kite, 
-                            symbol=specific_symbol, 
-                            exchange=exchange, 
-                            transaction_type=kite.TRANSACTION_TYPE_SELL, 
-                            quantity=quantity, 
-                            order_type=kite.ORDER_TYPE_SL_M, 
-                            product=kite.PRODUCT_MIS, 
-                            trigger_price=sl_trigger,
-                            tag="RD_SL"
-                        )
-                        logs.append(f"[{get_time_str()}] Broker SL Placed: ID {sl_order_id}")
-                    except Exception as sl_e: 
-                        logs.append(f"[{get_time_str()}] Broker SL FAILED: {sl_e}")
+                        placed[i] = future.result()
+                    except Exception as e: 
+                        print(f"[DEBUG] Broker Error: {e}")
+                        msg = str(e) if str(e) == "Broker Rejected Entry Order" else f"Broker Rejected: {e}"
+                        results[i] = {"status": "error", "message": msg}
 
-                except Exception as e: 
-                    print(f"[DEBUG] Broker Error: {e}")
-                    return {"status": "error", "message": f"Broker Rejected: {e}"}
+            failed_required = [legs[i]['mode'] for i, leg in enumerate(legs) if leg.get('required') and results[i] is not None]
+            if failed_required:
+                for i in range(len(legs)):
+                    if results[i] is None:
+                        results[i] = {"status": "error", "message": f"Skipped: {'/'.join(failed_required)} leg failed"}
+                return results
 
-            # Calculate Targets
-            # Use custom targets if provided (valid T1 > 0), else calculate ratio-based defaults
-            # [UPDATED] Use dynamic risk ratios if provided, otherwise default to [0.5, 1.0, 2.0]
-            use_ratios = risk_ratios if risk_ratios else [0.5, 1.0, 2.0]
-            targets = custom_targets if len(custom_targets) == 3 and custom_targets[0] > 0 else [entry_price + (sl_points * x) for x in use_ratios]
-            
-            # Deep copy to prevent Shadow mode shared reference issues
-            final_target_controls = []
-            if target_controls:
-                final_target_controls = copy.deepcopy(target_controls)
-            else:
-                final_target_controls = [
-                    {'enabled': True, 'lots': 0, 'trail_to_entry': False}, 
-                    {'enabled': True, 'lots': 0, 'trail_to_entry': False}, 
-                    {'enabled': True, 'lots': 1000, 'trail_to_entry': False}
-                ]
-            
-            lot_size = smart_trader.get_lot_size(specific_symbol)
-            
-            # Auto-Match Trailing Logic (-1 sets trail equal to SL risk)
-            final_trailing_sl = float(trailing_sl) if trailing_sl else 0
-            if final_trailing_sl == -1.0: 
-                final_trailing_sl = float(sl_points)
+            # --- FIX: UNIQUE ID GENERATION ---
+            # Ensure every new id is greater than the max existing ID to prevent overwrites
+            new_id = current_ts
+            existing_ids = [t['id'] for t in trades]
+            if existing_ids and new_id <= max(existing_ids):
+                new_id = max(existing_ids) + 1
 
-            # Exit Multiplier Logic: Split quantity and recalculate targets if > 1
-            if exit_multiplier > 1:
-                # Determine the furthest valid target or default to 1:2
-                valid_targets = [x for x in custom_targets if x > 0]
-                final_goal = max(valid_targets) if valid_targets else (entry_price + (sl_points * 2))
-                
-                dist = final_goal - entry_price
-                new_targets = []
-                new_controls = []
-                
-                base_lots = (quantity // lot_size) // exit_multiplier
-                rem = (quantity // lot_size) % exit_multiplier
-                
-                for i in range(1, exit_multiplier + 1):
-                    fraction = i / exit_multiplier
-                    t_price = entry_price + (dist * fraction)
-                    new_targets.append(round(t_price, 2))
-                    
-                    lots_here = base_lots + (rem if i == exit_multiplier else 0)
-                    new_controls.append({'enabled': True, 'lots': int(lots_here), 'trail_to_entry': False})
-                
-                # Fill remaining slots up to 3 (system expects list of 3)
-                while len(new_targets) < 3: 
-                    new_targets.append(0)
-                    new_controls.append({'enabled': False, 'lots': 0, 'trail_to_entry': False})
-                
-                targets = new_targets
-                final_target_controls = new_controls
+            new_records = []
+            for i, leg in enumerate(legs):
+                if results[i] is not None: continue
+                order_id, sl_order_id, logs = placed.get(i, (None, None, []))
+                print(f"[DEBUG] Generated New ID: {new_id}")
+                record = _build_trade_record(
+                    new_id, specific_symbol, exchange, order_type, status, entry_price, current_ltp, trigger_dir,
+                    leg['mode'], leg['quantity'], leg['sl_points'], leg['custom_targets'], leg.get('target_controls'),
+                    leg.get('trailing_sl', 0), leg.get('sl_to_entry', 0), leg.get('exit_multiplier', 1),
+                    leg.get('target_channels'), leg.get('risk_ratios'), sl_order_id, logs
+                )
+                new_id += 1
 
-            logs.insert(0, f"[{get_time_str()}] Trade Added. Status: {status}")
-            
-            record = {
-                "id": new_id, # <--- USE THE UNIQUE ID
-                "entry_time": get_time_str(), 
-                "symbol": specific_symbol, 
-                "exchange": exchange,
-                "mode": mode, 
-                "order_type": order_type, 
-                "status": status, 
-                "entry_price": entry_price, 
-                "quantity": quantity,
-                "sl": entry_price - sl_points, 
-                "targets": targets, 
-                "target_controls": final_target_controls, 
-                "target_channels": target_channels, 
-                "lot_size": lot_size, 
-                "trailing_sl": final_trailing_sl, 
-                "sl_to_entry": int(sl_to_entry),
-                "exit_multiplier": int(exit_multiplier), 
-                "sl_order_id": sl_order_id,
-                "targets_hit_indices": [], 
-                "highest_ltp": entry_price, 
-                "made_high": entry_price, 
-                "current_ltp": current_ltp, 
-                "trigger_dir": trigger_dir, 
-                "logs": logs
-            }
-            
-            # --- SEND TELEGRAM NOTIFICATION ---
-            # Async Call: No longer waits for return value. 
-            # Telegram IDs are updated asynchronously by the Telegram Manager.
-            telegram_bot.notify_trade_event(record, "NEW_TRADE")
+                # Broker fills are matched to the trade asynchronously (order updates)
+                track_order(record, order_id, "ENTRY", leg['quantity'])
+                track_order(record, sl_order_id, "SL", leg['quantity'])
+                
+                # --- SEND TELEGRAM NOTIFICATION ---
+                # Async Call: No longer waits for return value. 
+                # Telegram IDs are updated asynchronously by the Telegram Manager.
+                telegram_bot.notify_trade_event(record, "NEW_TRADE")
+                new_records.append(record)
+                results[i] = {"status": "success", "trade": record}
             
-            print(f"[DEBUG] Appending trade to list. Previous count: {len(trades)}")
-            trades.append(record)
-            print(f"[DEBUG] Saving list. New count: {len(trades)}")
-            save_trades(trades)
-            print(f"[DEBUG] Trade Creation Successful.")
-            return {"status": "success", "trade": record}
+            if new_records:
+                print(f"[DEBUG] Appending {len(new_records)} trade(s) to list. Previous count: {len(trades)}")
+                trades.extend(new_records)
+                count_new_trades(new_records)
+                print(f"[DEBUG] Saving list. New count: {len(trades)}")
+                save_trades(trades)
+                print(f"[DEBUG] Trade Creation Successful.")
+            return results
             
     except Exception as e:
         print(f"[DEBUG] EXCEPTION in Create Trade: {e}")
-        return {"status": "error", "message": str(e)}
+        return [r or {"status": "error", "message": str(e)} for r in results]
+
+def _build_trade_record(new_id, specific_symbol, exchange, order_type, status, entry_price, current_ltp, trigger_dir, mode, quantity, sl_points, custom_targets, target_controls, trailing_sl, sl_to_entry, exit_multiplier, target_channels, risk_ratios, sl_order_id, logs):
+    """Calculates targets / controls for one leg and returns the trade record."""
+    # Calculate Targets
+    # Use custom targets if provided (valid T1 > 0), else calculate ratio-based defaults
+    # [UPDATED] Use dynamic risk ratios if provided, otherwise default to [0.5, 1.0, 2.0]
+    use_ratios = risk_ratios if risk_ratios else [0.5, 1.0, 2.0]
+    targets = custom_targets if len(custom_targets) == 3 and custom_targets[0] > 0 else [entry_price + (sl_points * x) for x in use_ratios]
+    
+    # Deep copy to prevent Shadow mode shared reference issues
+    final_target_controls = []
+    if target_controls:
+        final_target_controls = copy.deepcopy(target_controls)
+    else:
+        final_target_controls = [
+            {'enabled': True, 'lots': 0, 'trail_to_entry': False}, 
+            {'enabled': True, 'lots': 0, 'trail_to_entry': False}, 
+            {'enabled': True, 'lots': 1000, 'trail_to_entry': False}
+        ]
+    
+    lot_size = smart_trader.get_lot_size(specific_symbol)
+    
+    # Auto-Match Trailing Logic (-1 sets trail equal to SL risk)
+    final_trailing_sl = float(trailing_sl) if trailing_sl else 0
+    if final_trailing_sl == -1.0: 
+        final_trailing_sl = float(sl_points)
+
+    # Exit Multiplier Logic: Split quantity and recalculate targets if > 1
+    if exit_multiplier > 1:
+        # Determine the furthest valid target or default to 1:2
+        valid_targets = [x for x in custom_targets if x > 0]
+        final_goal = max(valid_targets) if valid_targets else (entry_price + (sl_points * 2))
+        
+        dist = final_goal - entry_price
+        new_targets = []
+        new_controls = []
+        
+        base_lots = (quantity // lot_size) // exit_multiplier
+        rem = (quantity // lot_size) % exit_multiplier
+        
+        for i in range(1, exit_multiplier + 1):
+            fraction = i / exit_multiplier
+            t_price = entry_price + (dist * fraction)
+            new_targets.append(round(t_price, 2))
+            
+            lots_here = base_lots + (rem if i == exit_multiplier else 0)
+            new_controls.append({'enabled': True, 'lots': int(lots_here), 'trail_to_entry': False})
+        
+        # Fill remaining slots up to 3 (system expects list of 3)
+        while len(new_targets) < 3: 
+            new_targets.append(0)
+            new_controls.append({'enabled': False, 'lots': 0, 'trail_to_entry': False})
+        
+        targets = new_targets
+        final_target_controls = new_controls
+
+    logs.insert(0, f"[{get_time_str()}] Trade Added. Status: {status}")
+    
+    record = {
+        "id": new_id, # <--- USE THE UNIQUE ID
+        "entry_time": get_time_str(), 
+        "symbol": specific_symbol, 
+        "exchange": exchange,
+        "mode": mode, 
+        "order_type": order_type, 
+        "status": status, 
+        "entry_price": entry_price, 
+        "quantity": quantity,
+        "sl": entry_price - sl_points, 
+        "original_sl": entry_price - sl_points, 
+        "targets": targets, 
+        "target_controls": final_target_controls, 
+        "target_channels": target_channels, 
+        "lot_size": lot_size, 
+        "trailing_sl": final_trailing_sl, 
+        "sl_to_entry": int(sl_to_entry),
+        "exit_multiplier": int(exit_multiplier), 
+        "sl_order_id": sl_order_id,
+        "targets_hit_indices": [], 
+        "highest_ltp": entry_price, 
+        "made_high": entry_price, 
+        "current_ltp": current_ltp, 
+        "trigger_dir": trigger_dir, 
+        "logs": logs
+    }
+    return record
 
 def update_trade_protection(kite, trade_id, sl, targets, trailing_sl=0, entry_price=None, target_controls=None, sl_to_entry=0, exit_multiplier=1):
     """
@@ -238,15 +302,8 @@ def update_trade_protection(kite, trade_id, sl, targets, trailing_sl=0, entry_pr
                 
                 # Modify Broker SL if Live
                 if t['mode'] == 'LIVE' and t.get('sl_order_id'):
-                    try:
-                        broker_ops.modify_order(
-                            kite, 
-                            order_id=t['sl_order_id'], 
-                            trigger_price=t['sl']
-                        )
-                        entry_msg += " [Broker SL Updated]"
-                    except Exception as e: 
-                        entry_msg += f" [Broker SL Fail: {e}]"
+                    broker_ops.sl_sync.request_trigger(kite, t, t['sl'])
+                    entry_msg += " [Broker SL Update Queued]"
 
                 # Recalculate Targets if Exit Multiplier Changed
                 if exit_multiplier > 1:
@@ -289,6 +346,8 @@ def update_trade_protection(kite, trade_id, sl, targets, trailing_sl=0, entry_pr
                 # --- TELEGRAM UPDATE ---
                 telegram_bot.notify_trade_event(t, "UPDATE")
                 
+                # New SL / targets must be checked even if the price does not move
+                trade_index.touch(t)
                 updated = True
                 break
                 
@@ -321,7 +380,7 @@ def manage_trade_position(kite, trade_id, action, lot_size, lots_count):
                     if t['mode'] == 'LIVE':
                         try:
                             # Place Market Buy
-                            broker_ops.place_order(
+                            add_id = broker_ops.place_order(
                                 kite, 
                                 symbol=t['symbol'], 
                                 exchange=t['exchange'], 
@@ -331,6 +390,7 @@ def manage_trade_position(kite, trade_id, action, lot_size, lots_count):
                                 product=kite.PRODUCT_MIS,
                                 tag="RD_ADD"
                             )
+                            track_order(t, add_id, "ENTRY", qty_delta)
                             # Update Broker SL Quantity
                             if t.get('sl_order_id'): 
                                 broker_ops.modify_order(
@@ -338,6 +398,7 @@ def manage_trade_position(kite, trade_id, action, lot_size, lots_count):
                                     order_id=t['sl_order_id'], 
                                     quantity=new_total
                                 )
+                                broker_ops.sl_sync.note_quantity(t, new_total)
                         except Exception as e: 
                             log_event(t, f"Broker Fail (Add): {e}")
                     updated = True
@@ -355,7 +416,7 @@ def manage_trade_position(kite, trade_id, action, lot_size, lots_count):
                         # 2. Place Sell Order
                         if t['mode'] == 'LIVE':
                             try: 
-                                broker_ops.place_order(
+                                exit_id = broker_ops.place_order(
                                     kite, 
                                     symbol=t['symbol'], 
                                     exchange=t['exchange'], 
@@ -365,11 +426,13 @@ def manage_trade_position(kite, trade_id, action, lot_size, lots_count):
                                     product=kite.PRODUCT_MIS,
                                     tag="RD_EXIT_PART"
                                 )
+                                track_order(t, exit_id, "EXIT", qty_delta)
                             except Exception as e: 
                                 log_event(t, f"Broker Fail (Exit): {e}")
                         updated = True
                     else: 
                         return False 
+                trade_index.touch(t)
                 break
                 
         if updated: 
@@ -388,7 +451,7 @@ def promote_to_live(kite, trade_id):
             if t['id'] == int(trade_id) and t['mode'] == "PAPER":
                 try:
                     # 1. Place Buy Order
-                    broker_ops.place_order(
+                    entry_id = broker_ops.place_order(
                         kite, 
                         symbol=t['symbol'], 
                         exchange=t['exchange'], 
@@ -398,6 +461,7 @@ def promote_to_live(kite, trade_id):
                         product=kite.PRODUCT_MIS,
                         tag="RD_PROMOTE"
                     )
+                    track_order(t, entry_id, "ENTRY", t['quantity'])
                     
                     # 2. Place SL Order
                     try:
@@ -407,12 +471,13 @@ def promote_to_live(kite, trade_id):
                             exchange=t['exchange'], 
                             transaction_type=kite.TRANSACTION_TYPE_SELL, 
                             quantity=t['quantity'], 
-                            order_type=kite.ORDER_TYPE_SL_M, 
+                            order_type=kite.ORDER_TYPE_SLM, 
                             product=kite.PRODUCT_MIS, 
                             trigger_price=t['sl'],
                             tag="RD_SL"
                         )
                         t['sl_order_id'] = sl_id
+                        track_order(t, sl_id, "SL", t['quantity'])
                     except: 
                         log_event(t, "Promote: Broker SL Failed")
                         
@@ -422,6 +487,7 @@ def promote_to_live(kite, trade_id):
                     # Notify Promotion
                     telegram_bot.notify_trade_event(t, "UPDATE", "Promoted to LIVE")
                     
+                    trade_index.touch(t)
                     save_trades(trades)
                     return True
                 except: 
@@ -447,9 +513,11 @@ def close_trade_manual(kite, trade_id):
                 exit_p = t.get('current_ltp', 0)
                 
                 # Fetch fresh LTP if possible
-                try: 
-                    exit_p = smart_trader.get_ltp(kite, t['symbol'])
-                except: pass
+                # (LIVE: the last streamed LTP is enough, the exit fill corrects the P/L)
+                if t['mode'] != "LIVE" or not exit_p:
+                    try: 
+                        exit_p = smart_trader.get_ltp(kite, t['symbol'])
+                    except: pass
                 
                 # --- NEW: Handle Pending Cancellations ---
                 # If closing a PENDING order, it means we canceled it. 
@@ -461,18 +529,21 @@ def close_trade_manual(kite, trade_id):
                 # Handle Live Execution
                 if t['mode'] == "LIVE" and t['status'] != "PENDING":
                     broker_ops.manage_broker_sl(kite, t, cancel_completely=True)
-                    try: 
-                        broker_ops.place_order(
-                            kite, 
-                            symbol=t['symbol'], 
-                            exchange=t['exchange'], 
-                            transaction_type=kite.TRANSACTION_TYPE_SELL, 
-                            quantity=t['quantity'], 
-                            order_type=kite.ORDER_TYPE_MARKET, 
-                            product=kite.PRODUCT_MIS,
-                            tag="RD_MANUAL_EXIT"
-                        )
-                    except: pass
+                    # Already flat at the broker if the SL filled
+                    if not t.get('sl_filled'):
+                        try: 
+                            exit_id = broker_ops.place_order(
+                                kite, 
+                                symbol=t['symbol'], 
+                                exchange=t['exchange'], 
+                                transaction_type=kite.TRANSACTION_TYPE_SELL, 
+                                quantity=t['quantity'], 
+                                order_type=kite.ORDER_TYPE_MARKET, 
+                                product=kite.PRODUCT_MIS,
+                                tag="RD_MANUAL_EXIT"
+                            )
+                            track_order(t, exit_id, "EXIT", t['quantity'])
+                        except: pass
                 
                 broker_ops.move_to_history(t, exit_reason, exit_p)
             else:
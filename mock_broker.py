@@ -18,9 +18,34 @@ SIM_CONFIG = {
     "active": False,
     "volatility": 0.05,
     "speed": 1.0,
-    "trend": "SIDEWAYS"
+    "trend": "SIDEWAYS",
+    "order_latency": 0.0  # seconds added to every order call (benchmarks)
 }
 
+# --- Order Book (place / modify / cancel) ---
+MOCK_ORDERS = {}
+_orders_lock = threading.Lock()
+ORDER_LISTENERS = []   # order update callbacks (stand-in for KiteTicker.on_order_update)
+
+def _emit_order_update(order):
+    for callback in list(ORDER_LISTENERS):
+        try: callback(dict(order))
+        except Exception as e: print(f"⚠️ [MOCK] Order listener error: {e}", flush=True)
+
+def _match_orders():
+    """Fills resting SL / SL-M sell orders whose trigger was crossed (at the current LTP)."""
+    filled = []
+    with _orders_lock:
+        for order in MOCK_ORDERS.values():
+            if order["status"] != "TRIGGER PENDING" or order["transaction_type"] != "SELL": continue
+            ltp = MOCK_MARKET_DATA.get(f"{order['exchange']}:{order['tradingsymbol']}")
+            if ltp is not None and ltp <= order["trigger_price"]:
+                order.update({"status": "COMPLETE", "filled_quantity": order["quantity"], "average_price": ltp})
+                filled.append(dict(order))
+    for order in filled:
+        print(f"🎯 [MOCK] SL Filled {order['order_id']} {order['tradingsymbol']} @ {order['average_price']}", flush=True)
+        _emit_order_update(order)
+
 # --- UPDATED: EXPIRY LOGIC (0DTE Daily) ---
 def get_mock_expiry():
     """
@@ -87,6 +112,7 @@ def _market_heartbeat():
                                 
                             MOCK_MARKET_DATA[sym] = calculate_option_price(spot, strike, type_)
                     except: pass
+        _match_orders()
         time.sleep(SIM_CONFIG["speed"])
 
 t = threading.Thread(target=_market_heartbeat, daemon=True)
@@ -94,6 +120,21 @@ t.start()
 
 # --- Mock Kite Class ---
 class MockKiteConnect:
+    # Constants used by the app (same values as kiteconnect.KiteConnect)
+    VARIETY_REGULAR = "regular"
+    TRANSACTION_TYPE_BUY = "BUY"
+    TRANSACTION_TYPE_SELL = "SELL"
+    ORDER_TYPE_MARKET = "MARKET"
+    ORDER_TYPE_LIMIT = "LIMIT"
+    ORDER_TYPE_SL = "SL"
+    ORDER_TYPE_SLM = "SL-M"
+    PRODUCT_MIS = "MIS"
+    PRODUCT_NRML = "NRML"
+    EXCHANGE_NSE = "NSE"
+    EXCHANGE_NFO = "NFO"
+    EXCHANGE_BSE = "BSE"
+    EXCHANGE_BFO = "BFO"
+
     def __init__(self, api_key=None, **kwargs):
         print(f"⚠️ [MOCK BROKER] Initialized. Expiry Set To: {CURRENT_EXPIRY}", flush=True)
         self.mock_instruments = self._generate_instruments()
@@ -157,8 +198,68 @@ class MockKiteConnect:
 
     def ltp(self, instruments): return self.quote(instruments)
 
+    def _order_delay(self):
+        if SIM_CONFIG["order_latency"]: time.sleep(SIM_CONFIG["order_latency"])
+
     def place_order(self, **kwargs): 
+        self._order_delay()
         print(f"✅ [MOCK] Order: {kwargs.get('transaction_type')} {kwargs.get('quantity')} {kwargs.get('tradingsymbol')}", flush=True)
-        return f"ORD_{random.randint(10000,99999)}"
+        order_id = f"ORD_{random.randint(10000,99999)}"
+        
+        # Market orders fill instantly at LTP, SL / Limit orders rest in the book
+        is_market = kwargs.get('order_type', self.ORDER_TYPE_MARKET) == self.ORDER_TYPE_MARKET
+        ltp = MOCK_MARKET_DATA.get(f"{kwargs.get('exchange')}:{kwargs.get('tradingsymbol')}", 100.0)
+        with _orders_lock:
+            MOCK_ORDERS[order_id] = {
+                "order_id": order_id,
+                "status": "COMPLETE" if is_market else ("TRIGGER PENDING" if kwargs.get('trigger_price') else "OPEN"),
+                "tradingsymbol": kwargs.get('tradingsymbol'),
+                "exchange": kwargs.get('exchange'),
+                "transaction_type": kwargs.get('transaction_type'),
+                "order_type": kwargs.get('order_type'),
+                "quantity": kwargs.get('quantity'),
+                "filled_quantity": kwargs.get('quantity') if is_market else 0,
+                "price": kwargs.get('price', 0),
+                "trigger_price": kwargs.get('trigger_price', 0),
+                "average_price": ltp if is_market else 0,
+                "tag": kwargs.get('tag')
+            }
+            order = dict(MOCK_ORDERS[order_id])
+        _emit_order_update(order)
+        return order_id
+
+    def modify_order(self, variety=None, order_id=None, **kwargs):
+        self._order_delay()
+        with _orders_lock:
+            order = MOCK_ORDERS.get(order_id)
+            if not order or order["status"] in ["COMPLETE", "CANCELLED", "REJECTED"]:
+                raise Exception(f"Order {order_id} cannot be modified")
+            for k in ["quantity", "price", "trigger_price", "order_type"]:
+                if kwargs.get(k) is not None: order[k] = kwargs[k]
+            order = dict(order)
+        _emit_order_update(order)
+        print(f"✏️ [MOCK] Modify {order_id}: {kwargs}", flush=True)
+        return order_id
+
+    def cancel_order(self, variety=None, order_id=None, **kwargs):
+        self._order_delay()
+        with _orders_lock:
+            order = MOCK_ORDERS.get(order_id)
+            if order and order["status"] in ["COMPLETE", "REJECTED"]:
+                raise Exception(f"Order {order_id} cannot be cancelled as it is {order['status']}")
+            if order:
+                order["status"] = "CANCELLED"
+                order = dict(order)
+        if order: _emit_order_update(order)
+        print(f"🚫 [MOCK] Cancel {order_id}", flush=True)
+        return order_id
+
+    def orders(self):
+        with _orders_lock:
+            return [dict(o) for o in MOCK_ORDERS.values()]
+
+    def subscribe_order_updates(self, callback):
+        """Mock only: pushes every order change to 'callback' (like KiteTicker order updates)."""
+        ORDER_LISTENERS.append(callback)
 
     def historical_data(self, *args, **kwargs): return []
@@ -0,0 +1,138 @@
+# mock_telegram.py
+import json
+import time
+import threading
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Configuration
+FAKE_CONFIG = {
+    "latency": 0.05,          # seconds added to every call
+    "slow_chats": {},         # chat_id -> extra latency (seconds)
+    "enforce_limits": True,   # answer 429 like the real API
+    "down": False,            # answer 502 to everything (outage / retry tests)
+    "chat_rate": 1.0,         # msgs / sec allowed per chat
+    "chat_burst": 3,
+    "global_rate": 30
+}
+
+# --- Recorded State ---
+STATE = {
+    "next_id": 1,
+    "messages": {},   # chat_id -> [{'message_id', 'text', 'reply_to'}]
+    "deleted": [],
+    "rejected": 0
+}
+_lock = threading.Lock()
+_chat_allowance = {}   # chat_id -> (tokens, last_ts)
+_global_allowance = [None, None]
+
+def reset_state():
+    with _lock:
+        STATE["next_id"] = 1
+        STATE["messages"] = {}
+        STATE["deleted"] = []
+        STATE["rejected"] = 0
+        _chat_allowance.clear()
+        _global_allowance[0] = None
+
+def _take(tokens, last, rate, burst, now):
+    if tokens is None:
+        tokens, last = burst, now
+    tokens = min(burst, tokens + (now - last) * rate)
+    if tokens >= 1:
+        return True, tokens - 1, now, 0
+    return False, tokens, now, (1 - tokens) / rate
+
+def _check_limits(chat_id):
+    """Returns retry_after seconds (0 if allowed)."""
+    now = time.monotonic()
+    with _lock:
+        ok, g_tokens, g_last, g_wait = _take(_global_allowance[0], _global_allowance[1], FAKE_CONFIG["global_rate"], FAKE_CONFIG["global_rate"], now)
+        c_tokens, c_last = _chat_allowance.get(chat_id, (None, None))
+        c_ok, c_tokens, c_last, c_wait = _take(c_tokens, c_last, FAKE_CONFIG["chat_rate"], FAKE_CONFIG["chat_burst"], now)
+        if ok and c_ok:
+            _global_allowance[0], _global_allowance[1] = g_tokens, g_last
+            _chat_allowance[chat_id] = (c_tokens, c_last)
+            return 0
+        STATE["rejected"] += 1
+        return max(1, int(max(g_wait, c_wait) + 0.999))
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body):
+        raw = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try: payload = json.loads(self.rfile.read(length) or b"{}")
+        except: payload = {}
+
+        # Path: /bot<token>/<method>
+        method = self.path.rstrip("/").split("/")[-1]
+        chat_id = str(payload.get("chat_id", ""))
+
+        delay = FAKE_CONFIG["latency"] + FAKE_CONFIG["slow_chats"].get(chat_id, 0)
+        if delay: time.sleep(delay)
+
+        if FAKE_CONFIG["down"]:
+            with _lock: STATE["rejected"] += 1
+            return self._reply(502, {"ok": False, "error_code": 502, "description": "Bad Gateway"})
+
+        if FAKE_CONFIG["enforce_limits"] and method == "sendMessage":
+            retry_after = _check_limits(chat_id)
+            if retry_after:
+                return self._reply(429, {"ok": False, "error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": retry_after}})
+
+        if method == "sendMessage":
+            with _lock:
+                msg_id = STATE["next_id"]
+                STATE["next_id"] += 1
+                STATE["messages"].setdefault(chat_id, []).append({
+                    "message_id": msg_id,
+                    "text": payload.get("text"),
+                    "reply_to": payload.get("reply_to_message_id")
+                })
+            return self._reply(200, {"ok": True, "result": {"message_id": msg_id, "chat": {"id": chat_id}}})
+
+        if method == "deleteMessage":
+            with _lock: STATE["deleted"].append(payload)
+            return self._reply(200, {"ok": True, "result": True})
+
+        return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+
+def start_server(host="127.0.0.1", port=0):
+    """
+    Starts the fake Bot API in a daemon thread.
+    Returns (server, base_url) - use base_url as TELEGRAM_API_URL.
+    """
+    server = ThreadingHTTPServer((host, port), FakeTelegramHandler)
+    server.daemon_threads = True
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=FAKE_CONFIG["latency"])
+    parser.add_argument("--no-limits", action="store_true")
+    args = parser.parse_args()
+
+    FAKE_CONFIG["latency"] = args.latency
+    FAKE_CONFIG["enforce_limits"] = not args.no_limits
+    server, url = start_server(port=args.port)
+    print(f"🤖 [MOCK TELEGRAM] Listening on {url} (set TELEGRAM_API_URL={url})", flush=True)
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
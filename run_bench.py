@@ -0,0 +1,241 @@
+# run_bench.py
+"""
+Local benchmarks for the performance-sensitive subsystems.
+Usage: python run_bench.py <benchmark> [options]
+"""
+import time
+import argparse
+
+def _report(title, rows):
+    print(f"\n📊 {title}")
+    for label, value in rows:
+        print(f"   {label:<28} {value}")
+
+# --- TELEGRAM SENDER POOL ---
+def bench_telegram(args):
+    import mock_telegram
+    from managers.telegram_sender import TelegramSenderPool, TelegramRetryAfter, call_api
+
+    mock_telegram.FAKE_CONFIG.update({
+        "latency": args.latency,
+        "chat_rate": args.chat_rate,
+        "chat_burst": 3,
+        "global_rate": 30,
+        "slow_chats": {"chat_0": args.slow_latency}
+    })
+    server, base_url = mock_telegram.start_server()
+    url = f"{base_url}/botTEST/sendMessage"
+    chats = [f"chat_{i}" for i in range(args.chats)]
+    total = args.chats * args.messages
+
+    def make_tasks():
+        return [{"chat_id": c, "text": f"{c}:{n}"} for n in range(args.messages) for c in chats]
+
+    def check_order():
+        ok = True
+        for c in chats:
+            seq = [int(m["text"].split(":")[1]) for m in mock_telegram.STATE["messages"].get(c, [])]
+            ok = ok and seq == sorted(seq)
+        return ok
+
+    # 1. Legacy: single worker, one message at a time, failures dropped
+    mock_telegram.reset_state()
+    start = time.perf_counter()
+    dropped = 0
+    for task in make_tasks():
+        try:
+            if not call_api(url, {"chat_id": task["chat_id"], "text": task["text"]}): dropped += 1
+        except TelegramRetryAfter:
+            dropped += 1
+    legacy = time.perf_counter() - start
+    _report("Telegram: legacy single worker", [
+        ("Messages", total),
+        ("Wall time", f"{legacy:.2f}s"),
+        ("Throughput", f"{total / legacy:.1f} msg/s"),
+        ("Dropped (429)", dropped),
+    ])
+
+    # 2. Sender pool
+    mock_telegram.reset_state()
+    pool = TelegramSenderPool(
+        lambda task: call_api(url, {"chat_id": task["chat_id"], "text": task["text"]}),
+        workers=args.workers, chat_rate=args.chat_rate, chat_burst=3
+    )
+    start = time.perf_counter()
+    for task in make_tasks():
+        pool.submit(task)
+    pool.join()
+    pooled = time.perf_counter() - start
+    delivered = sum(len(v) for v in mock_telegram.STATE["messages"].values())
+    _report("Telegram: sender pool", [
+        ("Messages", total),
+        ("Delivered", delivered),
+        ("Wall time", f"{pooled:.2f}s"),
+        ("Throughput", f"{total / pooled:.1f} msg/s"),
+        ("429 answered by server", mock_telegram.STATE["rejected"]),
+        ("Per-chat order kept", check_order()),
+    ])
+    server.shutdown()
+
+# --- PANIC EXIT ---
+def bench_panic(args):
+    import mock_broker
+    from managers.broker_ops import execute_panic_orders
+    from managers.rate_limit import TokenBucket
+
+    kite = mock_broker.MockKiteConnect()
+    mock_broker.SIM_CONFIG["order_latency"] = args.latency
+    strikes = list(range(21000, 23000, 50))[:args.positions]
+
+    def make_trades():
+        trades = []
+        for strike in strikes:
+            sym = f"NIFTY{mock_broker.CURRENT_EXPIRY.replace('-','')}CE{strike}"
+            sl_id = kite.place_order(variety=kite.VARIETY_REGULAR, exchange="NFO", tradingsymbol=sym, transaction_type=kite.TRANSACTION_TYPE_SELL,
+                                     quantity=65, order_type=kite.ORDER_TYPE_SLM, product=kite.PRODUCT_MIS, trigger_price=50)
+            trades.append({"id": strike, "symbol": sym, "exchange": "NFO", "quantity": 65, "mode": "LIVE", "status": "OPEN", "sl_order_id": sl_id, "logs": []})
+        return trades
+
+    # 1. Legacy: sequential cancel + sell with a 0.2s pause after every exit
+    trades = make_trades()
+    start = time.perf_counter()
+    for t in trades:
+        try: kite.cancel_order(variety=kite.VARIETY_REGULAR, order_id=t['sl_order_id'])
+        except Exception: pass
+        kite.place_order(variety=kite.VARIETY_REGULAR, exchange="NFO", tradingsymbol=t['symbol'], transaction_type=kite.TRANSACTION_TYPE_SELL,
+                         quantity=t['quantity'], order_type=kite.ORDER_TYPE_MARKET, product=kite.PRODUCT_MIS, tag="PANIC_EXIT")
+        time.sleep(0.2)
+    legacy = time.perf_counter() - start
+    _report("Panic exit: legacy sequential", [
+        ("Positions", len(trades)),
+        ("Orders", len(trades) * 2),
+        ("Wall time", f"{legacy:.2f}s"),
+    ])
+
+    # 2. Parallel executor under the order rate limit
+    trades = make_trades()
+    bucket = TokenBucket(rate=args.rate, capacity=args.rate)
+    report = execute_panic_orders(kite, trades, workers=args.workers, bucket=bucket)
+    cancelled = {o["order_id"] for o in kite.orders() if o["status"] == "CANCELLED"}
+    _report("Panic exit: parallel executor", [
+        ("Positions", len(trades)),
+        ("Orders", report["orders"]),
+        ("Failed", len(report["failed"])),
+        ("Wall time", f"{report['wall_ms'] / 1000:.2f}s"),
+        ("Avg / max order latency", f"{report['avg_latency_ms']}ms / {report['max_latency_ms']}ms"),
+        ("All SLs cancelled", all(t["sl_order_id"] is None for t in trades) and len(cancelled) >= len(trades)),
+        ("Speed-up", f"{legacy / (report['wall_ms'] / 1000):.1f}x"),
+    ])
+
+# --- SQLITE STORAGE PROFILE ---
+def bench_sqlite(args):
+    import os
+    import json
+    import tempfile
+    import threading
+    import config
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import OperationalError
+    from database import db
+
+    trade = {"symbol": "NIFTY26OCT22000CE", "exchange": "NFO", "mode": "PAPER", "status": "OPEN", "entry_price": 100.0,
+             "sl": 90.0, "targets": [110, 120, 130], "quantity": 65, "logs": ["[10:00:00] Trade Added"] * 20}
+
+    def run(label, pragmas):
+        config.SQLITE_PRAGMAS = pragmas
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, pool_size=args.readers + 2)
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            for i in range(args.trades):
+                conn.execute(text("INSERT INTO active_trade (id, symbol, mode, status, data) VALUES (:i, 'NIFTY', 'PAPER', 'OPEN', :d)"), {"i": i, "d": json.dumps(dict(trade, id=i))})
+            for i in range(args.history):
+                conn.execute(text("INSERT INTO trade_history (id, data) VALUES (:i, :d)"), {"i": i, "d": json.dumps(dict(trade, id=i, pnl=10.0))})
+
+        stop = threading.Event()
+        write_lat, reads, errors = [], [0], [0]
+
+        def writer():
+            # Risk loop: one transaction per pass touching every active trade + a journal row
+            n = 0
+            while not stop.is_set():
+                n += 1
+                start = time.perf_counter()
+                try:
+                    with engine.begin() as conn:
+                        for i in range(args.trades):
+                            conn.execute(text("UPDATE active_trade SET data = :d WHERE id = :i"), {"i": i, "d": json.dumps(dict(trade, id=i, current_ltp=n))})
+                        conn.execute(text("INSERT INTO trade_event (trade_id, event, data) VALUES (0, 'updated', '{}')"))
+                    write_lat.append((time.perf_counter() - start) * 1000)
+                except OperationalError:
+                    errors[0] += 1
+
+        def reader():
+            # API threads: positions + history pages
+            while not stop.is_set():
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(text("SELECT data FROM active_trade")).fetchall()
+                        conn.execute(text("SELECT data FROM trade_history ORDER BY id DESC LIMIT 200")).fetchall()
+                    reads[0] += 1
+                except OperationalError:
+                    errors[0] += 1
+
+        threads = [threading.Thread(target=writer, daemon=True)] + [threading.Thread(target=reader, daemon=True) for _ in range(args.readers)]
+        for t in threads: t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads: t.join()
+        with engine.connect() as conn:
+            mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+        engine.dispose()
+
+        write_lat.sort()
+        p99 = write_lat[int(len(write_lat) * 0.99)] if write_lat else 0
+        _report(f"SQLite: {label} ({mode})", [
+            ("Writer passes", f"{len(write_lat)} ({len(write_lat) / args.duration:.1f}/s)"),
+            ("Write latency p50 / p99", f"{write_lat[len(write_lat) // 2] if write_lat else 0:.1f}ms / {p99:.1f}ms"),
+            ("Reads", f"{reads[0]} ({reads[0] / args.duration:.1f}/s)"),
+            ("Lock errors", errors[0]),
+        ])
+        return len(write_lat), reads[0]
+
+    legacy = run("stock rollback journal", {})
+    tuned = run("tuned profile", config.SQLITE_PROFILE)
+    _report("SQLite: tuned vs stock", [
+        ("Write throughput", f"{tuned[0] / max(legacy[0], 1):.1f}x"),
+        ("Read throughput", f"{tuned[1] / max(legacy[1], 1):.1f}x"),
+    ])
+
+BENCHMARKS = {
+    "telegram": bench_telegram,
+    "panic": bench_panic,
+    "sqlite": bench_sqlite,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RD Algo local benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("telegram", help="Sender pool vs single worker against mock_telegram")
+    p.add_argument("--chats", type=int, default=5)
+    p.add_argument("--messages", type=int, default=10)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--latency", type=float, default=0.05)
+    p.add_argument("--slow-latency", type=float, default=0.5, help="Extra latency for chat_0")
+    p.add_argument("--chat-rate", type=float, default=5.0)
+
+    p = sub.add_parser("panic", help="Parallel panic exit vs sequential against a latency-injecting mock broker")
+    p.add_argument("--positions", type=int, default=20)
+    p.add_argument("--latency", type=float, default=0.15, help="Seconds per order call")
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--rate", type=float, default=10, help="Orders per second")
+
+    p = sub.add_parser("sqlite", help="Risk-loop writes while API threads read: tuned SQLite profile vs stock")
+    p.add_argument("--trades", type=int, default=20, help="Active trades rewritten per writer pass")
+    p.add_argument("--history", type=int, default=2000)
+    p.add_argument("--readers", type=int, default=8, help="Concurrent API reader threads")
+    p.add_argument("--duration", type=float, default=5.0, help="Seconds per profile")
+
+    args = parser.parse_args()
+    BENCHMARKS[args.bench](args)
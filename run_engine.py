@@ -0,0 +1,56 @@
+# run_engine.py
+"""
+Runs the risk engine (monitor loop, login, scheduler, Telegram dispatcher, order updates) in its own
+process, so dashboard traffic never shares a GIL with SL checks. Start the web tier with
+ENGINE_MODE=external: its workers leave these services to this process and reach it over ENGINE_SOCKET
+(session flags / commands / loop latency).
+Usage: ENGINE_MODE=external python run_engine.py [--mock] [--stats-every 60]
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RD Algo risk engine process")
+    parser.add_argument("--mock", action="store_true", help="Use the mock broker (like run_demo.py)")
+    parser.add_argument("--stats-every", type=float, default=0, help="Print loop latency every N seconds (0: off)")
+    args = parser.parse_args()
+
+    os.environ["ENGINE_MODE"] = "external"   # main must not campaign on import
+    if args.mock:
+        import kiteconnect
+        from mock_broker import MockKiteConnect
+        kiteconnect.KiteConnect = MockKiteConnect
+
+    import config
+    import main
+    from managers.shared_state import leader
+    from managers.engine_ipc import EngineServer, loop_stats
+
+    server = EngineServer(config.ENGINE_SOCKET, {
+        "ping": lambda: os.getpid(),
+        "snapshot": main.engine_snapshot,
+        "command": main.queue_leader_command,
+    })
+
+    def on_elected():
+        server.start(main.app)
+        main.start_leader_services()
+
+    def shutdown(*_):
+        server.stop()
+        sys.exit(0)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    print(f"⚙️ Risk engine process {os.getpid()} waiting for the leader lock...")
+    leader.campaign(on_elected)
+    try:
+        while True:
+            time.sleep(args.stats_every or 3600)
+            if args.stats_every and leader.is_leader:
+                s = loop_stats.snapshot()
+                print(f"⏱️ Risk loop: {s['iterations']} iterations, p50 {s['p50_ms']}ms, p99 {s['p99_ms']}ms, max {s['max_ms']}ms")
+    except KeyboardInterrupt:
+        shutdown()
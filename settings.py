@@ -50,7 +50,12 @@ def get_defaults():
             
             # 4. ZeroToHero Channel (New/Active/Update Only + Custom Name)
             "z2h_channel_id": "",
-            "z2h_channel_name": "Zero To Hero" # Default Name
+            "z2h_channel_name": "Zero To Hero", # Default Name
+
+            # 5. HIGH_MADE Coalescing: at most one alert per trade per window,
+            #    and only if the high moved by at least 'high_made_min_step'
+            "high_made_window": 60,
+            "high_made_min_step": 0
         }
     }
 
@@ -1,7 +1,13 @@
+import os
 import pandas as pd
+import config
 from datetime import datetime, timedelta
 import pytz
 import re
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from managers.rate_limit import TokenBucket
 
 # Global IST Timezone
 IST = pytz.timezone('Asia/Kolkata')
@@ -19,59 +25,111 @@ SYMBOL_ALIASES = {
     "BANKEX": "BANKEX"
 }
 
-def fetch_instruments(kite):
+# Downloaded list shared by the gunicorn workers (and reused after a same-day restart)
+INSTRUMENT_CACHE_FILE = os.path.join(config.RUN_DIR, "instruments.pkl")
+_loaded_cache_mtime = None
+
+def _index_instruments(df):
+    """Optimizes dates and builds the fast lookup map from a raw instrument list."""
+    global instrument_dump, symbol_map
+    
+    # Optimize Dates
+    if 'expiry' in df.columns:
+        df['expiry_str'] = pd.to_datetime(df['expiry'], errors='coerce').dt.strftime('%Y-%m-%d')
+        df['expiry_date'] = pd.to_datetime(df['expiry'], errors='coerce').dt.date
+    
+    # --- CRITICAL FIX: Handle Duplicates for Hash Map ---
+    print("⚡ Building Fast Lookup Cache...")
+    
+    # Create a copy to sort and deduplicate without affecting the main search dump
+    temp_df = df.copy()
+    
+    # Prioritize exchanges: NFO > MCX > CDS > NSE > BSE
+    # This ensures 'RELIANCE' maps to NSE, not BSE
+    exchange_priority = {'NFO': 0, 'MCX': 1, 'CDS': 2, 'NSE': 3, 'BSE': 4, 'BFO': 5}
+    temp_df['priority'] = temp_df['exchange'].map(exchange_priority).fillna(99)
+    
+    # Sort by priority so the "best" exchange comes first
+    temp_df.sort_values('priority', inplace=True)
+    
+    # Drop duplicates on tradingsymbol, keeping the first (highest priority)
+    unique_symbols = temp_df.drop_duplicates(subset=['tradingsymbol'])
+    
+    # NOW it is safe to set index
+    symbol_map = unique_symbols.set_index('tradingsymbol').to_dict('index')
+    instrument_dump = df
+
+def _cache_mtime():
+    try:
+        return os.path.getmtime(INSTRUMENT_CACHE_FILE)
+    except OSError:
+        return None
+
+def load_cached_instruments():
+    """
+    Loads the list another worker (or an earlier run today) downloaded, if it is newer than
+    the one in memory. Returns True if a list was loaded.
+    """
+    global _loaded_cache_mtime
+    mtime = _cache_mtime()
+    if mtime is None or mtime == _loaded_cache_mtime:
+        return False
+    if datetime.fromtimestamp(mtime, IST).date() != datetime.now(IST).date():
+        return False
+    try:
+        _index_instruments(pd.read_pickle(INSTRUMENT_CACHE_FILE))
+        _loaded_cache_mtime = mtime
+        print(f"✅ Instruments Loaded From Cache. Count: {len(instrument_dump)}")
+        return True
+    except Exception as e:
+        print(f"⚠️ Instrument Cache Unreadable: {e}")
+        return False
+
+def fetch_instruments(kite, force=False):
     """
     Downloads the master instrument list, optimizes dates, and builds a fast lookup map.
     Prioritizes specific exchanges (NFO > MCX > NSE) to handle duplicate symbols.
+    force=True re-downloads (daily refresh: new expiries / strikes). Returns True if loaded.
+    Without force, today's cached download (INSTRUMENT_CACHE_FILE) is used when present.
     """
-    global instrument_dump, symbol_map
+    global instrument_dump, symbol_map, _loaded_cache_mtime
     
     # If already loaded and map exists, skip to save bandwidth
-    if instrument_dump is not None and not instrument_dump.empty and symbol_map: 
-        return
+    if not force and instrument_dump is not None and not instrument_dump.empty and symbol_map: 
+        return True
+    if not force and load_cached_instruments():
+        return True
 
     print("📥 Downloading Instrument List...")
     try:
         instruments = kite.instruments()
         if not instruments:
             print("⚠️ Warning: Kite returned empty instrument list.")
-            return
+            return False
 
-        instrument_dump = pd.DataFrame(instruments)
-        
-        # Optimize Dates
-        if 'expiry' in instrument_dump.columns:
-            instrument_dump['expiry_str'] = pd.to_datetime(instrument_dump['expiry'], errors='coerce').dt.strftime('%Y-%m-%d')
-            instrument_dump['expiry_date'] = pd.to_datetime(instrument_dump['expiry'], errors='coerce').dt.date
-        
-        # --- CRITICAL FIX: Handle Duplicates for Hash Map ---
-        print("⚡ Building Fast Lookup Cache...")
-        
-        # Create a copy to sort and deduplicate without affecting the main search dump
-        temp_df = instrument_dump.copy()
-        
-        # Prioritize exchanges: NFO > MCX > CDS > NSE > BSE
-        # This ensures 'RELIANCE' maps to NSE, not BSE
-        exchange_priority = {'NFO': 0, 'MCX': 1, 'CDS': 2, 'NSE': 3, 'BSE': 4, 'BFO': 5}
-        temp_df['priority'] = temp_df['exchange'].map(exchange_priority).fillna(99)
-        
-        # Sort by priority so the "best" exchange comes first
-        temp_df.sort_values('priority', inplace=True)
-        
-        # Drop duplicates on tradingsymbol, keeping the first (highest priority)
-        unique_symbols = temp_df.drop_duplicates(subset=['tradingsymbol'])
-        
-        # NOW it is safe to set index
-        symbol_map = unique_symbols.set_index('tradingsymbol').to_dict('index')
+        raw = pd.DataFrame(instruments)
+        try:
+            os.makedirs(config.RUN_DIR, exist_ok=True)
+            tmp = f"{INSTRUMENT_CACHE_FILE}.{os.getpid()}"
+            raw.to_pickle(tmp)
+            os.replace(tmp, INSTRUMENT_CACHE_FILE)
+            _loaded_cache_mtime = _cache_mtime()
+        except Exception as e:
+            print(f"⚠️ Instrument Cache Write Failed: {e}")
+        _index_instruments(raw)
         
         print(f"✅ Instruments Downloaded & Indexed. Count: {len(instrument_dump)}")
+        return True
         
     except Exception as e:
         print(f"❌ Failed to fetch instruments: {e}")
         # Do not reset to None here if partial data exists
         if instrument_dump is None:
              instrument_dump = pd.DataFrame()
-        symbol_map = {}
+        # A failed refresh keeps the previous map
+        if not force or not symbol_map:
+            symbol_map = {}
+        return False
 
 def get_exchange_name(symbol):
     """
@@ -121,17 +179,22 @@ def get_ltp(kite, symbol):
         print(f"⚠️ Error fetching LTP for {symbol}: {e}")
         return 0
 
+# Dashboard ticker indices -> Kite quote keys
+MAIN_INDICES = {"NIFTY": "NSE:NIFTY 50", "BANKNIFTY": "NSE:NIFTY BANK", "SENSEX": "BSE:SENSEX"}
+INDEX_QUOTE_KEYS = dict(MAIN_INDICES, FINNIFTY="NSE:NIFTY FIN SERVICE")
+
 def get_indices_ltp(kite):
     try:
-        q = kite.quote(["NSE:NIFTY 50", "NSE:NIFTY BANK", "BSE:SENSEX"])
-        return {
-            "NIFTY": q.get("NSE:NIFTY 50", {}).get('last_price', 0),
-            "BANKNIFTY": q.get("NSE:NIFTY BANK", {}).get('last_price', 0),
-            "SENSEX": q.get("BSE:SENSEX", {}).get('last_price', 0)
-        }
+        q = kite.quote(list(MAIN_INDICES.values()))
+        return {name: q.get(key, {}).get('last_price', 0) for name, key in MAIN_INDICES.items()}
     except:
         return {"NIFTY":0, "BANKNIFTY":0, "SENSEX":0}
 
+def get_quote_key(name):
+    """Spot quote key for an underlying / watchlist name ('NIFTY' -> 'NSE:NIFTY 50', 'RELIANCE' -> 'NSE:RELIANCE')."""
+    clean = get_zerodha_symbol(name)
+    return INDEX_QUOTE_KEYS.get(clean) or f"{get_exchange_name(clean)}:{clean}"
+
 def get_zerodha_symbol(common_name):
     if not common_name: return ""
     cleaned = common_name
@@ -469,16 +532,99 @@ def get_instrument_token(tradingsymbol, exchange):
     
     return None
 
+# --- Chunked Historical Fetch ---
+# Kite caps the date range of a single historical_data call per interval (days).
+HISTORICAL_MAX_DAYS = {
+    "minute": 60,
+    "3minute": 100,
+    "5minute": 100,
+    "10minute": 100,
+    "15minute": 200,
+    "30minute": 200,
+    "60minute": 400,
+    "day": 2000
+}
+HISTORICAL_MAX_WORKERS = 3
+
+# Global bucket shared by every historical call (Kite allows 3 req/sec on this API)
+HISTORICAL_BUCKET = TokenBucket(rate=3, capacity=3)
+
+def split_history_range(from_date, to_date, interval='minute'):
+    """
+    Splits [from_date, to_date] into broker-legal chunks for the given interval.
+    Consecutive chunks share their boundary candle; the stream de-duplicates it.
+    """
+    if not isinstance(from_date, datetime) or not isinstance(to_date, datetime):
+        return [(from_date, to_date)]
+    if from_date >= to_date:
+        return [(from_date, to_date)]
+
+    span = timedelta(days=HISTORICAL_MAX_DAYS.get(interval, 60))
+    chunks = []
+    start = from_date
+    while start < to_date:
+        end = min(start + span, to_date)
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+def _clean_candle(candle):
+    c = candle.copy()
+    if 'date' in c and hasattr(c['date'], 'strftime'):
+        c['date'] = c['date'].strftime('%Y-%m-%d %H:%M:%S')
+    return c
+
+def _fetch_history_chunk(kite, token, from_date, to_date, interval):
+    HISTORICAL_BUCKET.acquire()
+    return kite.historical_data(token, from_date, to_date, interval)
+
+def stream_historical_data(kite, token, from_date, to_date, interval='minute'):
+    """
+    Generator yielding cleaned candles in chronological order.
+    Chunks are fetched concurrently (bounded prefetch window, shared rate limit)
+    but yielded in order, so callers can start simulating on the first chunk.
+    Breaking out of the loop early cancels chunks that have not started yet.
+    Raises on broker errors.
+    """
+    chunks = split_history_range(from_date, to_date, interval)
+    workers = max(1, min(HISTORICAL_MAX_WORKERS, len(chunks)))
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    chunk_iter = iter(chunks)
+    last_date = None
+
+    try:
+        for start, end in islice(chunk_iter, workers):
+            pending.append(executor.submit(_fetch_history_chunk, kite, token, start, end, interval))
+
+        while pending:
+            data = pending.popleft().result() or []
+
+            # Keep the prefetch window full
+            nxt = next(chunk_iter, None)
+            if nxt:
+                pending.append(executor.submit(_fetch_history_chunk, kite, token, nxt[0], nxt[1], interval))
+
+            for candle in data:
+                c = _clean_candle(candle)
+                c_date = c.get('date')
+                # Drop boundary duplicates / out of order candles between chunks
+                if last_date is not None and c_date is not None and c_date <= last_date:
+                    continue
+                last_date = c_date
+                yield c
+    finally:
+        for f in pending:
+            f.cancel()
+        executor.shutdown(wait=False)
+
 def fetch_historical_data(kite, token, from_date, to_date, interval='minute'):
+    """
+    Returns the full candle list for the range (fetched in parallel chunks).
+    Returns [] on any error, matching the legacy behaviour.
+    """
     try:
-        data = kite.historical_data(token, from_date, to_date, interval)
-        clean_data = []
-        for candle in data:
-            c = candle.copy()
-            if 'date' in c and hasattr(c['date'], 'strftime'):
-                c['date'] = c['date'].strftime('%Y-%m-%d %H:%M:%S')
-            clean_data.append(c)
-        return clean_data
+        return list(stream_historical_data(kite, token, from_date, to_date, interval))
     except Exception as e:
         print(f"History Fetch Error: {e}")
         return []
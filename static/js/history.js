@@ -230,7 +230,7 @@ function renderClosedTrades(trades) {
 
 // 2. Fallback function for manual calls or events
 function loadClosedTrades() {
-    $.get('/api/closed_trades', function(trades) {
+    $.get('/api/closed_trades', { date: $('#hist_date').val() }, function(trades) {
         renderClosedTrades(trades);
     });
 }
@@ -5,6 +5,7 @@ function updateData() {
     // A. Prepare Request
     let payload = {
         include_closed: $('#closed').is(':visible'), // Save bandwidth: only fetch closed if tab is open
+        closed_date: $('#hist_date').val(), // ...and only the day being viewed
         ltp_req: null
     };
 